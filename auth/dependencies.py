@@ -1,7 +1,8 @@
 from fastapi import HTTPException, Request
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from fastapi.security import APIKeyHeader, HTTPAuthorizationCredentials, HTTPBearer
 
-from auth.utils import decode_token
+from auth.device_keys import DEVICE_KEY_HEADER, verify_device_key
+from auth.tokens import decode_token
 
 
 class BaseTokenBearer(HTTPBearer):
@@ -11,16 +12,16 @@ class BaseTokenBearer(HTTPBearer):
 
     async def __call__(self, request: Request) -> HTTPAuthorizationCredentials | None:
         auth_scheme_params = await super().__call__(request)
+        if auth_scheme_params is None:  # no credentials and auto_error is off
+            return None
 
-        print(auth_scheme_params.scheme)
         token = auth_scheme_params.credentials
-        print(token)
         # valid_token = self.validate_token(token)
         valid_token = decode_token(token)
         if not valid_token:
             raise HTTPException(status_code=403, detail="Invalid or expired token")
 
-        self.verify_token(token)
+        self.verify_token(valid_token)
 
         return valid_token
 
@@ -46,3 +47,23 @@ class RefreshTokenBearer(BaseTokenBearer):
             raise HTTPException(
                 status_code=403, detail="Please provide a refresh token"
             )
+
+
+class DeviceKeyHeader(APIKeyHeader):
+    """
+    Resolves the device key sent in the X-Device-Key header to the node_id it was
+    issued for. Verified keys are cached, so this rarely touches the database.
+    """
+
+    def __init__(self, auto_error=True):
+        super().__init__(name=DEVICE_KEY_HEADER, auto_error=auto_error)
+
+    async def __call__(self, request: Request) -> str | None:
+        key = await super().__call__(request)
+        if key is None:
+            return None
+
+        node_id = await verify_device_key(key)
+        if node_id is None:
+            raise HTTPException(status_code=403, detail="Invalid or revoked device key")
+        return node_id
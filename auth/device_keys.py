@@ -0,0 +1,106 @@
+import datetime, hashlib, hmac, logging, secrets
+from sqlalchemy import update
+from sqlmodel import select
+
+from cache import MISSING, TTLCache
+from config import (
+    DEVICE_KEY_SECRET,
+    DEVICE_KEY_CACHE_SIZE,
+    DEVICE_KEY_CACHE_TTL_SECONDS,
+    DEVICE_KEY_NEGATIVE_TTL_SECONDS,
+)
+from db import SessionDep, fetch_query
+from .models import DeviceKey
+
+logger = logging.getLogger(__name__)
+
+DEVICE_KEY_HEADER = "X-Device-Key"
+
+# key_id -> (key_hash, node_id) of active keys, or cache.MISSING for unknown and revoked ones
+device_key_cache = TTLCache(
+    maxsize=DEVICE_KEY_CACHE_SIZE, ttl=DEVICE_KEY_CACHE_TTL_SECONDS
+)
+
+ACTIVE_KEY_QUERY = """SELECT k.key_hash, n.node_id
+FROM device_keys k JOIN node n ON n.id = k.node_id
+WHERE k.key_id = $1 AND k.revoked_at IS NULL"""
+
+
+def hash_device_key(secret: str) -> str:
+    # keys are random, a keyed SHA-256 is enough and costs about a microsecond, unlike bcrypt
+    return hmac.new(
+        DEVICE_KEY_SECRET.encode(), secret.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def generate_device_key() -> tuple[str, str, str]:
+    """
+    (key_id, key, key_hash) of a new key. The key is handed to the device once and
+    sent as "<key_id>.<secret>", only the hash of the secret is stored.
+    """
+    key_id = secrets.token_hex(8)
+    secret = secrets.token_urlsafe(32)
+    return key_id, f"{key_id}.{secret}", hash_device_key(secret)
+
+
+async def verify_device_key(key: str) -> str | None:
+    """
+    node_id the key was issued for, or None for malformed, unknown and revoked keys.
+    Only the first lookup of a key_id (per worker and TTL) queries the database.
+    """
+    key_id, _, secret = key.partition(".")
+    if not key_id or not secret:
+        return None
+
+    cached = device_key_cache.get(key_id)
+    if cached is None:
+        rows = await fetch_query(ACTIVE_KEY_QUERY, key_id)
+        if not rows:
+            device_key_cache.set(key_id, MISSING, ttl=DEVICE_KEY_NEGATIVE_TTL_SECONDS)
+            return None
+        cached = (rows[0]["key_hash"], rows[0]["node_id"])
+        device_key_cache.set(key_id, cached)
+    elif cached is MISSING:
+        return None
+
+    key_hash, node_id = cached
+    if not hmac.compare_digest(hash_device_key(secret), key_hash):
+        logger.debug("Wrong secret for device key %s", key_id, extra={"sampled": True})
+        return None
+    return node_id
+
+
+async def issue_device_key(session: SessionDep, node_pk: int) -> tuple[str, str]:
+    """
+    Stores a new key for the node with primary key node_pk and returns (key_id, key).
+    Does not commit.
+    """
+    key_id, key, key_hash = generate_device_key()
+    session.add(DeviceKey(key_id=key_id, key_hash=key_hash, node_id=node_pk))
+    await session.flush()
+    return key_id, key
+
+
+async def list_device_keys(session: SessionDep, node_pk: int) -> list[DeviceKey]:
+    stmt = select(DeviceKey).where(DeviceKey.node_id == node_pk).order_by(DeviceKey.id)
+    return (await session.exec(stmt)).all()
+
+
+async def revoke_device_key(session: SessionDep, node_pk: int, key_id: str) -> bool:
+    """
+    Revokes an active key of the node, False if there is none with that key_id.
+    Other workers keep accepting the key until their cached entry expires.
+    """
+    stmt = (
+        update(DeviceKey)
+        .where(
+            DeviceKey.key_id == key_id,
+            DeviceKey.node_id == node_pk,
+            DeviceKey.revoked_at.is_(None),
+        )
+        .values(revoked_at=datetime.datetime.now(datetime.timezone.utc))
+    )
+    revoked = (await session.execute(stmt)).rowcount > 0
+    await session.commit()
+    device_key_cache.invalidate(key_id)
+    return revoked
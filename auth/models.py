@@ -16,10 +16,37 @@ class User(SQLModel, table=True):
     phone: str | None = None
     is_active: bool = True
     is_verified: bool = False
+    # manages every node, set by hand (see README)
+    is_admin: bool = False
     created_at: datetime.datetime = Field(
-        default=datetime.datetime.now(datetime.timezone.utc),
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc),
+        sa_type=DateTime(timezone=True),
     )
     updated_at: datetime.datetime | None = Field(
         sa_column=Column(DateTime(), onupdate=func.now(datetime.timezone.utc))
     )
     hashed_password: str = Field(exclude=True)
+
+
+class RevokedToken(SQLModel, table=True):
+    __tablename__ = "revoked_tokens"
+    token_id: str = Field(primary_key=True)
+    # rows are only needed until the token would have expired anyway
+    expires_at: datetime.datetime = Field(sa_type=DateTime(timezone=True))
+    revoked_at: datetime.datetime = Field(sa_type=DateTime(timezone=True), index=True)
+
+
+class DeviceKey(SQLModel, table=True):
+    __tablename__ = "device_keys"
+    id: int | None = Field(default=None, primary_key=True)
+    # public part of the key, the secret part is only stored as key_hash
+    key_id: str = Field(index=True, unique=True)
+    key_hash: str
+    node_id: int = Field(foreign_key="node.id", index=True, ondelete="CASCADE")
+    created_at: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc),
+        sa_type=DateTime(timezone=True),
+    )
+    revoked_at: datetime.datetime | None = Field(
+        default=None, sa_type=DateTime(timezone=True)
+    )
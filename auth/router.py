@@ -1,24 +1,40 @@
-from fastapi import APIRouter, HTTPException
-from .schemas import UserCreateModel, UserLoginModel
+from fastapi import APIRouter, Depends, HTTPException
+from .dependencies import AccessTokenBearer
+from .schemas import UserCreateModel, UserLoginModel, LogoutModel
 from .service import AuthService
-from .utils import verify_password, create_access_token
-
+from .tokens import decode_token, revoke_token
+from .utils import (
+    PasswordHasherBusy,
+    verify_and_update_password,
+    create_access_token,
+)
+from db import SessionDep
 
 auth_router = APIRouter()
 auth_service = AuthService()
 
 
+def hasher_busy() -> HTTPException:
+    # bcrypt runs on a bounded thread pool, when too many calls are waiting for it
+    # further signups and logins are turned away instead of queueing without bound
+    return HTTPException(
+        status_code=503,
+        detail="Too many logins in progress, please retry later",
+        headers={"Retry-After": "1"},
+    )
+
+
 @auth_router.post("/signup")
-async def signup_user(user_data: UserCreateModel):
+async def signup_user(user_data: UserCreateModel, session: SessionDep):
     username, email = user_data.username, user_data.email
 
     # check if an existing user shares a similar username or email
 
     username_exists = await auth_service.verify_user_exists(
-        auth_service.get_user_by_username, username
+        auth_service.get_user_by_username, session, username
     )
     email_exists = await auth_service.verify_user_exists(
-        auth_service.get_user_by_username, email
+        auth_service.get_user_by_username, session, email
     )
     email_exists = False
     if username_exists:
@@ -30,33 +46,68 @@ async def signup_user(user_data: UserCreateModel):
         return HTTPException(status_code=403, detail="A user with that email exists.")
 
     else:
-        await auth_service.create_user(user_data)
+        try:
+            await auth_service.create_user(session, user_data)
+        except PasswordHasherBusy:
+            raise hasher_busy()
         return "Registration successful"
 
 
 @auth_router.post("/login")
-async def login_user(form_data: UserLoginModel):
+async def login_user(form_data: UserLoginModel, session: SessionDep):
     email = form_data.email
     password = form_data.password
-    user = await auth_service.get_user_by_email(email)
-
-    if user is not None:
-        uid = str(user.uid)  # ? Create a parser function to handle SQLModel objects
-        is_pwd_valid = verify_password(password, user.hashed_password)
-
-        if is_pwd_valid:
-            access_token = create_access_token(data={"email": user.email, "uid": uid})
-            refresh_token = create_access_token(
-                data={"email": user.email, "uid": uid},
-                expiry=60 * 60 * 24 * 7,
-                refresh=True,
-            )
-
-        return {
-            "message": "login successful",
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-            "user": {"email": user.email, "uid": user.uid},
-        }
-
-    raise HTTPException(status_code=403, detail="Invalid email or password")
+    user = await auth_service.get_user_by_email(session, email)
+    if user is None:
+        raise HTTPException(status_code=403, detail="Invalid email or password")
+
+    try:
+        is_pwd_valid, new_hash = await verify_and_update_password(
+            password, user.hashed_password
+        )
+    except PasswordHasherBusy:
+        raise hasher_busy()
+    if not is_pwd_valid:
+        raise HTTPException(status_code=403, detail="Invalid email or password")
+
+    if new_hash is not None:
+        # stored with an outdated cost factor
+        await auth_service.update_password_hash(session, user, new_hash)
+
+    uid = str(user.uid)  # ? Create a parser function to handle SQLModel objects
+    access_token = create_access_token(data={"email": user.email, "uid": uid})
+    refresh_token = create_access_token(
+        data={"email": user.email, "uid": uid},
+        expiry=60 * 60 * 24 * 7,
+        refresh=True,
+    )
+
+    return {
+        "message": "login successful",
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "user": {"email": user.email, "uid": user.uid},
+    }
+
+
+@auth_router.post("/logout")
+async def logout_user(
+    token_data: dict = Depends(AccessTokenBearer()),
+    form_data: LogoutModel | None = None,
+):
+    """
+    Revokes the access token the request is made with, and the given refresh token of
+    the same user. Other workers reject them after their next revocation list sync.
+    """
+    await revoke_token(token_data)
+
+    if form_data is not None and form_data.refresh_token is not None:
+        refresh_data = decode_token(form_data.refresh_token)
+        if (
+            refresh_data is not None
+            and refresh_data["refresh"]
+            and refresh_data["user"]["uid"] == token_data["user"]["uid"]
+        ):
+            await revoke_token(refresh_data)
+
+    return {"message": "logout successful"}
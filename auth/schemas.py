@@ -11,3 +11,8 @@ class UserCreateModel(BaseModel):
 class UserLoginModel(BaseModel):
     email: EmailStr
     password: str
+
+
+class LogoutModel(BaseModel):
+    # revoked together with the access token the request is made with
+    refresh_token: str | None = None
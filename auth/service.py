@@ -1,42 +1,39 @@
+import logging
 from sqlmodel import select
 from .models import User
 from .utils import hash_password
-from db import get_session
+from db import SessionDep
+
+logger = logging.getLogger(__name__)
 
 
 class AuthService:
-    async def get_user_by_username(self, username: str):
-        session = next(get_session())
-        print("Getting user by username")
+    async def get_user_by_username(self, session: SessionDep, username: str):
         stmt = select(User).where(User.username == username)
-        print(stmt)
-        user = session.exec(stmt).first()
-        print(user)
-        session.close()
+        user = (await session.exec(stmt)).first()
 
         return user
 
-    async def get_user_by_email(self, email: str):
-        session = next(get_session())
+    async def get_user_by_email(self, session: SessionDep, email: str):
         stmt = select(User).where(User.email == email)
-        user = session.exec(stmt).first()
-        session.close()
+        user = (await session.exec(stmt)).first()
         return user
 
-    async def verify_user_exists(self, func, arg) -> bool:
-        print("Verifying user exists", func)
-        # print(type(session))
-        user = await func(arg)
-        print(user)
+    async def verify_user_exists(self, func, *args) -> bool:
+        user = await func(*args)
         return True if user is not None else False
 
-    async def create_user(self, user_data):
+    async def create_user(self, session: SessionDep, user_data):
         data = dict(user_data)
-        data["hashed_password"] = hash_password(data["password"])
+        data["hashed_password"] = await hash_password(data["password"])
         new_user = User(**data)
-        print(new_user)
-        session = next(get_session())
         session.add(new_user)
-        session.commit()
+        await session.commit()
+        logger.info("Created user %s", new_user.username)
 
         return new_user
+
+    async def update_password_hash(self, session: SessionDep, user: User, hashed: str):
+        user.hashed_password = hashed
+        session.add(user)
+        await session.commit()
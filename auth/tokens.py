@@ -0,0 +1,146 @@
+import asyncio, datetime, hashlib, jwt, logging, time
+
+from cache import TTLCache
+from config import (
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    TOKEN_CACHE_SIZE,
+    TOKEN_CACHE_TTL_SECONDS,
+    TOKEN_REVOCATION_SYNC_SECONDS,
+)
+from db import fetch_query, run_query
+
+logger = logging.getLogger(__name__)
+
+# sha256 of a token -> its verified claims, never kept past the token's exp
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# rows committed by other workers may carry a revoked_at slightly before the newest
+# one seen, every sync re-reads this far back
+SYNC_OVERLAP = datetime.timedelta(seconds=60)
+
+
+class RevocationList:
+    """
+    token_ids revoked before their expiry, mirrored from the revoked_tokens table.
+    Lookups are in memory. Revocations made by this worker apply at once, those of
+    other workers once the next sync picks them up.
+    """
+
+    def __init__(self, sync_interval: float):
+        self.sync_interval = sync_interval
+        self._revoked: dict[str, datetime.datetime] = {}  # token_id -> expires_at
+        self._synced_until: datetime.datetime | None = None
+        self._syncer: asyncio.Task | None = None
+
+    def __contains__(self, token_id: str) -> bool:
+        return token_id in self._revoked
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def add(self, token_id: str, expires_at: datetime.datetime):
+        self._revoked[token_id] = expires_at
+
+    async def sync(self):
+        if self._synced_until is None:
+            rows = await fetch_query(
+                "SELECT token_id, expires_at, revoked_at FROM revoked_tokens"
+                " WHERE expires_at > now()"
+            )
+        else:
+            rows = await fetch_query(
+                "SELECT token_id, expires_at, revoked_at FROM revoked_tokens"
+                " WHERE revoked_at > $1",
+                self._synced_until - SYNC_OVERLAP,
+            )
+        for row in rows:
+            self._revoked[row["token_id"]] = row["expires_at"]
+            if self._synced_until is None or row["revoked_at"] > self._synced_until:
+                self._synced_until = row["revoked_at"]
+        if self._synced_until is None:
+            self._synced_until = datetime.datetime.now(datetime.timezone.utc)
+
+        # expired tokens fail verification anyway
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for token_id in [
+            t for t, expires_at in self._revoked.items() if expires_at <= now
+        ]:
+            del self._revoked[token_id]
+
+    def start(self):
+        self._syncer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._syncer is not None:
+            self._syncer.cancel()
+            try:
+                await self._syncer
+            except asyncio.CancelledError:
+                pass
+            self._syncer = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                # keep serving from the last synced state
+                logger.warning("Could not sync the token revocation list: %s", e)
+
+
+revoked_tokens = RevocationList(sync_interval=TOKEN_REVOCATION_SYNC_SECONDS)
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def decode_token(token: str) -> dict | None:
+    """
+    Claims of a valid, unexpired and unrevoked token, otherwise None. Signatures are
+    only verified on the first use of a token (per worker and TTL).
+    """
+    key = token_key(token)
+    claims = token_cache.get(key)
+    if claims is None:
+        try:
+            claims = jwt.decode(
+                jwt=token,
+                key=JWT_SECRET_KEY,
+                algorithms=JWT_ALGORITHM,
+                options={"require": ["exp", "token_id"]},
+            )
+        except jwt.PyJWTError as error:
+            logger.debug("Rejected token: %s", error, extra={"sampled": True})
+            return None
+        ttl = min(TOKEN_CACHE_TTL_SECONDS, claims["exp"] - time.time())
+        token_cache.set(key, claims, ttl=ttl)
+
+    if claims["token_id"] in revoked_tokens:
+        return None
+    return claims
+
+
+async def revoke_token(claims: dict):
+    """
+    Revokes a verified token until it expires, on all workers.
+    """
+    expires_at = datetime.datetime.fromtimestamp(claims["exp"], datetime.timezone.utc)
+    await run_query(
+        "INSERT INTO revoked_tokens (token_id, expires_at, revoked_at)"
+        " VALUES ($1, $2, now()) ON CONFLICT (token_id) DO NOTHING",
+        claims["token_id"],
+        expires_at,
+    )
+    revoked_tokens.add(claims["token_id"], expires_at)
+
+
+async def start_token_revocation_sync():
+    await revoked_tokens.sync()
+    revoked_tokens.start()
+
+
+async def stop_token_revocation_sync():
+    await revoked_tokens.stop()
@@ -1,44 +1,142 @@
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
-import jwt, uuid, os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio, jwt, logging, time, uuid
+
+from config import (
+    JWT_SECRET_KEY,
+    JWT_ALGORITHM,
+    PASSWORD_BCRYPT_ROUNDS,
+    PASSWORD_HASH_THREADS,
+    PASSWORD_HASH_MAX_PENDING,
+)
+from metrics import (
+    password_hash_pending,
+    password_hash_wait,
+    password_hash_duration,
+    password_hash_rejected,
+)
 
 DEFAULT_TOKEN_EXPIRY = 60 * 60 * 24
-JWT_KEY = os.getenv("JWT_SECRET_KEY")  # ? use pydantic config instead
-JWT_ALGO = os.getenv("JWT_ALGORITHM")
-print("JWT_KEY", JWT_KEY)
-print("JWT_ALGORITHM", JWT_ALGO)
-password_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+# hashes with another cost factor still verify, and are reported as needing an update
+password_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=PASSWORD_BCRYPT_ROUNDS
+)
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small thread pool so a hash or verify call (100 ms and more of
+    CPU) never blocks the event loop. At most `threads` calls run at once and at most
+    `max_pending` wait for a thread, further calls raise PasswordHasherBusy.
+    """
+
+    def __init__(self, threads: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="password-hash"
+        )
+        self._slots = asyncio.Semaphore(threads)
+        self.max_pending = max_pending
+        self.pending = 0
 
+    async def _run(self, operation: str, func, *args):
+        if self.pending >= self.max_pending:
+            password_hash_rejected.inc()
+            raise PasswordHasherBusy()
 
-def hash_password(plain_passqord: str) -> str:
-    hash = password_context.hash(plain_passqord)
-    return hash
+        self.pending += 1
+        password_hash_pending.inc()
+        queued = time.perf_counter()
+        waiting = True
+        try:
+            async with self._slots:
+                waiting = False
+                self.pending -= 1
+                password_hash_pending.dec()
+                password_hash_wait.labels(operation).observe(
+                    time.perf_counter() - queued
+                )
 
+                start = time.perf_counter()
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._executor, func, *args)
+                finally:
+                    password_hash_duration.labels(operation).observe(
+                        time.perf_counter() - start
+                    )
+        finally:
+            # cancelled before a slot was free
+            if waiting:
+                self.pending -= 1
+                password_hash_pending.dec()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return password_context.verify(plain_password, hashed_password)
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", password_context.hash, password)
 
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, Optional[str]]:
+        """
+        (valid, new hash). The new hash is set when the stored one was made with an
+        outdated cost factor and should replace it.
+        """
+        return await self._run(
+            "verify", password_context.verify_and_update, password, hashed_password
+        )
 
-def create_access_token(data: dict, expiry: timedelta = None, refresh: bool = False):
-    expiry = datetime.now() + (
-        timedelta(seconds=expiry)
-        if expiry is not None
-        else timedelta(seconds=DEFAULT_TOKEN_EXPIRY)
+    def stop(self):
+        self._executor.shutdown(wait=True)
+
+
+password_hasher: Optional[PasswordHasher] = None
+
+
+async def start_password_hasher():
+    global password_hasher
+    password_hasher = PasswordHasher(
+        threads=PASSWORD_HASH_THREADS, max_pending=PASSWORD_HASH_MAX_PENDING
+    )
+
+
+async def stop_password_hasher():
+    global password_hasher
+    if password_hasher is not None:
+        password_hasher.stop()
+        password_hasher = None
+
+
+async def hash_password(plain_password: str) -> str:
+    return await password_hasher.hash(plain_password)
+
+
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, Optional[str]]:
+    return await password_hasher.verify_and_update(plain_password, hashed_password)
+
+
+def create_access_token(
+    data: dict, expiry: int | None = None, refresh: bool = False
+) -> str:
+    """
+    Signed token valid for expiry seconds, DEFAULT_TOKEN_EXPIRY by default. Its
+    token_id identifies it in the revocation list.
+    """
+    expires = datetime.now(timezone.utc) + timedelta(
+        seconds=expiry if expiry is not None else DEFAULT_TOKEN_EXPIRY
     )
     payload = {"user": data}
-    payload["expires"] = str(expiry)
+    payload["exp"] = expires  # checked by jwt.decode
     payload["refresh"] = refresh
     payload["token_id"] = str(uuid.uuid4())
 
-    token = jwt.encode(payload=payload, key=JWT_KEY, algorithm=JWT_ALGO)
+    token = jwt.encode(payload=payload, key=JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
 
     return token
-
-
-def decode_token(token: str) -> str:
-    try:
-        token_data = jwt.decode(jwt=token, key=JWT_KEY, algorithms=JWT_ALGO)
-        return token_data
-    except jwt.PyJWTError as error:
-        print(error)
-        return None
@@ -0,0 +1,77 @@
+"""
+Reports on-disk size and range query time of a hypertable before and after
+compressing its chunks.
+
+This compresses chunks in place (the same thing the compression policy would do
+later), run it against a copy of production data.
+
+    python -m benchmarks.compression --measurement PM_data --node-id esp8266-12 --older-than-days 1
+"""
+
+import argparse, asyncio, datetime, os, time
+import asyncpg, dotenv
+
+from sensors.measurements import measurements
+
+
+async def table_size(conn, table: str) -> int:
+    return await conn.fetchval(
+        "SELECT hypertable_size($1::text::regclass)", table.lower()
+    )
+
+
+async def time_range_query(conn, table, column, node_id, days, repeat) -> float:
+    query = f"""SELECT time_bucket(INTERVAL '1 hour', time) AS bucket, avg({column})
+    FROM {table}
+    WHERE node_id = $1 AND time >= $2
+    GROUP BY bucket"""
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await conn.fetch(query, node_id, since)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def report(conn, label, table, column, node_id, days, repeat):
+    size = await table_size(conn, table)
+    elapsed = await time_range_query(conn, table, column, node_id, days, repeat)
+    print(
+        f"{label:>7}: {size / 1024 ** 2:,.1f} MiB on disk, "
+        f"{days} day range query {elapsed * 1000:.1f} ms"
+    )
+
+
+async def main(measurement, node_id, older_than, days, repeat):
+    dotenv.load_dotenv(override=True)
+    table = measurements[measurement].table
+    column = measurements[measurement].value_columns[0]
+    conn = await asyncpg.connect(os.getenv("TIMESCALE_DB_CONNECTION"))
+    try:
+        await report(conn, "before", table, column, node_id, days, repeat)
+        compressed = await conn.fetch(
+            """SELECT compress_chunk(chunk, if_not_compressed => TRUE)
+            FROM show_chunks($1::text::regclass, older_than => $2::interval) AS chunk""",
+            table.lower(),
+            datetime.timedelta(days=older_than),
+        )
+        print(f"compressed {len(compressed)} chunks older than {older_than} days")
+        await report(conn, "after", table, column, node_id, days, repeat)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--measurement", default="PM_data", choices=measurements)
+    parser.add_argument("--node-id", required=True)
+    parser.add_argument("--older-than-days", type=float, default=1)
+    parser.add_argument("--days", type=int, default=30, help="range query span")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(
+        main(
+            args.measurement, args.node_id, args.older_than_days, args.days, args.repeat
+        )
+    )
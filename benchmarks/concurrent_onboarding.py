@@ -0,0 +1,94 @@
+"""
+Fires simultaneous /register-node/ calls that share a handful of locations and
+custodians, then checks the database for duplicate metadata rows.
+
+The registrations are made by the admin given with --email and --password.
+
+    python -m benchmarks.concurrent_onboarding --email <admin email> --password <password>
+"""
+
+import argparse, asyncio, os, statistics, sys, time, uuid
+import asyncpg, dotenv, httpx
+
+LOCATIONS = [
+    ("Kenya", "Ruiru", "Kiambu"),
+    ("Kenya", "Mathare", "Nairobi"),
+    ("Kenya", "Langas", "Nakuru"),
+]
+CUSTODIANS = [
+    ("Alice", "alice@example.com", "+1 (123) 456-7890"),
+    ("Bob", "bob@example.com", "+1 (987) 654-3210"),
+]
+
+DUPLICATE_CHECKS = {
+    "sensor_locations": "SELECT country, location FROM sensor_locations GROUP BY 1, 2 HAVING count(*) > 1",
+    "locationtag": "SELECT location_id, location_tag FROM locationtag GROUP BY 1, 2 HAVING count(*) > 1",
+    "custodian": "SELECT name, email, phone FROM custodian GROUP BY 1, 2, 3 HAVING count(*) > 1",
+    "node": "SELECT node_id FROM node GROUP BY 1 HAVING count(*) > 1",
+}
+
+
+async def register(client, api, headers, i, run_id):
+    country, location, city = LOCATIONS[i % len(LOCATIONS)]
+    name, email, phone = CUSTODIANS[i % len(CUSTODIANS)]
+    params = {
+        # every fourth call re-registers an already used node id
+        "node_id": f"onboard-{run_id}-{i - i % 4}",
+        "lat": -1.26,
+        "long": 36.85,
+        "country": country,
+        "location": location,
+        "city": city,
+        "location_tag": "rooftop",
+        "custodian_name": name,
+        "custodian_email": email,
+        "custodian_phone": phone,
+    }
+    start = time.perf_counter()
+    response = await client.get(f"{api}/register-node/", params=params, headers=headers)
+    return response.status_code, time.perf_counter() - start
+
+
+async def main(api: str, registrations: int, email: str, password: str) -> int:
+    run_id = uuid.uuid4().hex[:8]
+    async with httpx.AsyncClient(timeout=60) as client:
+        response = await client.post(
+            f"{api}/login", json={"email": email, "password": password}
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        results = await asyncio.gather(
+            *(register(client, api, headers, i, run_id) for i in range(registrations))
+        )
+
+    failures = [status for status, _ in results if status != 200]
+    latencies = [elapsed for _, elapsed in results]
+    print(f"registrations: {registrations} ({len(failures)} failed)")
+    print(
+        f"latency ms:    median {statistics.median(latencies) * 1000:.1f}"
+        f"  max {max(latencies) * 1000:.1f}"
+    )
+
+    dotenv.load_dotenv(override=True)
+    conn = await asyncpg.connect(os.getenv("TIMESCALE_DB_CONNECTION"))
+    try:
+        duplicates = 0
+        for table, query in DUPLICATE_CHECKS.items():
+            rows = await conn.fetch(query)
+            duplicates += len(rows)
+            print(f"{table:>17}: {len(rows)} duplicated keys")
+    finally:
+        await conn.close()
+
+    return 1 if failures or duplicates else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True, help="of an admin user")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--registrations", type=int, default=200)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.api, args.registrations, args.email, args.password)))
@@ -0,0 +1,148 @@
+"""
+Requests/sec of one worker for /push-sensor-data style handlers: FastAPI decoding
+the body into a dict and validating each reading afterwards (the previous path)
+versus validating the raw body against the envelope model in one pass.
+
+The handlers run in-process behind httpx's ASGI transport and discard the rows, so
+the numbers cover routing, decoding and validation only. No database is needed.
+
+    python -m benchmarks.ingest_decode --requests 20000
+"""
+
+import argparse, asyncio, datetime, json, time
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+
+from sensors.measurements import envelope_model, measurements
+from sensors.utils import envelope_records
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def build_records_from_dict(data: dict) -> list:
+    # the dict based builder used before the envelope model, kept as the baseline
+    time = datetime.datetime.fromisoformat(data["timestamp"])
+    records = []
+    for name, reading in data["sensordata"].items():
+        measurement = measurements.get(name)
+        if measurement is None:
+            continue
+        values = measurement.model.model_validate(reading["values"])
+        records.append(
+            (
+                measurement,
+                (
+                    time,
+                    data["node_id"],
+                    *(getattr(values, field) for field in measurement.fields),
+                    data["location"],
+                    reading["sensor_name"],
+                ),
+            )
+        )
+    return records
+
+
+app = FastAPI()
+
+
+@app.post("/dict", status_code=202)
+async def post_dict(data: dict):
+    try:
+        build_records_from_dict(data)
+    except (KeyError, TypeError, AttributeError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid payload: {e}")
+    return {"received_data": "OK"}
+
+
+@app.post("/envelope", status_code=202)
+async def post_envelope(request: Request):
+    try:
+        envelope_records(envelope_model().model_validate_json(await request.body()))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid payload: {e}")
+    return {"received_data": "OK"}
+
+
+@app.post("/envelope-orjson", status_code=202)
+async def post_envelope_orjson(request: Request):
+    try:
+        envelope_records(
+            envelope_model().model_validate(orjson.loads(await request.body()))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid payload: {e}")
+    return {"received_data": "OK"}
+
+
+def sample_payload() -> bytes:
+    return json.dumps(
+        {
+            "node_id": "bench-node",
+            "location": "Mathare",
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "sensordata": {
+                "PM_data": {
+                    "values": {"PM1": 12.0, "PM2_5": 25.5, "PM10": 40.1},
+                    "sensor_name": "PMS5003",
+                },
+                "temp_humidity": {
+                    "values": {
+                        "temperature": 24.3,
+                        "rel_hum": 61.0,
+                        "abs_hum": 13.2,
+                        "heat_index": 25.1,
+                    },
+                    "sensor_name": "DHT22",
+                },
+                "Co2": {"values": {"CO2": 415.0}, "sensor_name": "SCD30"},
+            },
+        }
+    ).encode()
+
+
+async def bench(
+    client, path: str, body: bytes, requests: int, concurrency: int
+) -> float:
+    remaining = list(range(requests))
+    headers = {"content-type": "application/json"}
+
+    async def worker():
+        while remaining:
+            remaining.pop()
+            response = await client.post(path, content=body, headers=headers)
+            if response.status_code != 202:
+                raise RuntimeError(
+                    f"{path} returned {response.status_code}: {response.text}"
+                )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def main(requests: int, concurrency: int):
+    body = sample_payload()
+    paths = ["/dict", "/envelope"]
+    if orjson is not None:
+        paths.append("/envelope-orjson")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        for path in paths:
+            await bench(client, path, body, min(requests, 500), concurrency)  # warm up
+            elapsed = await bench(client, path, body, requests, concurrency)
+            print(f"{path:>16}: {requests / elapsed:,.0f} req/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
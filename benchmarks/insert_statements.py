@@ -0,0 +1,108 @@
+"""
+Micro-benchmark: string-built INSERTs vs. parameterized, prepared INSERTs.
+
+Runs both insert paths against a temporary copy of the PM hypertable on a single
+connection and reports inserts/sec for each.
+
+    python -m benchmarks.insert_statements --rows 5000
+"""
+
+import argparse, asyncio, datetime, os, time
+import asyncpg, dotenv
+
+from sensors.measurements import Measurement
+from sensors.models import PMDATA
+
+BENCH_TABLE = "bench_sensor_pm_data"
+BENCH_MEASUREMENT = Measurement("PM_data", PMDATA, BENCH_TABLE)
+
+
+def generate_insert_query(data: dict, table: str):
+    # the string builder that used to live in sensors/utils.py, kept as the baseline
+    keys = data.keys()
+    vals = data.values()
+
+    columns = ""
+    for key in keys:
+        columns += key + ","
+    values = ""
+    for val in vals:
+        if (type(val).__name__) != "str":
+            val = str(val)
+            values += val + ","
+        else:
+            values += "'" + val + "',"
+
+    columns = columns[:-1]
+    values = values[:-1]
+
+    insert_query = f"""INSERT INTO {table}({columns})
+    VALUES({values});
+        """
+    return insert_query
+
+
+def sample_reading(i: int) -> dict:
+    return {
+        "PM1": 10.0 + i % 50,
+        "PM2_5": 20.0 + i % 70,
+        "PM10": 30.0 + i % 90,
+        "time": (
+            datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=i)
+        ).isoformat(),
+        "node_id": "bench-node",
+        "location": "Mathare",
+        "sensor_name": "PMS5003",
+    }
+
+
+async def bench_string_built(conn, rows: int) -> float:
+    start = time.perf_counter()
+    for i in range(rows):
+        await conn.execute(generate_insert_query(sample_reading(i), BENCH_TABLE))
+    return time.perf_counter() - start
+
+
+async def bench_prepared(conn, rows: int) -> float:
+    start = time.perf_counter()
+    for i in range(rows):
+        reading = sample_reading(i)
+        record = (
+            datetime.datetime.fromisoformat(reading["time"]),
+            reading["node_id"],
+            reading["PM1"],
+            reading["PM2_5"],
+            reading["PM10"],
+            reading["location"],
+            reading["sensor_name"],
+        )
+        await conn.execute(BENCH_MEASUREMENT.insert_sql, *record)
+    return time.perf_counter() - start
+
+
+async def main(rows: int):
+    dotenv.load_dotenv(override=True)
+    conn = await asyncpg.connect(os.getenv("TIMESCALE_DB_CONNECTION"))
+    try:
+        await conn.execute(
+            f"CREATE TEMP TABLE {BENCH_TABLE} (LIKE sensor_PM_data INCLUDING DEFAULTS)"
+        )
+        for name, bench in (
+            ("string-built", bench_string_built),
+            ("prepared", bench_prepared),
+        ):
+            await conn.execute(f"TRUNCATE {BENCH_TABLE}")
+            elapsed = await bench(conn, rows)
+            print(
+                f"{name:>14}: {rows} inserts in {elapsed:.3f}s "
+                f"({rows / elapsed:,.0f} inserts/s)"
+            )
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows))
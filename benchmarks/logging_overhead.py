@@ -0,0 +1,129 @@
+"""
+Requests/sec of one worker for an ingest-like handler that logs its payload the way
+the app used to (print to stdout) versus the logging setup of logs.py.
+
+    print       three print calls per request, payload included
+    sync        logger.info of the payload through a StreamHandler on the event loop
+    queue       logger.info of the payload through the QueueHandler/listener thread
+    sampled     per-request logger.debug kept at --sample-rate, through the queue
+    quiet       the production default, per-request records below the WARNING level
+
+The handlers run in-process behind httpx's ASGI transport. Output goes to --sink,
+point it at a terminal or a pipe (e.g. /dev/tty) to see the cost of slow consumers.
+
+    python -m benchmarks.logging_overhead --requests 20000 --sink /dev/tty
+"""
+
+import argparse, asyncio, contextlib, json, logging, os, queue, sys, time
+from logging.handlers import QueueHandler, QueueListener
+import httpx
+from fastapi import FastAPI
+
+from logs import JsonFormatter, SamplingFilter
+
+PAYLOAD = {
+    "node_id": "bench-node",
+    "location": "Mathare",
+    "timestamp": "2026-10-18T10:00:00+00:00",
+    "sensordata": {
+        "PM_data": {
+            "values": {"PM1": 12.0, "PM2_5": 25.5, "PM10": 40.1},
+            "sensor_name": "PMS5003",
+        },
+    },
+}
+
+logger = logging.getLogger("benchmarks.logging_overhead")
+app = FastAPI()
+
+
+@app.post("/print")
+async def post_print(data: dict):
+    print()
+    print("Received post data")
+    print(data)
+    return {"received_data": "OK"}
+
+
+@app.post("/info")
+async def post_info(data: dict):
+    logger.info("Received post data", extra={"payload": data})
+    return {"received_data": "OK"}
+
+
+@app.post("/debug")
+async def post_debug(data: dict):
+    logger.debug("Received post data", extra={"payload": data, "sampled": True})
+    return {"received_data": "OK"}
+
+
+def setup(mode: str, sink, sample_rate: float):
+    """
+    Returns the listener to stop, if any.
+    """
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(JsonFormatter())
+    listener = None
+    if mode in ("queue", "sampled", "quiet"):
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+        listener = QueueListener(log_queue, handler)
+        listener.start()
+        handler = queue_handler
+
+    logger.handlers = [handler]
+    logger.propagate = False
+    levels = {"sampled": logging.DEBUG, "quiet": logging.WARNING}
+    logger.setLevel(levels.get(mode, logging.INFO))
+    return listener
+
+
+async def bench(client, path: str, requests: int, concurrency: int) -> float:
+    remaining = list(range(requests))
+    body = json.dumps(PAYLOAD).encode()
+    headers = {"content-type": "application/json"}
+
+    async def worker():
+        while remaining:
+            remaining.pop()
+            await client.post(path, content=body, headers=headers)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def main(requests: int, concurrency: int, sink_path: str, sample_rate: float):
+    modes = {
+        "print": "/print",
+        "sync": "/info",
+        "queue": "/info",
+        "sampled": "/debug",
+        "quiet": "/debug",
+    }
+    transport = httpx.ASGITransport(app=app)
+    with open(sink_path, "w") as sink:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench"
+        ) as client:
+            for mode, path in modes.items():
+                listener = setup(mode, sink, sample_rate)
+                with contextlib.redirect_stdout(sink):
+                    # warm up
+                    await bench(client, path, min(requests, 500), concurrency)
+                    elapsed = await bench(client, path, requests, concurrency)
+                if listener is not None:
+                    # draining the queue happens on the listener thread, not the event loop
+                    listener.stop()
+                print(f"{mode:>8}: {requests / elapsed:,.0f} req/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sink", default=os.devnull)
+    parser.add_argument("--sample-rate", type=float, default=0.01)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.sink, args.sample_rate))
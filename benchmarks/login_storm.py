@@ -0,0 +1,162 @@
+"""
+Load test: ingest latency of a running API before, during and after a storm of
+concurrent /login calls.
+
+Ingest requests are sent at a fixed rate (open loop) for three phases of equal
+length; during the middle one --storm-concurrency clients log in back to back.
+With bcrypt off the event loop the ingest p99 stays flat across phases. Logins
+refused with 503 (too many waiting for a hashing thread) are counted separately.
+
+The storm logs in as the admin given with --email and --password, who also
+registers the node.
+
+    python -m benchmarks.login_storm --email <admin email> --password <password>
+"""
+
+import argparse, asyncio, datetime, statistics, time
+import httpx
+
+NODE_ID = "login-storm-bench"
+
+
+def reading() -> dict:
+    return {
+        "node_id": NODE_ID,
+        "location": "Mathare",
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "sensordata": {
+            "PM_data": {
+                "values": {"PM1": 12.0, "PM2_5": 25.5, "PM10": 40.1},
+                "sensor_name": "PMS5003",
+            },
+        },
+    }
+
+
+async def setup(client: httpx.AsyncClient, email: str, password: str) -> str:
+    """
+    Registers the node as the admin and returns a device key for it.
+    """
+    response = await client.post("/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = await client.get(
+        "/register-node/",
+        headers=headers,
+        params={
+            "node_id": NODE_ID,
+            "lat": -1.26,
+            "long": 36.85,
+            "country": "Kenya",
+            "location": "Mathare",
+            "city": "Nairobi",
+        },
+    )
+    response.raise_for_status()
+    if response.json()["device_key"] is None:  # registered by an earlier run
+        response = await client.post(f"/nodes/{NODE_ID}/keys", headers=headers)
+        response.raise_for_status()
+    return response.json()["device_key"]
+
+
+async def ingest(
+    client, device_key: str, rate: float, duration: float
+) -> tuple[list[float], int]:
+    latencies, errors = [], 0
+    headers = {"X-Device-Key": device_key}
+
+    async def send(due: float):
+        nonlocal errors
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        try:
+            response = await client.post(
+                "/push-sensor-data", json=reading(), headers=headers
+            )
+            errors += response.status_code != 202
+        except httpx.HTTPError:
+            errors += 1
+        # from when the request was due, waiting for a connection included
+        latencies.append(time.perf_counter() - due)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(start + i / rate) for i in range(int(rate * duration))))
+    return latencies, errors
+
+
+async def storm(client, email, password, concurrency, duration) -> tuple[int, int]:
+    deadline = time.perf_counter() + duration
+    ok, busy = 0, 0
+
+    async def login():
+        nonlocal ok, busy
+        while time.perf_counter() < deadline:
+            response = await client.post(
+                "/login", json={"email": email, "password": password}
+            )
+            if response.status_code == 200:
+                ok += 1
+            elif response.status_code == 503:
+                busy += 1
+                await asyncio.sleep(0.1)
+
+    await asyncio.gather(*(login() for _ in range(concurrency)))
+    return ok, busy
+
+
+def summary(name: str, latencies: list[float], errors: int) -> str:
+    q = statistics.quantiles(latencies, n=100)
+    return (
+        f"{name:>7}: ingest p50 {q[49] * 1000:6.1f} ms  p99 {q[98] * 1000:6.1f} ms"
+        f"  max {max(latencies) * 1000:6.1f} ms  errors {errors}"
+    )
+
+
+async def main(args):
+    email, password = args.email, args.password
+    limits = httpx.Limits(max_connections=args.ingest_connections)
+    storm_limits = httpx.Limits(max_connections=args.storm_concurrency)
+    async with (
+        httpx.AsyncClient(base_url=args.api, limits=limits, timeout=60) as client,
+        httpx.AsyncClient(
+            base_url=args.api, limits=storm_limits, timeout=60
+        ) as storm_client,
+    ):
+        device_key = await setup(client, email, password)
+
+        latencies, errors = await ingest(
+            client, device_key, args.ingest_rate, args.phase_seconds
+        )
+        print(summary("before", latencies, errors))
+
+        (latencies, errors), (ok, busy) = await asyncio.gather(
+            ingest(client, device_key, args.ingest_rate, args.phase_seconds),
+            storm(
+                storm_client,
+                email,
+                password,
+                args.storm_concurrency,
+                args.phase_seconds,
+            ),
+        )
+        print(summary("storm", latencies, errors))
+        print(
+            f"         logins {ok / args.phase_seconds:,.1f}/s, {busy} refused with 503"
+        )
+
+        latencies, errors = await ingest(
+            client, device_key, args.ingest_rate, args.phase_seconds
+        )
+        print(summary("after", latencies, errors))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True, help="of an admin user")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--ingest-rate", type=float, default=200, help="requests/s")
+    parser.add_argument("--ingest-connections", type=int, default=50)
+    parser.add_argument("--storm-concurrency", type=int, default=50)
+    parser.add_argument("--phase-seconds", type=float, default=15)
+    asyncio.run(main(parser.parse_args()))
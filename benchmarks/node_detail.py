@@ -0,0 +1,121 @@
+"""
+Time of one /node/{node_id} lookup against fleet size: the previous node_metadata
+query, whose Python `and` left a cross join of node x sensor_locations x custodian
+filtered on the custodian only, versus NODE_DETAIL_QUERY.
+
+Seeds up to --nodes nodes (prefix detail-bench) spread over a few locations and
+custodians into the database configured through .env, measures both queries at
+each size and deletes the seeded rows again. Uncached, straight on the database.
+
+    python -m benchmarks.node_detail --sizes 1000,5000,10000
+"""
+
+import argparse, asyncio, datetime, os, statistics, time
+import asyncpg, dotenv
+
+from sensors.utils import NODE_DETAIL_QUERY
+
+PREFIX = "detail-bench"
+
+CROSS_JOIN_QUERY = """SELECT node.*, sensor_locations.*, custodian.*
+FROM node, sensor_locations, custodian
+WHERE custodian.id = $1"""
+
+
+async def seed(
+    conn, start: int, stop: int, location_ids: list[int], custodian_ids: list[int]
+):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await conn.copy_records_to_table(
+        "node",
+        columns=[
+            "node_id",
+            "date_registered",
+            "commissioned",
+            "latitude",
+            "longitude",
+            "location_id",
+            "custodian_id",
+        ],
+        records=[
+            (
+                f"{PREFIX}-{i}",
+                now,
+                True,
+                -1.26,
+                36.85,
+                location_ids[i % len(location_ids)],
+                custodian_ids[i % len(custodian_ids)],
+            )
+            for i in range(start, stop)
+        ],
+    )
+
+
+async def timed_query(conn, query: str, arg, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await conn.fetch(query, arg)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+async def main(args):
+    dotenv.load_dotenv(override=True)
+    conn = await asyncpg.connect(os.getenv("TIMESCALE_DB_CONNECTION"))
+    try:
+        location_ids = [
+            await conn.fetchval(
+                "INSERT INTO sensor_locations (country, location, city) VALUES ('Kenya', $1, 'Nairobi')"
+                " ON CONFLICT ON CONSTRAINT uq_sensor_locations_country_location"
+                " DO UPDATE SET location = EXCLUDED.location RETURNING id",
+                f"{PREFIX}-{i}",
+            )
+            for i in range(args.locations)
+        ]
+        custodian_ids = [
+            await conn.fetchval(
+                "INSERT INTO custodian (name, email, phone) VALUES ($1, 'bench@example.com', NULL)"
+                " ON CONFLICT ON CONSTRAINT uq_custodian_name_email_phone"
+                " DO UPDATE SET name = EXCLUDED.name RETURNING id",
+                f"{PREFIX}-{i}",
+            )
+            for i in range(args.custodians)
+        ]
+
+        print(f"{'nodes':>7}  {'cross join ms':>13}  {'detail ms':>9}")
+        seeded = 0
+        for size in args.sizes:
+            await seed(conn, seeded, size, location_ids, custodian_ids)
+            seeded = size
+            await conn.execute("ANALYZE node")
+
+            node_id = f"{PREFIX}-{size // 2}"
+            custodian_id = custodian_ids[(size // 2) % len(custodian_ids)]
+            cross_join = await timed_query(
+                conn, CROSS_JOIN_QUERY, custodian_id, args.repeat
+            )
+            detail = await timed_query(conn, NODE_DETAIL_QUERY, node_id, args.repeat)
+            print(f"{size:>7}  {cross_join * 1000:>13.2f}  {detail * 1000:>9.3f}")
+    finally:
+        await conn.execute("DELETE FROM node WHERE node_id LIKE $1", f"{PREFIX}-%")
+        await conn.execute("DELETE FROM custodian WHERE name LIKE $1", f"{PREFIX}-%")
+        await conn.execute(
+            "DELETE FROM sensor_locations WHERE location LIKE $1", f"{PREFIX}-%"
+        )
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: sorted(int(n) for n in value.split(",")),
+        default=[1000, 5000, 10000],
+        help="comma separated node counts",
+    )
+    parser.add_argument("--locations", type=int, default=20)
+    parser.add_argument("--custodians", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
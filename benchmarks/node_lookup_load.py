@@ -0,0 +1,58 @@
+"""
+Load test for concurrent GET /node/{node_id} lookups against a running API.
+
+Run it once against a build and once against the one to compare with, e.g.
+
+    python -m benchmarks.node_lookup_load --node-id esp8266-12 --concurrency 100 --requests 5000
+"""
+
+import argparse, asyncio, statistics, time
+import httpx
+
+
+async def worker(client, url, remaining, latencies, errors):
+    while remaining:
+        remaining.pop()
+        start = time.perf_counter()
+        try:
+            response = await client.get(url)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def main(api: str, node_id: str, concurrency: int, requests: int):
+    url = f"{api}/node/{node_id}"
+    remaining = list(range(requests))
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                worker(client, url, remaining, latencies, errors)
+                for _ in range(concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"requests:    {len(latencies)} ({len(errors)} errors)")
+    print(f"throughput:  {len(latencies) / elapsed:,.0f} req/s")
+    print(
+        f"latency ms:  p50 {quantiles[49] * 1000:.1f}  p95 {quantiles[94] * 1000:.1f}"
+        f"  p99 {quantiles[98] * 1000:.1f}  max {latencies[-1] * 1000:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--node-id", required=True)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.api, args.node_id, args.concurrency, args.requests))
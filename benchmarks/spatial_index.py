@@ -0,0 +1,158 @@
+"""
+Time of /nodes/near and /nodes/within lookups over 100k synthetic nodes: the grid
+NodeIndex against a full scan of the same nodes, plus the cost of building the index.
+
+Nodes are clustered around a few African cities with some spread over the globe.
+With --database the nodes are also seeded (prefix spatial-bench) into the database
+configured through .env, to time the rebuild query and a bbox scan of the node
+table, and deleted again.
+
+    python -m benchmarks.spatial_index --nodes 100000 --database
+"""
+
+import argparse, asyncio, datetime, os, random, statistics, time
+import asyncpg, dotenv
+
+from sensors.spatial import IndexedNode, NodeIndex, distance_km
+
+PREFIX = "spatial-bench"
+
+CITIES = [
+    (-1.2864, 36.8172),  # Nairobi
+    (6.5244, 3.3792),  # Lagos
+    (-26.2041, 28.0473),  # Johannesburg
+    (5.6037, -0.1870),  # Accra
+    (-6.7924, 39.2083),  # Dar es Salaam
+    (0.3476, 32.5825),  # Kampala
+]
+
+
+def synthetic_nodes(count: int) -> list[IndexedNode]:
+    random.seed(1)
+    nodes = []
+    for i in range(count):
+        if i % 10 == 0:
+            lat, lon = random.uniform(-60, 70), random.uniform(-180, 180)
+        else:
+            city_lat, city_lon = CITIES[i % len(CITIES)]
+            lat, lon = random.gauss(city_lat, 0.15), random.gauss(city_lon, 0.15)
+        nodes.append(IndexedNode(f"{PREFIX}-{i}", lat, lon))
+    return nodes
+
+
+def scan_near(nodes, lat, lon, radius_km, limit):
+    found = [
+        (node, distance)
+        for node in nodes
+        if (distance := distance_km(lat, lon, node.latitude, node.longitude))
+        <= radius_km
+    ]
+    found.sort(key=lambda pair: pair[1])
+    return found[:limit]
+
+
+def scan_within(nodes, min_lon, min_lat, max_lon, max_lat):
+    return sorted(
+        (
+            node
+            for node in nodes
+            if min_lat <= node.latitude <= max_lat
+            and min_lon <= node.longitude <= max_lon
+        ),
+        key=lambda node: node.node_id,
+    )
+
+
+def timed(function, *args, repeat: int) -> tuple[float, int]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), len(result)
+
+
+async def database(nodes: list[IndexedNode], cell_degrees: float, repeat: int):
+    dotenv.load_dotenv(override=True)
+    conn = await asyncpg.connect(os.getenv("TIMESCALE_DB_CONNECTION"))
+    now = datetime.datetime.now(datetime.timezone.utc)
+    try:
+        await conn.copy_records_to_table(
+            "node",
+            columns=[
+                "node_id",
+                "date_registered",
+                "commissioned",
+                "latitude",
+                "longitude",
+            ],
+            records=[(n.node_id, now, True, n.latitude, n.longitude) for n in nodes],
+        )
+        await conn.execute("ANALYZE node")
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = await conn.fetch("SELECT node_id, latitude, longitude FROM node")
+            NodeIndex(cell_degrees, 0).build([IndexedNode(*row) for row in rows])
+            times.append(time.perf_counter() - start)
+        print(f"rebuild from the node table: {statistics.median(times) * 1000:.1f} ms")
+
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await conn.fetch(
+                "SELECT node_id, latitude, longitude FROM node"
+                " WHERE longitude BETWEEN $1 AND $3 AND latitude BETWEEN $2 AND $4",
+                36.6,
+                -1.45,
+                37.1,
+                -1.1,
+            )
+            times.append(time.perf_counter() - start)
+        print(f"bbox scan of the node table: {statistics.median(times) * 1000:.1f} ms")
+    finally:
+        await conn.execute("DELETE FROM node WHERE node_id LIKE $1", f"{PREFIX}-%")
+        await conn.close()
+
+
+def main(args):
+    nodes = synthetic_nodes(args.nodes)
+    index = NodeIndex(args.cell_degrees, 0)
+    start = time.perf_counter()
+    index.build(nodes)
+    print(
+        f"index of {len(index):,} nodes built in"
+        f" {(time.perf_counter() - start) * 1000:.1f} ms"
+    )
+
+    lookups = [
+        ("near Nairobi 2 km", "near", (-1.2864, 36.8172, 2, 100)),
+        ("near Nairobi 25 km", "near", (-1.2864, 36.8172, 25, 100)),
+        ("near open sea 50 km", "near", (-30.0, -20.0, 50, 100)),
+        ("within Nairobi", "within", (36.6, -1.45, 37.1, -1.1)),
+        ("within Lagos centre", "within", (3.3, 6.45, 3.45, 6.6)),
+    ]
+    print(f"{'lookup':<20} {'found':>6} {'scan ms':>9} {'index ms':>9}")
+    for name, kind, params in lookups:
+        if kind == "near":
+            scan, found = timed(scan_near, nodes, *params, repeat=args.repeat)
+            indexed, _ = timed(index.near, *params, repeat=args.repeat)
+        else:
+            scan, found = timed(scan_within, nodes, *params, repeat=args.repeat)
+            indexed, _ = timed(index.within, *params, repeat=args.repeat)
+        print(f"{name:<20} {found:>6} {scan * 1000:>9.2f} {indexed * 1000:>9.3f}")
+
+    if args.database:
+        asyncio.run(database(nodes, args.cell_degrees, args.repeat))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--nodes", type=int, default=100_000)
+    parser.add_argument("--cell-degrees", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument(
+        "--database", action="store_true", help="also time the database side"
+    )
+    main(parser.parse_args())
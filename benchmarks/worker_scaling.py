@@ -0,0 +1,217 @@
+"""
+Ingest throughput scaling with the number of uvicorn workers.
+
+For each worker count the harness starts `uvicorn main:app --workers N` (uvloop,
+httptools) against the database configured through .env, waits for /readyz,
+drives POST /push-sensor-data from several client processes for a fixed time and
+reports accepted requests/sec, errors and latency percentiles. 503s from a full
+ingest buffer count as errors, they mean the database is not keeping up.
+
+Run the clients on another machine (or pin them to other cores) for clean numbers,
+otherwise they compete with the workers for CPU.
+
+The nodes are registered by the admin given with --email and --password.
+
+    python -m benchmarks.worker_scaling --email <admin email> --password <password> --workers 1,2,4,8
+"""
+
+import argparse, asyncio, datetime, json, multiprocessing, os, random
+import statistics, subprocess, sys, time
+import httpx
+
+NODE_PREFIX = "scaling-bench"
+
+
+def payload(node_id: str) -> bytes:
+    return json.dumps(
+        {
+            "node_id": node_id,
+            "location": "Mathare",
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "sensordata": {
+                "PM_data": {
+                    "values": {
+                        "PM1": random.uniform(5, 50),
+                        "PM2_5": random.uniform(10, 80),
+                        "PM10": random.uniform(20, 120),
+                    },
+                    "sensor_name": "PMS5003",
+                },
+                "temp_humidity": {
+                    "values": {
+                        "temperature": random.uniform(15, 35),
+                        "rel_hum": random.uniform(30, 90),
+                        "abs_hum": random.uniform(5, 20),
+                        "heat_index": random.uniform(15, 40),
+                    },
+                    "sensor_name": "DHT22",
+                },
+            },
+        }
+    ).encode()
+
+
+async def register_nodes(api: str, nodes: int, email: str, password: str) -> list[str]:
+    """
+    Registers the nodes as the admin and returns a device key per node.
+    """
+    keys = []
+    async with httpx.AsyncClient(timeout=60) as client:
+        response = await client.post(
+            f"{api}/login", json={"email": email, "password": password}
+        )
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        for i in range(nodes):
+            response = await client.get(
+                f"{api}/register-node/",
+                headers=headers,
+                params={
+                    "node_id": f"{NODE_PREFIX}-{i}",
+                    "lat": -1.26,
+                    "long": 36.85,
+                    "country": "Kenya",
+                    "location": "Mathare",
+                    "city": "Nairobi",
+                    "location_tag": "rooftop",
+                    "custodian_name": "Alice",
+                    "custodian_email": "alice@example.com",
+                    "custodian_phone": "+1 (123) 456-7890",
+                },
+            )
+            response.raise_for_status()
+            if response.json()["device_key"] is None:  # registered by an earlier run
+                response = await client.post(
+                    f"{api}/nodes/{NODE_PREFIX}-{i}/keys", headers=headers
+                )
+                response.raise_for_status()
+            keys.append(response.json()["device_key"])
+    return keys
+
+
+async def drive(api: str, keys: list[str], concurrency: int, duration: float):
+    deadline = time.perf_counter() + duration
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async def worker(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            i = random.randrange(len(keys))
+            body = payload(f"{NODE_PREFIX}-{i}")
+            headers = {"content-type": "application/json", "x-device-key": keys[i]}
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{api}/push-sensor-data", content=body, headers=headers
+                )
+                if response.status_code != 202:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args) -> tuple[list[float], int]:
+    return asyncio.run(drive(*args))
+
+
+def wait_ready(api: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{api}/readyz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{api} did not become ready within {timeout}s")
+
+
+def run(workers: int, keys: list[str], args) -> dict:
+    api = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(args.port),
+            "--workers",
+            str(workers),
+            "--loop",
+            "uvloop",
+            "--http",
+            "httptools",
+        ],
+        env={**os.environ, "LOG_LEVEL": "WARNING"},
+    )
+    try:
+        wait_ready(api)
+        # every worker runs its own lifespan, give the others a moment as well
+        time.sleep(2)
+        if not keys:
+            keys.extend(
+                asyncio.run(register_nodes(api, args.nodes, args.email, args.password))
+            )
+
+        client_args = [(api, keys, args.concurrency, args.duration)]
+        with multiprocessing.Pool(args.client_processes) as pool:
+            results = pool.map(client_process, client_args * args.client_processes)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(errors for _, errors in results)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "workers": workers,
+        "throughput": (len(latencies) - errors) / args.duration,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50": quantiles[49],
+        "p99": quantiles[98],
+    }
+
+
+def main(args):
+    baseline = None
+    keys = []  # device keys, issued on the first run
+    print(
+        f"{'workers':>7}  {'req/s':>9}  {'speedup':>7}  {'errors':>7}  {'p50 ms':>7}  {'p99 ms':>7}"
+    )
+    for workers in args.workers:
+        result = run(workers, keys, args)
+        baseline = baseline or result["throughput"]
+        print(
+            f"{workers:>7}  {result['throughput']:>9,.0f}  "
+            f"{result['throughput'] / baseline:>6.2f}x  {result['errors']:>7}  "
+            f"{result['p50'] * 1000:>7.1f}  {result['p99'] * 1000:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=[1, 2, 4, os.cpu_count() or 4],
+        help="comma separated worker counts",
+    )
+    parser.add_argument("--email", required=True, help="of an admin user")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--duration", type=float, default=20, help="seconds per run")
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--client-processes", type=int, default=4)
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="per client process"
+    )
+    main(parser.parse_args())
@@ -0,0 +1,137 @@
+import os, dotenv
+
+dotenv.load_dotenv(override=True)
+
+# TimescaleDB
+TIMESCALE_DB_CONNECTION = os.getenv("TIMESCALE_DB_CONNECTION")
+TIMESCALE_DB_ASYNC_CONNECTION = os.getenv("TIMESCALE_DB_ASYNC_CONNECTION")
+
+# JWT
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM")
+# verified tokens are cached per worker, never past their expiry
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10_000))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", 300))
+# how often each worker picks up tokens revoked (logged out) on other workers
+TOKEN_REVOCATION_SYNC_SECONDS = float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", 15))
+
+# Device API keys
+# HMAC key of the stored device key hashes, changing it invalidates every issued key
+DEVICE_KEY_SECRET = os.getenv("DEVICE_KEY_SECRET") or JWT_SECRET_KEY
+# verified keys are cached per worker, a revocation reaches other workers within the TTL
+DEVICE_KEY_CACHE_SIZE = int(os.getenv("DEVICE_KEY_CACHE_SIZE", 100_000))
+DEVICE_KEY_CACHE_TTL_SECONDS = float(os.getenv("DEVICE_KEY_CACHE_TTL_SECONDS", 60))
+DEVICE_KEY_NEGATIVE_TTL_SECONDS = float(
+    os.getenv("DEVICE_KEY_NEGATIVE_TTL_SECONDS", 10)
+)
+
+# Password hashing
+# bcrypt cost factor of new hashes, older hashes are upgraded on the next login
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", 12))
+# threads hashing and verifying passwords, per worker. bcrypt releases the GIL.
+PASSWORD_HASH_THREADS = int(os.getenv("PASSWORD_HASH_THREADS", 2))
+# calls waiting for a thread beyond which /signup and /login answer 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+
+# Connection pools, per worker process. Keep
+# workers * (ASYNCPG_POOL_MAX_SIZE + SQLALCHEMY_POOL_SIZE + SQLALCHEMY_MAX_OVERFLOW)
+# below the server's max_connections, minus what migrations and admin sessions need.
+ASYNCPG_POOL_MIN_SIZE = int(os.getenv("ASYNCPG_POOL_MIN_SIZE", 1))
+ASYNCPG_POOL_MAX_SIZE = int(os.getenv("ASYNCPG_POOL_MAX_SIZE", 10))
+# connections are replaced after this many queries or seconds of idleness
+ASYNCPG_POOL_MAX_QUERIES = int(os.getenv("ASYNCPG_POOL_MAX_QUERIES", 50_000))
+ASYNCPG_POOL_MAX_INACTIVE_SECONDS = float(
+    os.getenv("ASYNCPG_POOL_MAX_INACTIVE_SECONDS", 300)
+)
+ASYNCPG_STATEMENT_CACHE_SIZE = int(os.getenv("ASYNCPG_STATEMENT_CACHE_SIZE", 256))
+# checkouts of an exhausted pool fail with TimeoutError after waiting this long
+ASYNCPG_POOL_ACQUIRE_TIMEOUT_SECONDS = float(
+    os.getenv("ASYNCPG_POOL_ACQUIRE_TIMEOUT_SECONDS", 30)
+)
+SQLALCHEMY_POOL_SIZE = int(os.getenv("SQLALCHEMY_POOL_SIZE", 5))
+SQLALCHEMY_MAX_OVERFLOW = int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", 5))
+SQLALCHEMY_POOL_TIMEOUT_SECONDS = float(
+    os.getenv("SQLALCHEMY_POOL_TIMEOUT_SECONDS", 30)
+)
+SQLALCHEMY_POOL_RECYCLE_SECONDS = int(
+    os.getenv("SQLALCHEMY_POOL_RECYCLE_SECONDS", 1800)
+)
+SQLALCHEMY_POOL_PRE_PING = (
+    os.getenv("SQLALCHEMY_POOL_PRE_PING", "true").lower() == "true"
+)
+SQLALCHEMY_STATEMENT_CACHE_SIZE = int(os.getenv("SQLALCHEMY_STATEMENT_CACHE_SIZE", 100))
+# session settings sent when each connection of either pool starts, as name=value pairs.
+# JIT compilation costs more than it saves on the short queries this app runs.
+DB_SERVER_SETTINGS = os.getenv(
+    "DB_SERVER_SETTINGS", "jit=off,application_name=sensors-api"
+)
+# seconds /readyz waits for a connection and a SELECT 1
+DB_READY_TIMEOUT_SECONDS = float(os.getenv("DB_READY_TIMEOUT_SECONDS", 2))
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING")
+# per logger overrides, e.g. "sensors.ingest=INFO,sqlalchemy.engine=INFO"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "uvicorn.access=WARNING")
+# "json" or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# fraction of the per-request debug records that are kept
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.01))
+
+# Ingest buffer
+INGEST_BUFFER_CAPACITY = int(os.getenv("INGEST_BUFFER_CAPACITY", 50_000))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", 1_000))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", 200))
+INGEST_DRAIN_TIMEOUT_SECONDS = float(os.getenv("INGEST_DRAIN_TIMEOUT_SECONDS", 30))
+# larger /push-sensor-data/batch requests are refused with 413, a batch is written in
+# one transaction holding a pool connection throughout
+INGEST_BATCH_MAX_ITEMS = int(os.getenv("INGEST_BATCH_MAX_ITEMS", 1_000))
+INGEST_BATCH_MAX_BYTES = int(os.getenv("INGEST_BATCH_MAX_BYTES", 2_000_000))
+# longest wait between retries of a batch while the database is unreachable
+INGEST_RETRY_BACKOFF_MAX_SECONDS = float(
+    os.getenv("INGEST_RETRY_BACKOFF_MAX_SECONDS", 10)
+)
+# "pydantic" parses request bodies with pydantic-core, "orjson" needs orjson installed
+INGEST_JSON_DECODER = os.getenv("INGEST_JSON_DECODER", "pydantic")
+
+# Node registry cache
+NODE_CACHE_SIZE = int(os.getenv("NODE_CACHE_SIZE", 100_000))
+NODE_CACHE_TTL_SECONDS = float(os.getenv("NODE_CACHE_TTL_SECONDS", 300))
+NODE_CACHE_NEGATIVE_TTL_SECONDS = float(
+    os.getenv("NODE_CACHE_NEGATIVE_TTL_SECONDS", 30)
+)
+# rendered /node/{node_id} responses, keyed by the metadata table versions
+NODE_DETAIL_CACHE_SIZE = int(os.getenv("NODE_DETAIL_CACHE_SIZE", 10_000))
+NODE_DETAIL_CACHE_TTL_SECONDS = float(os.getenv("NODE_DETAIL_CACHE_TTL_SECONDS", 300))
+
+# Live streams (/stream, /stream/sse)
+# readings buffered per subscriber, the oldest are dropped for slow clients
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 1_000))
+STREAM_MAX_SUBSCRIBERS = int(os.getenv("STREAM_MAX_SUBSCRIBERS", 1_000))
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", 15))
+# relay readings between workers through Postgres LISTEN/NOTIFY, needed with more
+# than one worker or container so subscribers see readings ingested by the others
+STREAM_PG_NOTIFY = os.getenv("STREAM_PG_NOTIFY", "false").lower() == "true"
+STREAM_NOTIFY_INTERVAL_MS = int(os.getenv("STREAM_NOTIFY_INTERVAL_MS", 50))
+
+# Read API
+# page size limit of /nodes and /locations
+LISTING_MAX_LIMIT = int(os.getenv("LISTING_MAX_LIMIT", 1_000))
+# rendered listing pages per worker, keyed by the table versions they were built from
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", 1_000))
+LISTING_CACHE_TTL_SECONDS = float(os.getenv("LISTING_CACHE_TTL_SECONDS", 300))
+# how long a rendered /latest response is reused, 0 disables the cache
+LATEST_CACHE_TTL_SECONDS = float(os.getenv("LATEST_CACHE_TTL_SECONDS", 1))
+# grid cell size of the in-memory node index behind /nodes/near and /nodes/within,
+# and how often each worker checks the node table for changes to rebuild it
+NODE_INDEX_CELL_DEGREES = float(os.getenv("NODE_INDEX_CELL_DEGREES", 0.1))
+NODE_INDEX_REFRESH_SECONDS = float(os.getenv("NODE_INDEX_REFRESH_SECONDS", 5))
+READINGS_MAX_LIMIT = int(os.getenv("READINGS_MAX_LIMIT", 50_000))
+AGGREGATES_MAX_BUCKETS = int(os.getenv("AGGREGATES_MAX_BUCKETS", 10_000))
+
+# Hypertable storage policies, as Postgres interval strings. Re-applied on every start
+# by `python -m sensors.storage_policies` (see entrypoint.sh)
+SENSOR_DATA_CHUNK_INTERVAL = os.getenv("SENSOR_DATA_CHUNK_INTERVAL", "1 day")
+SENSOR_DATA_COMPRESS_AFTER = os.getenv("SENSOR_DATA_COMPRESS_AFTER", "7 days")
+# drop raw chunks older than this, leave empty to keep raw data forever.
+# Keep it longer than the 30 days refresh window of the 1d rollup.
+SENSOR_DATA_RETENTION = os.getenv("SENSOR_DATA_RETENTION", "")
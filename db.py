@@ -1,100 +1,257 @@
-from typing import Annotated, Optional
-import os, dotenv
-from sqlmodel import SQLModel, Session, create_engine
+import logging, time
+from contextlib import asynccontextmanager
+from typing import Annotated, Optional, Sequence
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from asyncpg import Pool, create_pool as asyncpg_create_pool
-from fastapi import Depends
+from fastapi import Depends, Request
+from config import (
+    TIMESCALE_DB_CONNECTION,
+    TIMESCALE_DB_ASYNC_CONNECTION,
+    ASYNCPG_POOL_MIN_SIZE,
+    ASYNCPG_POOL_MAX_SIZE,
+    ASYNCPG_POOL_MAX_QUERIES,
+    ASYNCPG_POOL_MAX_INACTIVE_SECONDS,
+    ASYNCPG_STATEMENT_CACHE_SIZE,
+    ASYNCPG_POOL_ACQUIRE_TIMEOUT_SECONDS,
+    SQLALCHEMY_POOL_SIZE,
+    SQLALCHEMY_MAX_OVERFLOW,
+    SQLALCHEMY_POOL_TIMEOUT_SECONDS,
+    SQLALCHEMY_POOL_RECYCLE_SECONDS,
+    SQLALCHEMY_POOL_PRE_PING,
+    SQLALCHEMY_STATEMENT_CACHE_SIZE,
+    DB_SERVER_SETTINGS,
+)
+from metrics import (
+    db_pool_checkout_duration,
+    db_pool_connections,
+    db_session_duration,
+    sqlalchemy_pool_connections,
+    route_template,
+    sensor_rows_inserted,
+)
 
-dotenv.load_dotenv(override=True)
-TIMESCALE_DB_CONNECTION = os.getenv("TIMESCALE_DB_CONNECTION")
+logger = logging.getLogger(__name__)
 
-postgres_engine = create_engine(TIMESCALE_DB_CONNECTION, echo=True)
 
+def parse_server_settings(settings: str) -> dict[str, str]:
+    """
+    "jit=off,statement_timeout=30s" -> {"jit": "off", "statement_timeout": "30s"}
+    """
+    parsed = {}
+    for item in settings.split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition("=")
+        parsed[name.strip()] = value.strip()
+    return parsed
+
+
+# applied by both pools as startup parameters of every connection, no extra round trip
+server_settings = parse_server_settings(DB_SERVER_SETTINGS)
+
+# Both are created per worker process by init_postgres, in the app's lifespan,
+# never at import time.
+postgres_engine: Optional[AsyncEngine] = None
 tsb_conn_pool: Optional[Pool] = None
 
-sensor_data_hypertables = {
-    "PM_data": "sensor_PM_data",
-    "temp_humidity": "sensor_temp_humidity_data",
-}
-
-# Sensor Data Table
-create_hypertable_query = f"""
-
-DROP TABLE IF EXISTS {sensor_data_hypertables["PM_data"]};
-DROP TABLE IF EXISTS {sensor_data_hypertables["temp_humidity"]};
-
-CREATE TABLE IF NOT EXISTS {sensor_data_hypertables["PM_data"]} (
-    time TIMESTAMPTZ NOT NULL,
-    node_id VARCHAR(30) NOT NULL,
-    PM1 FLOAT,
-    PM2_5 FLOAT,
-    PM10 FLOAT,
-    location VARCHAR(64) NOT NULL,
-    sensor_name VARCHAR(64) NOT NULL,
-    FOREIGN KEY (node_id) REFERENCES node(node_id)
-);
-CREATE TABLE IF NOT EXISTS {sensor_data_hypertables["temp_humidity"]} (
-    time TIMESTAMPTZ NOT NULL,
-    node_id VARCHAR(30) NOT NULL,
-    temperature FLOAT,
-    rel_hum FLOAT,
-    abs_hum FLOAT,
-    heat_index FLOAT,
-    location VARCHAR(64) NOT NULL,
-    sensor_name VARCHAR(64) NOT NULL,
-    FOREIGN KEY (node_id) REFERENCES node(node_id)
-);
-
-SELECT create_hypertable('{sensor_data_hypertables["PM_data"]}', 'time', if_not_exists => TRUE);
-SELECT create_hypertable('{sensor_data_hypertables["temp_humidity"]}', 'time', if_not_exists => TRUE);
-"""
-
-
-def get_session():
-    with Session(postgres_engine) as session:
-        yield session
+
+def init_engine():
+    global postgres_engine
+    # SQL statements are logged by the sqlalchemy.engine logger, see LOG_LEVELS
+    postgres_engine = create_async_engine(
+        TIMESCALE_DB_ASYNC_CONNECTION,
+        pool_size=SQLALCHEMY_POOL_SIZE,
+        max_overflow=SQLALCHEMY_MAX_OVERFLOW,
+        pool_timeout=SQLALCHEMY_POOL_TIMEOUT_SECONDS,
+        pool_recycle=SQLALCHEMY_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=SQLALCHEMY_POOL_PRE_PING,
+        connect_args={
+            "server_settings": server_settings,
+            "prepared_statement_cache_size": SQLALCHEMY_STATEMENT_CACHE_SIZE,
+        },
+    )
+
+
+async def dispose_engine():
+    global postgres_engine
+    if postgres_engine is not None:
+        await postgres_engine.dispose()
+        postgres_engine = None
+
+
+async def get_session(request: Request):
+    start = time.perf_counter()
+    try:
+        # objects stay usable after commit, lazy refreshes are not possible with async IO
+        async with AsyncSession(postgres_engine, expire_on_commit=False) as session:
+            yield session
+    finally:
+        db_session_duration.labels(route_template(request.scope)).observe(
+            time.perf_counter() - start
+        )
+        record_pool_connections()
 
 
 async def init_connection_pool():
     global tsb_conn_pool
     try:
-        print("Initializing PostgreSQL connection pool...")
         tsb_conn_pool = await asyncpg_create_pool(
-            dsn=TIMESCALE_DB_CONNECTION, min_size=1, max_size=10
+            dsn=TIMESCALE_DB_CONNECTION,
+            min_size=ASYNCPG_POOL_MIN_SIZE,
+            max_size=ASYNCPG_POOL_MAX_SIZE,
+            max_queries=ASYNCPG_POOL_MAX_QUERIES,
+            max_inactive_connection_lifetime=ASYNCPG_POOL_MAX_INACTIVE_SECONDS,
+            # prepared insert statements are cached per connection, keyed by SQL text
+            statement_cache_size=ASYNCPG_STATEMENT_CACHE_SIZE,
+            server_settings=server_settings,
         )
-        print("PostgreSQL connection pool created successfully.")
+        logger.info("PostgreSQL connection pool created")
 
-    except Exception as e:
-        print(f"Error initializing PostgreSQL connection pool: {e}")
+    except Exception:
+        logger.exception("Could not create the PostgreSQL connection pool")
         raise
 
 
-async def run_query(query):
+async def close_connection_pool():
     global tsb_conn_pool
+    if tsb_conn_pool is not None:
+        await tsb_conn_pool.close()
+        tsb_conn_pool = None
+
+
+def pool_connections(state: str) -> int:
+    if tsb_conn_pool is None:
+        return 0
+    if state == "idle":
+        return tsb_conn_pool.get_idle_size()
+    if state == "in_use":
+        return tsb_conn_pool.get_size() - tsb_conn_pool.get_idle_size()
+    return tsb_conn_pool.get_max_size()
+
+
+def engine_pool_connections(state: str) -> int:
+    if postgres_engine is None:
+        return 0
+    pool = postgres_engine.pool
+    if state == "in_use":
+        return pool.checkedout()
+    if state == "idle":
+        return pool.checkedin()
+    return pool.size() + SQLALCHEMY_MAX_OVERFLOW
+
+
+def pool_status() -> dict:
+    """
+    Connection usage of both pools of this worker, for the health endpoints.
+    """
+    status = {}
+    for name, connections in (
+        ("asyncpg", pool_connections),
+        ("sqlalchemy", engine_pool_connections),
+    ):
+        in_use, idle, size = (connections(s) for s in ("in_use", "idle", "max"))
+        status[name] = {
+            "in_use": in_use,
+            "idle": idle,
+            "max": size,
+            "saturation": in_use / size if size else 0.0,
+        }
+    return status
+
+
+def record_pool_connections():
+    """
+    Update the pool gauges. They are set on checkout and release rather than read at
+    scrape time, so they also work with prometheus_client's multiprocess mode.
+    """
+    for state in ("in_use", "idle", "max"):
+        db_pool_connections.labels(state).set(pool_connections(state))
+        sqlalchemy_pool_connections.labels(state).set(engine_pool_connections(state))
+
+
+@asynccontextmanager
+async def acquire():
+    """
+    Connection from the pool, recording how long the checkout waited. Raises
+    asyncio.TimeoutError when none frees up within ASYNCPG_POOL_ACQUIRE_TIMEOUT_SECONDS.
+    """
+    start = time.perf_counter()
     try:
-        conn = await tsb_conn_pool.execute(query)
-        return conn
+        async with tsb_conn_pool.acquire(
+            timeout=ASYNCPG_POOL_ACQUIRE_TIMEOUT_SECONDS
+        ) as conn:
+            db_pool_checkout_duration.observe(time.perf_counter() - start)
+            record_pool_connections()
+            yield conn
+    finally:
+        record_pool_connections()
+
+
+async def run_query(query, *args):
+    try:
+        async with acquire() as conn:
+            return await conn.execute(query, *args)
     except Exception as e:
-        print(f"Error occured when running query : {e}")
-        print(query)
+        # callers handle the error, the statement is only worth a sampled debug record
+        logger.debug("Query failed (%s): %s", e, query, extra={"sampled": True})
         raise
 
 
-async def init_postgres() -> None:
+async def copy_records(
+    records_by_table: dict[str, tuple[list[str], list[tuple]]],
+    statements: Sequence[tuple[str, tuple]] = (),
+):
     """
-    Initialize the PostgreSQL connection pool and create the hypertables.
+    Write the given records with COPY, one call per hypertable, in a single transaction.
+    The (query, args) statements run in the same transaction after the COPYs.
     """
-    await init_connection_pool()
+    async with acquire() as conn:
+        async with conn.transaction():
+            for table, (columns, records) in records_by_table.items():
+                # the hypertables are created with unquoted (lower cased) identifiers
+                await conn.copy_records_to_table(
+                    table.lower(), records=records, columns=columns
+                )
+            for query, args in statements:
+                await conn.execute(query, *args)
 
-    # creat tables
-    create_db_and_tables()
+    for table, (columns, records) in records_by_table.items():
+        sensor_rows_inserted.labels(table).inc(len(records))
 
-    # create hypertables
-    await run_query(create_hypertable_query)
+
+async def fetch_query(query, *args):
+    async with acquire() as conn:
+        return await conn.fetch(query, *args)
+
+
+async def stream_query(query, *args, prefetch: int = 1000):
+    """
+    Yields the rows of a query from a server side cursor, prefetch rows at a time,
+    so large results are never held in memory at once.
+    """
+    async with acquire() as conn:
+        # cursors only live inside a transaction
+        async with conn.transaction(readonly=True):
+            async for row in conn.cursor(query, *args, prefetch=prefetch):
+                yield row
+
+
+async def init_postgres() -> None:
+    """
+    Create this worker's SQLAlchemy engine and asyncpg pool and check connectivity.
+    The schema is managed by the Alembic migrations (`alembic upgrade head`), which
+    run once per deployment before the workers start.
+    """
+    init_engine()
+    await init_connection_pool()
+    await run_query("SELECT 1")
 
 
-def create_db_and_tables():
-    # SQLModel.metadata.create_all(engine)
-    SQLModel.metadata.create_all(postgres_engine)
+async def close_postgres() -> None:
+    await close_connection_pool()
+    await dispose_engine()
+    record_pool_connections()
 
 
-SessionDep = Annotated[Session, Depends(get_session)]
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
@@ -20,4 +20,19 @@ until postgres_ready; do
 done
 
 >&2 echo "Postgres is up - continuing..."
+
+# Runs once per container, before the workers start. Concurrent runs from other
+# containers wait on an advisory lock, see migrations/env.py.
+>&2 echo "Applying database migrations..."
+alembic upgrade head
+
+# the SENSOR_DATA_* settings are re-applied on every start, not only by migrations
+>&2 echo "Syncing hypertable storage policies..."
+python -m sensors.storage_policies
+
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 exec $cmd
\ No newline at end of file
@@ -0,0 +1,83 @@
+import asyncio
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+import db
+from config import DB_READY_TIMEOUT_SECONDS
+from sensors import ingest
+from sensors.cache import node_cache
+
+health_router = APIRouter()
+
+
+@health_router.get("/healthz")
+async def healthz():
+    """
+    Liveness: the worker's event loop answers. Reports pool saturation without
+    touching the database.
+    """
+    return {"status": "ok", "pools": db.pool_status()}
+
+
+async def check_asyncpg():
+    if db.tsb_conn_pool is None:
+        raise RuntimeError("pool not initialized")
+    await db.run_query("SELECT 1")
+
+
+async def check_sqlalchemy():
+    if db.postgres_engine is None:
+        raise RuntimeError("engine not initialized")
+    async with db.postgres_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+@health_router.get("/readyz")
+async def readyz():
+    """
+    Readiness: both pools can run a query within DB_READY_TIMEOUT_SECONDS and the
+    ingest buffer accepts rows and has a running flusher. Answers 503 with the
+    failing checks otherwise.
+    """
+    checks = {}
+    for name, check in (("asyncpg", check_asyncpg), ("sqlalchemy", check_sqlalchemy)):
+        try:
+            await asyncio.wait_for(check(), timeout=DB_READY_TIMEOUT_SECONDS)
+            checks[name] = "ok"
+        except asyncio.TimeoutError:
+            checks[name] = f"no connection within {DB_READY_TIMEOUT_SECONDS}s"
+        except Exception as e:
+            checks[name] = f"error: {e}"
+
+    buffer = ingest.ingest_buffer
+    if buffer is None or not buffer.accepting:
+        checks["ingest_buffer"] = "not accepting rows"
+    elif not buffer.flushing:
+        checks["ingest_buffer"] = "flusher stopped"
+    else:
+        checks["ingest_buffer"] = "ok"
+
+    ready = all(result == "ok" for result in checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not ready",
+            "checks": checks,
+            "pools": db.pool_status(),
+        },
+    )
+
+
+# operational counters of this worker, kept out of the API docs like /metrics
+@health_router.get("/ingest/stats", include_in_schema=False)
+async def ingest_stats():
+    # created in the lifespan, absent before startup and after shutdown
+    if ingest.ingest_buffer is None:
+        raise HTTPException(status_code=503, detail="Ingest buffer not started")
+    return ingest.ingest_buffer.stats()
+
+
+@health_router.get("/node-cache/stats", include_in_schema=False)
+async def node_cache_stats():
+    return node_cache.stats()
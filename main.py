@@ -1,8 +1,18 @@
+import logging
 from fastapi import FastAPI
 from auth.router import auth_router
-from db import init_postgres
+from auth.tokens import start_token_revocation_sync, stop_token_revocation_sync
+from auth.utils import start_password_hasher, stop_password_hasher
+from db import init_postgres, close_postgres
+from sensors.cache import warm_node_cache
+from sensors.ingest import start_ingest_buffer, stop_ingest_buffer
 from sensors.router import sensors_router
+from sensors.spatial import start_node_index, stop_node_index
+from sensors.stream import start_stream_relay, stop_stream_relay
 from contextlib import asynccontextmanager
+from logs import configure_logging, stop_logging
+from metrics import PrometheusMiddleware, metrics_router, mark_worker_dead
+from health import health_router
 
 # sqlite_file_name = "sensorsafrica.db"
 # sqlite_url = f"sqlite:///{sqlite_file_name}"
@@ -10,16 +20,37 @@ from contextlib import asynccontextmanager
 # connect_args = {"check_same_thread": False}
 # engine = create_engine(sqlite_url, connect_args=connect_args, echo=True)
 
+logger = logging.getLogger(__name__)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("Initializing app ...")
+    # runs once in every worker process, everything it creates belongs to that worker
+    configure_logging()
+    logger.info("Initializing app")
     await init_postgres()
+    await warm_node_cache()
+    await start_node_index()
+    await start_ingest_buffer()
+    await start_password_hasher()
+    await start_token_revocation_sync()
+    await start_stream_relay()
     yield
-    print("Shutting down app ...")
+    logger.info("Shutting down app")
+    await stop_stream_relay()
+    await stop_token_revocation_sync()
+    await stop_password_hasher()
+    await stop_ingest_buffer()
+    await stop_node_index()
+    await close_postgres()
+    mark_worker_dead()
+    stop_logging()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(PrometheusMiddleware)
 
 app.include_router(auth_router)
 app.include_router(sensors_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
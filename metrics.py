@@ -0,0 +1,177 @@
+import os, time
+from contextlib import contextmanager
+
+from fastapi import APIRouter, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# With several workers per container every worker writes its samples to files in
+# this directory and /metrics aggregates them, whichever worker serves the scrape.
+# It has to be set in the environment before the workers start and emptied on boot.
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# request latencies span cached lookups (sub-millisecond) to large reads (seconds)
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+ingest_stage_duration = Histogram(
+    "ingest_stage_duration_seconds",
+    "Time spent per ingest stage: validate (payload to rows), enqueue (hand off to "
+    "the write-behind buffer) and db_write (COPY or insert of a batch)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+sensor_rows_inserted = Counter(
+    "sensor_rows_inserted",
+    "Rows written to each sensor data hypertable",
+    ["table"],
+)
+db_pool_checkout_duration = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the asyncpg pool",
+    buckets=LATENCY_BUCKETS,
+)
+db_pool_connections = Gauge(
+    "db_pool_connections",
+    "Connections of the asyncpg pool, by state",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+sqlalchemy_pool_connections = Gauge(
+    "sqlalchemy_pool_connections",
+    "Connections of the SQLAlchemy engine pool, by state",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+password_hash_pending = Gauge(
+    "password_hash_pending",
+    "Password hash and verify calls waiting for a hashing thread",
+    multiprocess_mode="livesum",
+)
+password_hash_wait = Histogram(
+    "password_hash_wait_seconds",
+    "Time password hash and verify calls waited for a hashing thread",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+password_hash_duration = Histogram(
+    "password_hash_duration_seconds",
+    "Time spent hashing or verifying a password on a hashing thread",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+password_hash_rejected = Counter(
+    "password_hash_rejected",
+    "Password hash and verify calls refused because too many were waiting",
+)
+db_session_duration = Histogram(
+    "db_session_duration_seconds",
+    "Lifetime of the SQLAlchemy sessions handed to request handlers, by route template",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+)
+
+stream_subscribers = Gauge(
+    "stream_subscribers",
+    "Clients subscribed to /stream and /stream/sse",
+    multiprocess_mode="livesum",
+)
+stream_events_dropped = Counter(
+    "stream_events_dropped",
+    "Readings dropped for slow /stream subscribers or a backed up relay",
+)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(
+            time.perf_counter() - start
+        )
+
+
+def route_template(scope) -> str:
+    # set by the router once a route matched, unmatched paths share one label
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+class PrometheusMiddleware:
+    """
+    Records http_request_duration_seconds for every request. A plain ASGI middleware,
+    so streaming responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.labels(
+                scope["method"], route_template(scope), str(status)
+            ).observe(time.perf_counter() - start)
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    registry = REGISTRY
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead():
+    """
+    Drop this worker's live gauges from the multiprocess aggregation, on shutdown.
+    """
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,22 +1,21 @@
 import asyncio
 from logging.config import fileConfig
 
-from sqlalchemy import pool
+from sqlalchemy import pool, text
 from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from alembic import context
 from auth.models import User
+import sensors.models
 from sqlmodel import SQLModel
-import os
-import dotenv
+from config import TIMESCALE_DB_ASYNC_CONNECTION
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
-dotenv.load_dotenv(override=True)
-config.set_main_option("sqlalchemy.url", os.getenv("TIMESCALE_DB_ASYNC_CONNECTION"))
+config.set_main_option("sqlalchemy.url", TIMESCALE_DB_ASYNC_CONNECTION)
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -29,6 +28,15 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = SQLModel.metadata
 
+
+def include_name(name, type_, parent_names) -> bool:
+    # Hypertables, continuous aggregates and Timescale's own tables are managed by
+    # hand written revisions, keep autogenerate from proposing to drop them.
+    if type_ == "table":
+        return name in target_metadata.tables
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -51,6 +59,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -59,11 +68,31 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
-def do_run_migrations(connection: Connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+# Serializes `alembic upgrade` across containers starting at the same time, the
+# later ones wait and then find nothing left to apply.
+MIGRATION_LOCK_KEY = 0x53454E53
 
-    with context.begin_transaction():
-        context.run_migrations()
+
+def do_run_migrations(connection: Connection) -> None:
+    # a session level lock, it outlives the commits of autocommit_block()
+    connection.execute(
+        text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+    )
+    connection.commit()
+    try:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        connection.execute(
+            text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+        connection.commit()
 
 
 async def run_async_migrations() -> None:
@@ -0,0 +1,42 @@
+"""version counters for the other tables of the node details
+
+Revision ID: 0b5e4a7c2d91
+Revises: 7f3c9b2d5e14
+Create Date: 2026-10-18 10:45:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = "0b5e4a7c2d91"
+down_revision: Union[str, None] = "7f3c9b2d5e14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VERSIONED_TABLES = ["locationtag", "organization", "project"]
+
+
+def upgrade() -> None:
+    op.execute(
+        "INSERT INTO table_versions (table_name) VALUES "
+        + ", ".join(f"('{table}')" for table in VERSIONED_TABLES)
+    )
+    for table in VERSIONED_TABLES:
+        op.execute(f"""CREATE TRIGGER {table}_bump_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()""")
+
+
+def downgrade() -> None:
+    for table in VERSIONED_TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_bump_version ON {table}")
+    op.execute(
+        "DELETE FROM table_versions WHERE table_name IN ("
+        + ", ".join(f"'{table}'" for table in VERSIONED_TABLES)
+        + ")"
+    )
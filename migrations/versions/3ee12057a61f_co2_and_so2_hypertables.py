@@ -0,0 +1,124 @@
+"""Co2 and So2 hypertables, rollups and storage policies
+
+Written out in full, later changes to sensors.measurements do not alter this revision.
+
+Revision ID: 3ee12057a61f
+Revises: eea97b01aa07
+Create Date: 2026-10-18 10:25:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from config import (
+    SENSOR_DATA_CHUNK_INTERVAL,
+    SENSOR_DATA_COMPRESS_AFTER,
+    SENSOR_DATA_RETENTION,
+)
+
+# revision identifiers, used by Alembic.
+revision: str = "3ee12057a61f"
+down_revision: Union[str, None] = "eea97b01aa07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HYPERTABLES = {
+    "sensor_co2_data": """
+    co2 FLOAT,""",
+    "sensor_so2_data": """
+    so2 FLOAT,""",
+}
+
+HYPERTABLE_VALUE_COLUMNS = {
+    "sensor_co2_data": ["co2"],
+    "sensor_so2_data": ["so2"],
+}
+
+# rollup: (bucket width, refresh start_offset, end_offset, schedule_interval)
+ROLLUPS = {
+    "1m": ("60 seconds", "2 hours", "1 minute", "1 minute"),
+    "1h": ("3600 seconds", "3 days", "1 hour", "30 minutes"),
+    "1d": ("86400 seconds", "30 days", "1 day", "1 hour"),
+}
+
+
+def upgrade() -> None:
+    for table, value_columns in HYPERTABLES.items():
+        op.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+    time TIMESTAMPTZ NOT NULL,
+    node_id VARCHAR(30) NOT NULL,{value_columns}
+    location VARCHAR(64) NOT NULL,
+    sensor_name VARCHAR(64) NOT NULL,
+    FOREIGN KEY (node_id) REFERENCES node(node_id)
+)""")
+        op.execute(
+            f"SELECT create_hypertable('{table}', 'time', "
+            f"chunk_time_interval => INTERVAL '{SENSOR_DATA_CHUNK_INTERVAL}', if_not_exists => TRUE)"
+        )
+        # per node time range reads
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_node_id_time_idx "
+            f"ON {table} (node_id, time DESC)"
+        )
+
+    # continuous aggregates cannot be created inside a transaction
+    with op.get_context().autocommit_block():
+        for table, columns in HYPERTABLE_VALUE_COLUMNS.items():
+            aggregates = ",\n    ".join(
+                f"min({column}) AS {column}_min, max({column}) AS {column}_max, "
+                f"avg({column}) AS {column}_avg, count({column}) AS {column}_count"
+                for column in columns
+            )
+            for rollup, (width, start_offset, end_offset, schedule) in ROLLUPS.items():
+                view = f"{table}_{rollup}"
+                op.execute(f"""CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT node_id, time_bucket(INTERVAL '{width}', time) AS bucket,
+    {aggregates}
+FROM {table}
+GROUP BY node_id, bucket
+WITH NO DATA""")
+                op.execute(f"""SELECT add_continuous_aggregate_policy('{view}',
+    start_offset => INTERVAL '{start_offset}',
+    end_offset => INTERVAL '{end_offset}',
+    schedule_interval => INTERVAL '{schedule}',
+    if_not_exists => TRUE)""")
+
+    for table in HYPERTABLES:
+        op.execute(
+            f"SELECT set_chunk_time_interval('{table}', INTERVAL '{SENSOR_DATA_CHUNK_INTERVAL}')"
+        )
+        # compression settings cannot be altered once chunks are compressed
+        op.execute(f"""DO $$
+BEGIN
+    IF NOT (
+        SELECT compression_enabled FROM timescaledb_information.hypertables
+        WHERE hypertable_name = '{table}'
+    ) THEN
+        ALTER TABLE {table} SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'node_id',
+            timescaledb.compress_orderby = 'time DESC'
+        );
+    END IF;
+END $$""")
+        op.execute(f"SELECT remove_compression_policy('{table}', if_exists => TRUE)")
+        op.execute(
+            f"SELECT add_compression_policy('{table}', "
+            f"compress_after => INTERVAL '{SENSOR_DATA_COMPRESS_AFTER}')"
+        )
+        op.execute(f"SELECT remove_retention_policy('{table}', if_exists => TRUE)")
+        if SENSOR_DATA_RETENTION:
+            op.execute(
+                f"SELECT add_retention_policy('{table}', "
+                f"drop_after => INTERVAL '{SENSOR_DATA_RETENTION}')"
+            )
+
+
+def downgrade() -> None:
+    for table in HYPERTABLES:
+        op.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
@@ -0,0 +1,138 @@
+"""metadata tables
+
+Revision ID: 49488daf4187
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+import sqlalchemy.dialects.postgresql as pg
+
+# revision identifiers, used by Alembic.
+revision: str = "49488daf4187"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped by the app before migrations existed already have these
+    # tables, only create the missing ones. Offline (--sql) mode assumes an empty database.
+    if op.get_context().as_sql:
+        existing = set()
+    else:
+        existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("uid", pg.UUID(), nullable=False),
+            sa.Column("username", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("email", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("firstname", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.Column("lastname", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.Column("phone", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.Column("is_active", sa.Boolean(), nullable=False),
+            sa.Column("is_verified", sa.Boolean(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.Column(
+                "hashed_password", sqlmodel.sql.sqltypes.AutoString(), nullable=False
+            ),
+            sa.PrimaryKeyConstraint("uid"),
+            sa.UniqueConstraint("email"),
+            sa.UniqueConstraint("username"),
+        )
+
+    if "organization" not in existing:
+        op.create_table(
+            "organization",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("headquaters", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.Column("email", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+    if "project" not in existing:
+        op.create_table(
+            "project",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column(
+                "project_name", sqlmodel.sql.sqltypes.AutoString(), nullable=False
+            ),
+            sa.Column("description", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+    if "sensor_locations" not in existing:
+        op.create_table(
+            "sensor_locations",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("location", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("country", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("city", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+    if "custodian" not in existing:
+        op.create_table(
+            "custodian",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("email", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.Column("phone", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.Column("project", sa.Integer(), nullable=True),
+            sa.Column("affiliation", sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(["affiliation"], ["organization.id"]),
+            sa.ForeignKeyConstraint(["project"], ["project.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+    if "locationtag" not in existing:
+        op.create_table(
+            "locationtag",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("location_id", sa.Integer(), nullable=False),
+            sa.Column(
+                "location_tag", sqlmodel.sql.sqltypes.AutoString(), nullable=False
+            ),
+            sa.Column("description", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.ForeignKeyConstraint(["location_id"], ["sensor_locations.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+    if "node" not in existing:
+        op.create_table(
+            "node",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("node_id", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+            sa.Column("date_registered", sa.DateTime(), nullable=False),
+            sa.Column("date_updated", sa.DateTime(), nullable=True),
+            sa.Column("custodian_id", sa.Integer(), nullable=True),
+            sa.Column("commissioned", sa.Boolean(), nullable=False),
+            sa.Column("latitude", sa.Float(), nullable=False),
+            sa.Column("longitude", sa.Float(), nullable=False),
+            sa.Column("location_id", sa.Integer(), nullable=True),
+            sa.Column("description", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+            sa.ForeignKeyConstraint(["custodian_id"], ["custodian.id"]),
+            sa.ForeignKeyConstraint(["location_id"], ["sensor_locations.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index(op.f("ix_node_node_id"), "node", ["node_id"], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_node_node_id"), table_name="node")
+    op.drop_table("node")
+    op.drop_table("locationtag")
+    op.drop_table("custodian")
+    op.drop_table("sensor_locations")
+    op.drop_table("project")
+    op.drop_table("organization")
+    op.drop_table("users")
@@ -0,0 +1,59 @@
+"""sensor data hypertables
+
+Revision ID: 5c8e06df73a7
+Revises: 6240fec5dbca
+Create Date: 2026-10-18 10:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from config import SENSOR_DATA_CHUNK_INTERVAL
+
+# revision identifiers, used by Alembic.
+revision: str = "5c8e06df73a7"
+down_revision: Union[str, None] = "6240fec5dbca"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HYPERTABLES = {
+    "sensor_PM_data": """
+    PM1 FLOAT,
+    PM2_5 FLOAT,
+    PM10 FLOAT,""",
+    "sensor_temp_humidity_data": """
+    temperature FLOAT,
+    rel_hum FLOAT,
+    abs_hum FLOAT,
+    heat_index FLOAT,""",
+}
+
+
+def upgrade() -> None:
+    # IF NOT EXISTS everywhere, the app used to create these tables on startup
+    for table, value_columns in HYPERTABLES.items():
+        op.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+    time TIMESTAMPTZ NOT NULL,
+    node_id VARCHAR(30) NOT NULL,{value_columns}
+    location VARCHAR(64) NOT NULL,
+    sensor_name VARCHAR(64) NOT NULL,
+    FOREIGN KEY (node_id) REFERENCES node(node_id)
+)""")
+        op.execute(
+            f"SELECT create_hypertable('{table}', 'time', "
+            f"chunk_time_interval => INTERVAL '{SENSOR_DATA_CHUNK_INTERVAL}', if_not_exists => TRUE)"
+        )
+        # per node time range reads
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS {table.lower()}_node_id_time_idx "
+            f"ON {table} (node_id, time DESC)"
+        )
+
+
+def downgrade() -> None:
+    for table in HYPERTABLES:
+        op.execute(f"DROP TABLE IF EXISTS {table} CASCADE")
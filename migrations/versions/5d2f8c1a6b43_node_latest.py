@@ -0,0 +1,67 @@
+"""node_latest, the newest reading per measurement and node
+
+Backfilled from the hypertables once, ingest keeps it up to date afterwards.
+
+Revision ID: 5d2f8c1a6b43
+Revises: 0b5e4a7c2d91
+Create Date: 2026-10-18 10:50:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+import sqlalchemy.dialects.postgresql as pg
+
+# revision identifiers, used by Alembic.
+revision: str = "5d2f8c1a6b43"
+down_revision: Union[str, None] = "0b5e4a7c2d91"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# measurement: (hypertable, {payload field: column}) of the hypertables that exist
+# at this revision
+MEASUREMENTS = {
+    "PM_data": ("sensor_PM_data", {"PM1": "pm1", "PM2_5": "pm2_5", "PM10": "pm10"}),
+    "temp_humidity": (
+        "sensor_temp_humidity_data",
+        {
+            "temperature": "temperature",
+            "rel_hum": "rel_hum",
+            "abs_hum": "abs_hum",
+            "heat_index": "heat_index",
+        },
+    ),
+    "Co2": ("sensor_co2_data", {"CO2": "co2"}),
+    "So2": ("sensor_so2_data", {"SO2": "so2"}),
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        "node_latest",
+        sa.Column("measurement", sa.Text(), nullable=False),
+        sa.Column("node_id", sa.Text(), nullable=False),
+        sa.Column("time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("location", sa.Text(), nullable=True),
+        sa.Column("sensor_name", sa.Text(), nullable=True),
+        sa.Column("reading", pg.JSONB(), nullable=False),
+        # /latest reads every node of one measurement
+        sa.PrimaryKeyConstraint("measurement", "node_id"),
+    )
+
+    for measurement, (table, fields) in MEASUREMENTS.items():
+        reading = ", ".join(f"'{field}', {column}" for field, column in fields.items())
+        op.execute(
+            f"""INSERT INTO node_latest (measurement, node_id, time, location, sensor_name, reading)
+SELECT DISTINCT ON (node_id) '{measurement}', node_id, time, location, sensor_name,
+    jsonb_build_object({reading})
+FROM {table}
+ORDER BY node_id, time DESC"""
+        )
+
+
+def downgrade() -> None:
+    op.drop_table("node_latest")
@@ -0,0 +1,122 @@
+"""natural unique keys for onboarding upserts, timestamptz registration dates
+
+Duplicated locations, location tags and custodians left by concurrent onboardings are
+merged into the row with the lowest id first, downgrading does not split them again.
+
+Revision ID: 6240fec5dbca
+Revises: 49488daf4187
+Create Date: 2026-10-18 10:05:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = "6240fec5dbca"
+down_revision: Union[str, None] = "49488daf4187"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNIQUE_CONSTRAINTS = [
+    (
+        "uq_sensor_locations_country_location",
+        "sensor_locations",
+        ["country", "location"],
+        {},
+    ),
+    (
+        "uq_locationtag_location_id_tag",
+        "locationtag",
+        ["location_id", "location_tag"],
+        {},
+    ),
+    (
+        "uq_custodian_name_email_phone",
+        "custodian",
+        ["name", "email", "phone"],
+        {"postgresql_nulls_not_distinct": True},
+    ),
+]
+
+# table -> (column, referencing table) pairs of foreign keys repointed to the kept row
+REFERENCES = {
+    "sensor_locations": [("location_id", "node"), ("location_id", "locationtag")],
+    "locationtag": [],
+    "custodian": [("custodian_id", "node")],
+}
+
+TIMESTAMPTZ_COLUMNS = [("node", "date_registered"), ("users", "created_at")]
+
+
+def merge_duplicates(table: str, columns: list[str], options: dict):
+    """
+    Points the references to rows that share the constraint's columns at the one with
+    the lowest id and deletes the others.
+    """
+    # rows with NULLs only collide when the constraint treats NULLs as equal
+    nulls = (
+        ""
+        if options.get("postgresql_nulls_not_distinct")
+        else " WHERE " + " AND ".join(f"{column} IS NOT NULL" for column in columns)
+    )
+    duplicates = (
+        f"SELECT id, min(id) OVER (PARTITION BY {', '.join(columns)}) AS keep "
+        f"FROM {table}{nulls}"
+    )
+    for column, referencing in REFERENCES[table]:
+        op.execute(
+            f"UPDATE {referencing} SET {column} = d.keep FROM ({duplicates}) d "
+            f"WHERE {referencing}.{column} = d.id AND d.id <> d.keep"
+        )
+    op.execute(
+        f"DELETE FROM {table} USING ({duplicates}) d "
+        f"WHERE {table}.id = d.id AND d.id <> d.keep"
+    )
+
+
+def upgrade() -> None:
+    # offline (--sql) mode cannot inspect, it assumes a database at the previous revision
+    offline = op.get_context().as_sql
+    inspector = None if offline else sa.inspect(op.get_bind())
+
+    # Tables created by the app after the models declared these already have them
+    for name, table, columns, options in UNIQUE_CONSTRAINTS:
+        existing = (
+            set()
+            if offline
+            else {c["name"] for c in inspector.get_unique_constraints(table)}
+        )
+        if name not in existing:
+            merge_duplicates(table, columns, options)
+            op.create_unique_constraint(name, table, columns, **options)
+
+    for table, column in TIMESTAMPTZ_COLUMNS:
+        timezone = not offline and next(
+            c["type"].timezone
+            for c in inspector.get_columns(table)
+            if c["name"] == column
+        )
+        if not timezone:
+            op.alter_column(
+                table,
+                column,
+                type_=sa.DateTime(timezone=True),
+                postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+            )
+
+
+def downgrade() -> None:
+    for table, column in TIMESTAMPTZ_COLUMNS:
+        op.alter_column(
+            table,
+            column,
+            type_=sa.DateTime(),
+            postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+        )
+
+    for name, table, _, _ in reversed(UNIQUE_CONSTRAINTS):
+        op.drop_constraint(name, table, type_="unique")
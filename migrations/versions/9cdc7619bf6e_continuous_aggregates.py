@@ -0,0 +1,63 @@
+"""continuous aggregate rollups of the sensor data hypertables
+
+Revision ID: 9cdc7619bf6e
+Revises: 5c8e06df73a7
+Create Date: 2026-10-18 10:15:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = "9cdc7619bf6e"
+down_revision: Union[str, None] = "5c8e06df73a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HYPERTABLE_VALUE_COLUMNS = {
+    "sensor_PM_data": ["pm1", "pm2_5", "pm10"],
+    "sensor_temp_humidity_data": ["temperature", "rel_hum", "abs_hum", "heat_index"],
+}
+
+# rollup: (bucket width, refresh start_offset, end_offset, schedule_interval)
+ROLLUPS = {
+    "1m": ("1 minute", "2 hours", "1 minute", "1 minute"),
+    "1h": ("1 hour", "3 days", "1 hour", "30 minutes"),
+    "1d": ("1 day", "30 days", "1 day", "1 hour"),
+}
+
+
+def upgrade() -> None:
+    # continuous aggregates cannot be created inside a transaction
+    with op.get_context().autocommit_block():
+        for table, columns in HYPERTABLE_VALUE_COLUMNS.items():
+            aggregates = ",\n    ".join(
+                f"min({column}) AS {column}_min, max({column}) AS {column}_max, "
+                f"avg({column}) AS {column}_avg, count({column}) AS {column}_count"
+                for column in columns
+            )
+            for rollup, (width, start_offset, end_offset, schedule) in ROLLUPS.items():
+                view = f"{table}_{rollup}".lower()
+                op.execute(f"""CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT node_id, time_bucket(INTERVAL '{width}', time) AS bucket,
+    {aggregates}
+FROM {table}
+GROUP BY node_id, bucket
+WITH NO DATA""")
+                op.execute(f"""SELECT add_continuous_aggregate_policy('{view}',
+    start_offset => INTERVAL '{start_offset}',
+    end_offset => INTERVAL '{end_offset}',
+    schedule_interval => INTERVAL '{schedule}',
+    if_not_exists => TRUE)""")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in HYPERTABLE_VALUE_COLUMNS:
+            for rollup in ROLLUPS:
+                op.execute(f"DROP MATERIALIZED VIEW IF EXISTS {table}_{rollup}".lower())
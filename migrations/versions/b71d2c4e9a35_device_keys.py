@@ -0,0 +1,45 @@
+"""device api keys
+
+Revision ID: b71d2c4e9a35
+Revises: 3ee12057a61f
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+# revision identifiers, used by Alembic.
+revision: str = "b71d2c4e9a35"
+down_revision: Union[str, None] = "3ee12057a61f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "device_keys",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("key_id", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("key_hash", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("node_id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("revoked_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["node_id"], ["node.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_device_keys_key_id"), "device_keys", ["key_id"], unique=True
+    )
+    op.create_index(
+        op.f("ix_device_keys_node_id"), "device_keys", ["node_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_device_keys_node_id"), table_name="device_keys")
+    op.drop_index(op.f("ix_device_keys_key_id"), table_name="device_keys")
+    op.drop_table("device_keys")
@@ -0,0 +1,69 @@
+"""chunk interval, compression and retention of the sensor data hypertables
+
+Applies the SENSOR_DATA_* settings in effect when the migration runs. Later changes
+are applied by sensors.storage_policies, which the entrypoint runs on every start.
+
+Revision ID: eea97b01aa07
+Revises: 9cdc7619bf6e
+Create Date: 2026-10-18 10:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from config import (
+    SENSOR_DATA_CHUNK_INTERVAL,
+    SENSOR_DATA_COMPRESS_AFTER,
+    SENSOR_DATA_RETENTION,
+)
+
+# revision identifiers, used by Alembic.
+revision: str = "eea97b01aa07"
+down_revision: Union[str, None] = "9cdc7619bf6e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HYPERTABLES = ["sensor_PM_data", "sensor_temp_humidity_data"]
+
+
+def upgrade() -> None:
+    for table in HYPERTABLES:
+        op.execute(
+            f"SELECT set_chunk_time_interval('{table}', INTERVAL '{SENSOR_DATA_CHUNK_INTERVAL}')"
+        )
+        # compression settings cannot be altered once chunks are compressed
+        op.execute(f"""DO $$
+BEGIN
+    IF NOT (
+        SELECT compression_enabled FROM timescaledb_information.hypertables
+        WHERE hypertable_name = '{table.lower()}'
+    ) THEN
+        ALTER TABLE {table} SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'node_id',
+            timescaledb.compress_orderby = 'time DESC'
+        );
+    END IF;
+END $$""")
+        op.execute(f"SELECT remove_compression_policy('{table}', if_exists => TRUE)")
+        op.execute(
+            f"SELECT add_compression_policy('{table}', "
+            f"compress_after => INTERVAL '{SENSOR_DATA_COMPRESS_AFTER}')"
+        )
+        op.execute(f"SELECT remove_retention_policy('{table}', if_exists => TRUE)")
+        if SENSOR_DATA_RETENTION:
+            op.execute(
+                f"SELECT add_retention_policy('{table}', "
+                f"drop_after => INTERVAL '{SENSOR_DATA_RETENTION}')"
+            )
+
+
+def downgrade() -> None:
+    # compression stays enabled, turning it off requires decompressing every chunk
+    for table in HYPERTABLES:
+        op.execute(f"SELECT remove_retention_policy('{table}', if_exists => TRUE)")
+        op.execute(f"SELECT remove_compression_policy('{table}', if_exists => TRUE)")
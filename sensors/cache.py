@@ -0,0 +1,57 @@
+import hashlib, logging
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from cache import TTLCache
+from config import (
+    NODE_CACHE_SIZE,
+    NODE_CACHE_TTL_SECONDS,
+    LISTING_CACHE_SIZE,
+    LISTING_CACHE_TTL_SECONDS,
+    NODE_DETAIL_CACHE_SIZE,
+    NODE_DETAIL_CACHE_TTL_SECONDS,
+    LATEST_CACHE_TTL_SECONDS,
+)
+import db
+from .models import Node
+
+logger = logging.getLogger(__name__)
+
+# node_id -> Node, or cache.MISSING for node ids known not to be registered
+node_cache = TTLCache(maxsize=NODE_CACHE_SIZE, ttl=NODE_CACHE_TTL_SECONDS)
+
+# ETag -> rendered JSON body, of a metadata listing page and of a node's details
+listing_cache = TTLCache(maxsize=LISTING_CACHE_SIZE, ttl=LISTING_CACHE_TTL_SECONDS)
+node_detail_cache = TTLCache(
+    maxsize=NODE_DETAIL_CACHE_SIZE, ttl=NODE_DETAIL_CACHE_TTL_SECONDS
+)
+# (measurement, bbox) -> rendered /latest body, briefly shared by concurrent pollers
+latest_cache = TTLCache(maxsize=1_000, ttl=LATEST_CACHE_TTL_SECONDS)
+
+
+async def warm_node_cache():
+    async with AsyncSession(db.postgres_engine, expire_on_commit=False) as session:
+        nodes = (await session.exec(select(Node).limit(NODE_CACHE_SIZE))).all()
+
+    for node in nodes:
+        node_cache.set(node.node_id, node)
+    logger.info("Node cache warmed with %d nodes", len(nodes))
+
+
+async def table_versions(tables: tuple[str, ...]) -> tuple[int, ...]:
+    """
+    Current versions of the given tables, bumped by triggers on every write to them
+    (migrations 7f3c9b2d5e14 and 0b5e4a7c2d91), so they change on all workers at once.
+    """
+    rows = await db.fetch_query(
+        "SELECT table_name, version FROM table_versions WHERE table_name = ANY($1::text[])",
+        list(tables),
+    )
+    versions = {row["table_name"]: row["version"] for row in rows}
+    return tuple(versions.get(table, 0) for table in tables)
+
+
+def versions_etag(tables: tuple[str, ...], versions: tuple[int, ...], params) -> str:
+    # same tables at the same versions and the same query -> same body
+    digest = hashlib.sha1(repr((tables, versions, params)).encode()).hexdigest()
+    return f'"{digest[:32]}"'
@@ -0,0 +1,244 @@
+import asyncio, asyncpg, logging, time
+from typing import Optional
+
+from config import (
+    INGEST_BUFFER_CAPACITY,
+    INGEST_FLUSH_ROWS,
+    INGEST_FLUSH_INTERVAL_MS,
+    INGEST_DRAIN_TIMEOUT_SECONDS,
+    INGEST_RETRY_BACKOFF_MAX_SECONDS,
+)
+from db import copy_records, run_query
+from metrics import ingest_stage_duration
+from .utils import insert_data, latest_upsert
+
+logger = logging.getLogger(__name__)
+
+# errors caused by the rows themselves, only these are worth retrying row by row
+DATA_ERRORS = (asyncpg.DataError, asyncpg.IntegrityConstraintViolationError)
+# the database is unreachable, restarting or out of connections (pool checkouts
+# time out with TimeoutError after ASYNCPG_POOL_ACQUIRE_TIMEOUT_SECONDS), the whole
+# batch is retried with backoff
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.OperatorInterventionError,
+    asyncpg.InsufficientResourcesError,
+)
+# the transaction lost a deadlock or serialization conflict with a concurrent one,
+# e.g. another worker's flush, it succeeds when retried the same way
+ROLLBACK_ERRORS = (asyncpg.TransactionRollbackError,)
+RETRY_FIRST_DELAY = 0.1
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer between the ingest endpoints and the hypertables.
+
+    Rows are (measurement, record) pairs as built by build_measurement_records.
+    A background flusher writes them in bulk once flush_rows rows are pending or
+    flush_interval_ms has passed since the first pending row, whichever comes first.
+    """
+
+    def __init__(self, capacity: int, flush_rows: int, flush_interval_ms: int):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=capacity)
+        self._flusher: Optional[asyncio.Task] = None
+        self._accepting = False
+        self.capacity = capacity
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+
+        self.rows_enqueued = 0
+        self.rows_rejected = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.flush_retries = 0
+        self.flushes = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.flush_seconds_last = 0.0
+
+    @property
+    def accepting(self) -> bool:
+        return self._accepting
+
+    @property
+    def flushing(self) -> bool:
+        return self._flusher is not None and not self._flusher.done()
+
+    def start(self):
+        self._accepting = True
+        self._flusher = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float):
+        """
+        Stop accepting rows and wait for the pending ones to be flushed.
+        """
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                "Ingest buffer drain timed out, %d rows dropped", self._queue.qsize()
+            )
+
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+
+    def put(self, rows: list) -> bool:
+        """
+        Enqueue all rows of a payload or none of them. Returns False when the buffer is full.
+        """
+        if not self._accepting or self.capacity - self._queue.qsize() < len(rows):
+            self.rows_rejected += len(rows)
+            return False
+
+        for row in rows:
+            self._queue.put_nowait(row)
+        self.rows_enqueued += len(rows)
+        return True
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_rows:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._flush(batch)
+            except Exception:
+                # keep flushing the following batches
+                self.rows_failed += len(batch)
+                logger.exception("Could not flush %d rows, dropped them", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: list):
+        start = time.perf_counter()
+        records_by_table = {}
+        for measurement, record in batch:
+            if measurement.table not in records_by_table:
+                records_by_table[measurement.table] = (measurement.columns, [])
+            records_by_table[measurement.table][1].append(record)
+
+        attempt = 0
+        while True:
+            try:
+                # node_latest is upserted in the same transaction as the hypertable rows
+                upsert = latest_upsert(batch)
+                await copy_records(records_by_table, [upsert] if upsert else [])
+                self.rows_flushed += len(batch)
+                break
+            except DATA_ERRORS as e:
+                # One bad row (e.g. an unregistered node_id) aborts the whole COPY,
+                # fall back to row by row inserts so only the bad rows are lost.
+                logger.warning(
+                    "Bulk flush of %d rows failed (%s), retrying row by row",
+                    len(batch),
+                    e,
+                )
+                await self._insert_rows(batch)
+                break
+            except CONNECTION_ERRORS + ROLLBACK_ERRORS as e:
+                # the rows are fine but the database is out of reach or the write
+                # conflicted, keep them and retry. Meanwhile the buffer fills up and
+                # ingest answers 503.
+                delay = min(
+                    RETRY_FIRST_DELAY * 2**attempt, INGEST_RETRY_BACKOFF_MAX_SECONDS
+                )
+                attempt += 1
+                self.flush_retries += 1
+                logger.warning(
+                    "Bulk flush of %d rows failed (%s), retry %d in %.1fs",
+                    len(batch),
+                    e,
+                    attempt,
+                    delay,
+                )
+                await asyncio.sleep(delay)
+
+        elapsed = time.perf_counter() - start
+        ingest_stage_duration.labels("db_write").observe(elapsed)
+        self.flushes += 1
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_last = elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    async def _insert_rows(self, batch: list):
+        failed = 0
+        inserted = []
+        for measurement, record in batch:
+            try:
+                await insert_data(measurement, record)
+                inserted.append((measurement, record))
+                self.rows_flushed += 1
+            except Exception:
+                failed += 1
+        if failed:
+            self.rows_failed += failed
+            logger.warning("Dropped %d rows that could not be inserted", failed)
+
+        try:
+            upsert = latest_upsert(inserted)
+            if upsert is not None:
+                await run_query(upsert[0], *upsert[1])
+        except Exception as e:
+            logger.warning("Could not update node_latest: %s", e)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "capacity": self.capacity,
+            "rows_enqueued": self.rows_enqueued,
+            "rows_rejected": self.rows_rejected,
+            "rows_flushed": self.rows_flushed,
+            "rows_failed": self.rows_failed,
+            "flush_retries": self.flush_retries,
+            "flushes": self.flushes,
+            "flush_seconds_last": self.flush_seconds_last,
+            "flush_seconds_max": self.flush_seconds_max,
+            "flush_seconds_avg": (
+                self.flush_seconds_total / self.flushes if self.flushes else 0.0
+            ),
+        }
+
+
+ingest_buffer: Optional[IngestBuffer] = None
+
+
+async def start_ingest_buffer():
+    global ingest_buffer
+    ingest_buffer = IngestBuffer(
+        capacity=INGEST_BUFFER_CAPACITY,
+        flush_rows=INGEST_FLUSH_ROWS,
+        flush_interval_ms=INGEST_FLUSH_INTERVAL_MS,
+    )
+    ingest_buffer.start()
+
+
+async def stop_ingest_buffer():
+    global ingest_buffer
+    if ingest_buffer is not None:
+        await ingest_buffer.stop(drain_timeout=INGEST_DRAIN_TIMEOUT_SECONDS)
+        ingest_buffer = None
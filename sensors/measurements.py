@@ -0,0 +1,206 @@
+import datetime, operator
+from typing import Generic, Optional, TypeVar
+from typing_extensions import TypedDict
+from pydantic import AwareDatetime, BaseModel, create_model
+
+from .models import PMDATA, Temp_Humidity, CO2DATA, SO2DATA
+
+# Continuous aggregates kept for every measurement, finest first,
+# with the bucket width and refresh policy of each rollup.
+sensor_data_rollups = {
+    "1m": {
+        "width": datetime.timedelta(minutes=1),
+        "start_offset": "2 hours",
+        "end_offset": "1 minute",
+        "schedule_interval": "1 minute",
+    },
+    "1h": {
+        "width": datetime.timedelta(hours=1),
+        "start_offset": "3 days",
+        "end_offset": "1 hour",
+        "schedule_interval": "30 minutes",
+    },
+    "1d": {
+        "width": datetime.timedelta(days=1),
+        "start_offset": "30 days",
+        "end_offset": "1 day",
+        "schedule_interval": "1 hour",
+    },
+}
+
+ValuesT = TypeVar("ValuesT", bound=BaseModel)
+
+
+class SensorReading(BaseModel, Generic[ValuesT]):
+    values: ValuesT
+    sensor_name: str
+
+
+class Measurement:
+    """
+    A kind of sensor reading: its key under `sensordata` in ingest payloads, the
+    pydantic model validating its values and the hypertable storing them.
+    Columns, the insert statement and the row builder are derived once, here.
+    """
+
+    def __init__(self, name: str, model: type[BaseModel], table: str):
+        self.name = name
+        self.model = model
+        self.table = table
+        # payload names of the values, in column order
+        self.fields = tuple(model.model_fields)
+        # unquoted identifiers in the DDL are folded to lower case
+        self.value_columns = tuple(field.lower() for field in self.fields)
+        self.columns = (
+            "time",
+            "node_id",
+            *self.value_columns,
+            "location",
+            "sensor_name",
+        )
+        placeholders = ", ".join(f"${i}" for i in range(1, len(self.columns) + 1))
+        self.insert_sql = (
+            f"INSERT INTO {table} ({', '.join(self.columns)}) VALUES ({placeholders})"
+        )
+        getter = operator.attrgetter(*self.fields)
+        self._values = getter if len(self.fields) > 1 else lambda v: (getter(v),)
+
+    def build_record(
+        self,
+        time: datetime.datetime,
+        node_id: str,
+        location: str,
+        reading: SensorReading,
+    ) -> tuple:
+        """
+        Row ordered as columns from a reading validated by the ingest envelope model.
+        """
+        return (
+            time,
+            node_id,
+            *self._values(reading.values),
+            location,
+            reading.sensor_name,
+        )
+
+    def rollup_view(self, rollup: str) -> str:
+        return f"{self.table}_{rollup}".lower()
+
+    def table_ddl(self, chunk_interval: str) -> list[str]:
+        values = "".join(f"\n    {column} FLOAT," for column in self.value_columns)
+        return [
+            f"""CREATE TABLE IF NOT EXISTS {self.table} (
+    time TIMESTAMPTZ NOT NULL,
+    node_id VARCHAR(30) NOT NULL,{values}
+    location VARCHAR(64) NOT NULL,
+    sensor_name VARCHAR(64) NOT NULL,
+    FOREIGN KEY (node_id) REFERENCES node(node_id)
+)""",
+            f"SELECT create_hypertable('{self.table}', 'time', "
+            f"chunk_time_interval => INTERVAL '{chunk_interval}', if_not_exists => TRUE)",
+            # per node time range reads
+            f"CREATE INDEX IF NOT EXISTS {self.table.lower()}_node_id_time_idx "
+            f"ON {self.table} (node_id, time DESC)",
+        ]
+
+    def rollup_ddl(self) -> list[str]:
+        """
+        Continuous aggregates and their refresh policies. These cannot run inside a transaction.
+        """
+        aggregates = ",\n    ".join(
+            f"min({column}) AS {column}_min, max({column}) AS {column}_max, "
+            f"avg({column}) AS {column}_avg, count({column}) AS {column}_count"
+            for column in self.value_columns
+        )
+        statements = []
+        for rollup, options in sensor_data_rollups.items():
+            view = self.rollup_view(rollup)
+            width = int(options["width"].total_seconds())
+            statements.append(f"""CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+SELECT node_id, time_bucket(INTERVAL '{width} seconds', time) AS bucket,
+    {aggregates}
+FROM {self.table}
+GROUP BY node_id, bucket
+WITH NO DATA""")
+            statements.append(f"""SELECT add_continuous_aggregate_policy('{view}',
+    start_offset => INTERVAL '{options["start_offset"]}',
+    end_offset => INTERVAL '{options["end_offset"]}',
+    schedule_interval => INTERVAL '{options["schedule_interval"]}',
+    if_not_exists => TRUE)""")
+        return statements
+
+    def storage_policy_ddl(
+        self, chunk_interval: str, compress_after: str, retention: str
+    ) -> list[str]:
+        statements = [
+            f"SELECT set_chunk_time_interval('{self.table}', INTERVAL '{chunk_interval}')",
+            # compression settings cannot be altered once chunks are compressed
+            f"""DO $$
+BEGIN
+    IF NOT (
+        SELECT compression_enabled FROM timescaledb_information.hypertables
+        WHERE hypertable_name = '{self.table.lower()}'
+    ) THEN
+        ALTER TABLE {self.table} SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'node_id',
+            timescaledb.compress_orderby = 'time DESC'
+        );
+    END IF;
+END $$""",
+            f"SELECT remove_compression_policy('{self.table}', if_exists => TRUE)",
+            f"SELECT add_compression_policy('{self.table}', "
+            f"compress_after => INTERVAL '{compress_after}')",
+            f"SELECT remove_retention_policy('{self.table}', if_exists => TRUE)",
+        ]
+        if retention:
+            statements.append(
+                f"SELECT add_retention_policy('{self.table}', "
+                f"drop_after => INTERVAL '{retention}')"
+            )
+        return statements
+
+
+# measurement name -> Measurement. Adding a sensor type means registering it here
+# and adding a migration with its table, rollup and storage policy DDL written out.
+measurements: dict[str, Measurement] = {}
+_envelope_model: Optional[type[BaseModel]] = None
+
+
+def register_measurement(name: str, model: type[BaseModel], table: str) -> Measurement:
+    global _envelope_model
+    measurement = Measurement(name, model, table)
+    measurements[name] = measurement
+    _envelope_model = None
+    return measurement
+
+
+def envelope_model() -> type[BaseModel]:
+    """
+    Request model of an ingest payload. Each registered measurement is an optional
+    key of `sensordata` whose values validate straight into the measurement's model,
+    unknown keys are ignored. Timestamps must carry a UTC offset, naive ones are
+    rejected. Rebuilt after a measurement is registered.
+    """
+    global _envelope_model
+    if _envelope_model is None:
+        sensordata = TypedDict(
+            "SensorData",
+            {name: SensorReading[m.model] for name, m in measurements.items()},
+            total=False,
+        )
+        _envelope_model = create_model(
+            "SensorDataEnvelope",
+            timestamp=(AwareDatetime, ...),
+            node_id=(str, ...),
+            location=(str, ...),
+            sensordata=(sensordata, ...),
+        )
+    return _envelope_model
+
+
+register_measurement("PM_data", PMDATA, "sensor_PM_data")
+register_measurement("temp_humidity", Temp_Humidity, "sensor_temp_humidity_data")
+register_measurement("Co2", CO2DATA, "sensor_co2_data")
+register_measurement("So2", SO2DATA, "sensor_so2_data")
@@ -3,7 +3,7 @@ import datetime
 
 # from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from sqlmodel import SQLModel, Column, DateTime, func, Field, JSON
+from sqlmodel import SQLModel, Column, DateTime, func, Field, JSON, UniqueConstraint
 
 
 # Project metadata models
@@ -16,7 +16,8 @@ class Node(SQLModel, table=True):
     # application_mode: int | None = Field(default=None, index=True)
     # date_registered: datetime = Field(default_factory=lambda: datetime.now())
     date_registered: datetime.datetime = Field(
-        default=datetime.datetime.now(datetime.timezone.utc),
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc),
+        sa_type=DateTime(timezone=True),
     )
     date_updated: Optional[datetime.datetime] = Field(
         sa_column=Column(DateTime(), onupdate=func.now(datetime.timezone.utc))
@@ -31,6 +32,11 @@ class Node(SQLModel, table=True):
 
 class Location(SQLModel, table=True):
     __tablename__ = "sensor_locations"
+    __table_args__ = (
+        UniqueConstraint(
+            "country", "location", name="uq_sensor_locations_country_location"
+        ),
+    )
     id: int = Field(default=None, primary_key=True)
     location: str
     country: str
@@ -38,6 +44,11 @@ class Location(SQLModel, table=True):
 
 
 class LocationTag(SQLModel, table=True):
+    __table_args__ = (
+        UniqueConstraint(
+            "location_id", "location_tag", name="uq_locationtag_location_id_tag"
+        ),
+    )
     id: int = Field(default=None, primary_key=True)
     location_id: int = Field(foreign_key="sensor_locations.id")
     location_tag: str = Field(default=None)
@@ -45,6 +56,15 @@ class LocationTag(SQLModel, table=True):
 
 
 class Custodian(SQLModel, table=True):  # ? This can be a user group
+    __table_args__ = (
+        UniqueConstraint(
+            "name",
+            "email",
+            "phone",
+            name="uq_custodian_name_email_phone",
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
     id: int | None = Field(default=None, primary_key=True)
     name: str
     email: str | None
@@ -66,6 +86,50 @@ class Project(SQLModel, table=True):
     description: str | None
 
 
+# Node details response, built by sensors.utils.NODE_DETAIL_QUERY
+class OrganizationDetail(BaseModel):
+    id: int
+    name: str
+    headquaters: str | None
+    email: str | None
+
+
+class ProjectDetail(BaseModel):
+    id: int
+    project_name: str
+    description: str | None
+
+
+class CustodianDetail(BaseModel):
+    id: int
+    name: str
+    email: str | None
+    phone: str | None
+    organization: OrganizationDetail | None
+    project: ProjectDetail | None
+
+
+class LocationDetail(BaseModel):
+    id: int
+    location: str
+    country: str
+    city: str | None
+    tags: list[str]
+
+
+class NodeDetail(BaseModel):
+    id: int
+    node_id: str
+    date_registered: datetime.datetime
+    date_updated: datetime.datetime | None
+    commissioned: bool
+    latitude: float
+    longitude: float
+    description: str | None
+    location: LocationDetail | None
+    custodian: CustodianDetail | None
+
+
 # Sensor Data Model(s)
 # class SensorData(SQLModel):
 #     # timestamp: datetime
@@ -101,5 +165,13 @@ class Temp_Humidity(BaseModel):
     heat_index: float | None = None
 
 
+class CO2DATA(BaseModel):
+    CO2: float | None = None
+
+
+class SO2DATA(BaseModel):
+    SO2: float | None = None
+
+
 class ParticulateMatterData(SensorData):
     value: dict = Field(sa_column=Column(JSON), default={})
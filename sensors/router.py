@@ -1,15 +1,83 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import Annotated
-from .models import Node, Location, LocationTag, Custodian, PMDATA, Temp_Humidity
-from .utils import insert_data, generate_insert_query, delete_none_values
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import Annotated, Awaitable, Callable
+import asyncio, bisect, datetime, json, logging, uuid
+from .models import Node, Location, LocationTag, Custodian, NodeDetail
+from . import ingest
+from .stream import StreamFull, broker
+from .spatial import IndexedNode, node_index
+from .cache import (
+    node_cache,
+    latest_cache,
+    listing_cache,
+    node_detail_cache,
+    versions_etag,
+    table_versions,
+)
+from .measurements import Measurement, measurements
+from .utils import (
+    build_measurement_records,
+    decode_measurement_records,
+    readings_query,
+    aggregates_query,
+    parse_bucket,
+    pick_rollup,
+    encode_cursor,
+    decode_cursor,
+    as_utc,
+    nodes_query,
+    locations_query,
+    node_detail,
+    NODE_DETAIL_QUERY,
+    latest_query,
+    latest_upsert,
+    parse_bbox,
+)
 from sqlmodel import select
-from db import get_session, sensor_data_hypertables
+from auth.dependencies import AccessTokenBearer, DeviceKeyHeader
+from auth.device_keys import issue_device_key, list_device_keys, revoke_device_key
+from auth.models import User
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from cache import MISSING, TTLCache
+from metrics import ingest_stage_duration, timed
+from config import (
+    NODE_CACHE_NEGATIVE_TTL_SECONDS,
+    INGEST_BATCH_MAX_ITEMS,
+    INGEST_BATCH_MAX_BYTES,
+    STREAM_KEEPALIVE_SECONDS,
+    LISTING_MAX_LIMIT,
+    READINGS_MAX_LIMIT,
+    AGGREGATES_MAX_BUCKETS,
+)
+from db import (
+    SessionDep,
+    copy_records,
+    stream_query,
+    fetch_query,
+)
+
+logger = logging.getLogger(__name__)
 
 sensors_router = APIRouter()
 
+# node_id of the device key a request is sent with
+DeviceNodeDep = Annotated[str, Depends(DeviceKeyHeader())]
+OptionalDeviceNodeDep = Annotated[
+    str | None, Depends(DeviceKeyHeader(auto_error=False))
+]
+# access token claims of a signed in user
+UserTokenDep = Annotated[dict, Depends(AccessTokenBearer())]
+OptionalUserTokenDep = Annotated[
+    dict | None, Depends(AccessTokenBearer(auto_error=False))
+]
+
 
 @sensors_router.get("/register-node/")
 async def register_node(
+    session: SessionDep,
+    user_token: OptionalUserTokenDep,
+    device_node_id: OptionalDeviceNodeDep,
     node_id: str = "",
     sensor_application: str = "stationary",
     lat: float = 0,
@@ -24,282 +92,825 @@ async def register_node(
     software_version: str = "",
     project_name="",
 ):
+    """
+    Registers a node and returns a device key for it that is shown only once. Needs
+    a signed in admin, or the custodian registering a node of their own. Nodes
+    re-registering themselves authenticate with their own device key instead,
+    device_key is null for already registered nodes.
+    """
     #  Check if node is registered
-    custodian_id = None
-    registered_location = None
-    registered_node = await get_node(node_id)
-    print(registered_node)
-    if registered_node is None:
-        # register node
-
-        # 1. Check if location exists or create it
-        if location is not "":
-            registered_location = get_location(country, location)
-            print()
-            print("Fetched Location")
-            print(registered_location)
-            print()
-
-            if not registered_location:
-                locale = Location(country=country, city=city, location=location)
-                locale = create_sensor_location(locale)
-                registered_location = locale
-                print()
-                print("Auto registered")
-                print(locale)
-                print()
-
-            # 2. Check if location_tag exists or create it
-            if location_tag is not "":
-                registered_loc_tag = get_location_tag(location_tag)
-                if not registered_loc_tag:
-                    locale_tag = LocationTag(
-                        location_id=registered_location.id, location_tag=location_tag
-                    )
-                    locale_tag = create_location_tag(locale_tag)
-
-        else:
+    registered_node = await get_node(session, node_id)
+    if device_node_id != node_id:
+        if user_token is None:
             raise HTTPException(
-                status=400, detail="Location and geolocation coordinates are required"
+                status_code=403,
+                detail="An access token or a device key of this node is required",
             )
+        if registered_node is None:
+            await authorize_custodian(session, user_token, custodian_email)
+        else:
+            await authorize_node_access(session, user_token, registered_node)
 
-        # 3. Check if custodian exists or create one
-        if custodian_name is not "" and (
-            custodian_email is not "" or custodian_phone is not ""
-        ):  # no point of registering a custodian if there is no contact details
-
-            registered_custodian = get_custodian(
-                custodian_name, custodian_email, custodian_phone
+    device_key = None
+    if registered_node is None:
+        if location == "":
+            raise HTTPException(
+                status_code=400,
+                detail="Location and geolocation coordinates are required",
             )
 
-            if registered_custodian is None:
-                new_custodian = Custodian(
-                    name=custodian_name, email=custodian_email, phone=custodian_phone
-                )
-                new_custodian = register_custodian(new_custodian)
-                custodian_id = new_custodian.id
-
-        # 4. Register node
-        new_node = Node(
+        # register node together with its location, location tag and custodian
+        registered_node, device_key = await onboard_node(
+            session,
             node_id=node_id,
-            custodian_id=custodian_id,
-            latitude=lat,
-            longitude=long,
-            location_id=registered_location.id,
+            lat=lat,
+            long=long,
+            country=country,
+            location=location,
+            city=city,
+            location_tag=location_tag,
+            custodian_name=custodian_name,
+            custodian_email=custodian_email,
+            custodian_phone=custodian_phone,
         )
-        new_node = register_node(new_node)
-        registered_node = new_node
 
     # # ? so what if node is already in the database but location or custodian is not
 
-    print(registered_node)
+    logger.debug("Node %s registered", node_id, extra={"sampled": True})
+
+    return {
+        "registered": "OK",
+        "node_details": registered_node,
+        "device_key": device_key,
+    }
+
+
+# a node's details are built from these, a write to any of them changes its ETag
+NODE_DETAIL_TABLES = (
+    "node",
+    "sensor_locations",
+    "locationtag",
+    "custodian",
+    "organization",
+    "project",
+)
+
+
+@sensors_router.get("/node/{node_id}", response_model=NodeDetail)
+async def node_details(node_id: str, request: Request):
+    """
+    A node with its location, location tags, custodian and the custodian's
+    organization and project. Answers 304 when If-None-Match carries the current ETag.
+    """
+
+    async def render() -> bytes:
+        rows = await fetch_query(NODE_DETAIL_QUERY, node_id)
+        if not rows:
+            raise HTTPException(status_code=404, detail="Node not found")
+        return node_detail(rows[0]).model_dump_json().encode()
+
+    return await versioned_response(
+        request, NODE_DETAIL_TABLES, node_id, node_detail_cache, render
+    )
+
 
-    return {"registered": "OK", "node_details": registered_node}
+@sensors_router.get("/nodes")
+async def get_nodes(
+    request: Request,
+    country: str | None = None,
+    city: str | None = None,
+    commissioned: bool | None = None,
+    custodian: str | None = None,
+    limit: Annotated[int, Query(gt=0, le=LISTING_MAX_LIMIT)] = 100,
+    cursor: int | None = None,
+):
+    """
+    Nodes in registration order with their location and custodian, optionally
+    filtered. Pass the returned next_cursor to fetch the following page, it is null
+    on the last one. Answers 304 when If-None-Match carries the current ETag.
+    """
+    filters = {
+        "l.country": country,
+        "l.city": city,
+        "n.commissioned": commissioned,
+        "c.name": custodian,
+    }
+    query, args = nodes_query(filters, cursor, limit)
+    return await versioned_response(
+        request,
+        ("node", "sensor_locations", "custodian"),
+        (query, args),
+        listing_cache,
+        lambda: render_listing("nodes", query, args, limit),
+    )
 
 
-@sensors_router.get("/node/{node_id}")
-async def node_details(node_id: str):
-    node = await get_node(node_id)
-    # print(node)
+@sensors_router.get("/locations")
+async def get_locations(
+    request: Request,
+    country: str | None = None,
+    city: str | None = None,
+    limit: Annotated[int, Query(gt=0, le=LISTING_MAX_LIMIT)] = 100,
+    cursor: int | None = None,
+):
+    """
+    Locations in id order, paginated and cached like /nodes.
+    """
+    query, args = locations_query({"l.country": country, "l.city": city}, cursor, limit)
+    return await versioned_response(
+        request,
+        ("sensor_locations",),
+        (query, args),
+        listing_cache,
+        lambda: render_listing("locations", query, args, limit),
+    )
+
+
+@sensors_router.get("/nodes/near")
+async def nodes_near(
+    lat: Annotated[float, Query(ge=-90, le=90)],
+    long: Annotated[float, Query(ge=-180, le=180)],
+    radius_km: Annotated[float, Query(gt=0, le=20_000)] = 10,
+    limit: Annotated[int, Query(gt=0, le=LISTING_MAX_LIMIT)] = 100,
+):
+    """
+    Nodes within radius_km of (lat, long), nearest first, from the in-memory node index.
+    """
+    nodes = [
+        {
+            "node_id": node.node_id,
+            "latitude": node.latitude,
+            "longitude": node.longitude,
+            "distance_km": round(distance, 3),
+        }
+        for node, distance in node_index.near(lat, long, radius_km, limit)
+    ]
+    return {"nodes": nodes}
+
+
+@sensors_router.get("/nodes/within")
+async def nodes_within(
+    bbox: str,
+    limit: Annotated[int, Query(gt=0, le=LISTING_MAX_LIMIT)] = 100,
+    cursor: str | None = None,
+):
+    """
+    Nodes within bbox ("min_lon,min_lat,max_lon,max_lat") in node_id order, from the
+    in-memory node index. Pass the returned next_cursor to fetch the following page.
+    """
+    try:
+        box = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    found = node_index.within(*box)
+    if cursor is not None:
+        found = found[bisect.bisect_right([node.node_id for node in found], cursor) :]
+    page = found[:limit]
+    return {
+        "nodes": [node._asdict() for node in page],
+        "next_cursor": page[-1].node_id if len(found) > limit else None,
+    }
+
+
+async def authorize_custodian(
+    session: SessionDep, user_token: dict, custodian_email: str | None
+):
+    """
+    Lets admins through, and verified users whose email is custodian_email. Everyone
+    else gets a 403. Signups are open and do not confirm emails, so the email of an
+    unverified user proves nothing.
+    """
+    user = await session.get(User, uuid.UUID(user_token["user"]["uid"]))
+    if user is not None and user.is_active:
+        if user.is_admin:
+            return
+        if (
+            user.is_verified
+            and custodian_email
+            and user.email.casefold() == custodian_email.casefold()
+        ):
+            return
+    raise HTTPException(
+        status_code=403, detail="Only the node's custodian or an admin can do this"
+    )
+
+
+async def authorize_node_access(session: SessionDep, user_token: dict, node: Node):
+    custodian = None
+    if node.custodian_id is not None:
+        custodian = await session.get(Custodian, node.custodian_id)
+    await authorize_custodian(
+        session, user_token, custodian.email if custodian is not None else None
+    )
+
+
+@sensors_router.post("/nodes/{node_id}/keys", status_code=201)
+async def create_node_key(node_id: str, session: SessionDep, user_token: UserTokenDep):
+    """
+    Issues an additional device key for a node, e.g. to rotate a leaked one.
+    The key is shown only once. Only the node's custodian and admins manage its keys.
+    """
+    node = await get_node(session, node_id)
     if node is None:
-        return HTTPException(status_code=404, detail="Node not found")
+        raise HTTPException(status_code=404, detail="Node not found")
+    await authorize_node_access(session, user_token, node)
 
-    return await node_metadata(node)
+    key_id, key = await issue_device_key(session, node.id)
+    await session.commit()
+    logger.info("Issued device key %s for node %s", key_id, node_id)
+    return {"node_id": node_id, "key_id": key_id, "device_key": key}
 
 
-@sensors_router.get("/nodes")
-async def get_nodes():
-    return get_nodes()
-
-
-sensors_router.add_api_route("/locations", endpoint=lambda: get_all_locations())
-
-
-@sensors_router.post("/push-sensor-data")
-async def post_data(data: dict):
-    # headers = request.headers
-    # print()
-    # print("Received headers")
-    # for header in headers:
-    #     print(f"{header} : {headers[header]}")
-    print()
-    print("Received post data")
-    print(data)
-
-    # ? check if sensordata key is part of the object
-
-    measurements = data["sensordata"].keys()
-    for measurement in measurements:
-        match (measurement):
-            case "PM_data":
-                pm_values = data["sensordata"][measurement]["values"]
-                pm_data = PMDATA(
-                    **pm_values
-                )  # validate #? create custom validator to show keys mismatch with model
-                min_data = delete_none_values(pm_values)
-                min_data["time"] = data["timestamp"]
-                min_data["node_id"] = data["node_id"]
-                min_data["location"] = data["location"]
-                min_data["sensor_name"] = data["sensordata"][measurement]["sensor_name"]
-                query_stmt = generate_insert_query(
-                    min_data, sensor_data_hypertables["PM_data"]
-                )
-                await insert_data(query_stmt)
-            case "temp_humidity":
-                temp_values = data["sensordata"][measurement]["values"]
-                temp_data = Temp_Humidity(
-                    **temp_values
-                )  # validate #? create custom validator to show keys mismatch with model
-                min_data = delete_none_values(temp_values)
-                min_data["time"] = data["timestamp"]
-                min_data["node_id"] = data["node_id"]
-                min_data["location"] = data["location"]
-                min_data["sensor_name"] = data["sensordata"][measurement]["sensor_name"]
-                query_stmt = generate_insert_query(
-                    min_data, sensor_data_hypertables["temp_humidity"]
-                )
-                await insert_data(query_stmt)
-            case _:
-                print("Could not find predifined measurement")
-
-    # await insert_data(data)
-    # print("body")
-    # body = await request.json()
-    # print(body)
-
-    # await insert_data(body)
+@sensors_router.get("/nodes/{node_id}/keys")
+async def get_node_keys(node_id: str, session: SessionDep, user_token: UserTokenDep):
+    node = await get_node(session, node_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    await authorize_node_access(session, user_token, node)
+
+    return [
+        {
+            "key_id": key.key_id,
+            "created_at": key.created_at,
+            "revoked_at": key.revoked_at,
+        }
+        for key in await list_device_keys(session, node.id)
+    ]
+
+
+@sensors_router.delete("/nodes/{node_id}/keys/{key_id}")
+async def delete_node_key(
+    node_id: str, key_id: str, session: SessionDep, user_token: UserTokenDep
+):
+    node = await get_node(session, node_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail="Node not found")
+    await authorize_node_access(session, user_token, node)
+
+    if not await revoke_device_key(session, node.id, key_id):
+        raise HTTPException(status_code=404, detail="No active key with that key_id")
+    logger.info("Revoked device key %s of node %s", key_id, node_id)
+    return {"revoked": key_id}
+
+
+@sensors_router.get("/nodes/{node_id}/readings")
+async def node_readings(
+    node_id: str,
+    measurement: str,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+    limit: Annotated[int, Query(gt=0, le=READINGS_MAX_LIMIT)] = 1000,
+    cursor: str | None = None,
+):
+    """
+    Readings of one measurement for a node, newest first. Pass the returned next_cursor
+    to fetch the following page, it is null once the range is exhausted.
+    """
+    registered = measurements.get(measurement)
+    if registered is None:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown measurement {measurement}"
+        )
 
-    return {"received_data": "OK"}
+    start, end = as_utc(start), as_utc(end)
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=422, detail="start must be before end")
 
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-async def node_metadata(node: Node):
-    stmt = select(Node, Location, Custodian).where(
-        node.custodian_id == Custodian.id and node.location_id == Location.id
+    query, args = readings_query(registered, node_id, start, end, after, limit)
+    return StreamingResponse(
+        stream_readings(registered, query, args, limit),
+        media_type="application/json",
     )
 
-    # session = Session(engine)
-    session = next(get_session())
-    node_info = session.exec(stmt).all()
-    session.close()
-    node_info = [dict(row._mapping) for row in node_info]
 
-    # all() returns a list of rows. #!! all() should of course return a list containing only one row otherwise there are duplicate entries in the database
-    return node_info[0]
+@sensors_router.get("/nodes/{node_id}/aggregates")
+async def node_aggregates(
+    node_id: str,
+    measurement: str,
+    bucket: str = "1h",
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+):
+    """
+    Per bucket min/max/avg/count of a measurement for a node, served from the coarsest
+    continuous aggregate that can build buckets of the requested width.
+    Defaults to the last 1000 buckets.
+    """
+    registered = measurements.get(measurement)
+    if registered is None:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown measurement {measurement}"
+        )
 
+    try:
+        width = parse_bucket(bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
-# getters like
+    rollup = pick_rollup(width)
+    if rollup is None:
+        raise HTTPException(
+            status_code=422,
+            detail=f"No rollup can build {bucket} buckets, use /readings for raw data",
+        )
 
+    end = as_utc(end) or datetime.datetime.now(datetime.timezone.utc)
+    try:
+        start = as_utc(start) or end - width * 1000
+    except OverflowError:
+        raise HTTPException(
+            status_code=422, detail="end is too early for a default start"
+        )
+    if start >= end:
+        raise HTTPException(status_code=422, detail="start must be before end")
+    if (end - start) / width > AGGREGATES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Range spans more than {AGGREGATES_MAX_BUCKETS} buckets, use a wider bucket",
+        )
 
-def get_nodes(
-    offset: int = 0,
-    limit: Annotated[int, Query(le=100)] = 100,
-) -> list[Node]:
-    # session = Session(engine)
-    session = next(get_session())
-    Nodes = session.exec(select(Node).offset(offset).limit(limit)).all()
-    return Nodes
+    query, args = aggregates_query(registered, rollup, node_id, width, start, end)
+    rows = await fetch_query(query, *args)
+
+    aggregates = [
+        {
+            "time": row["time"].isoformat(),
+            **{
+                field: {
+                    "min": row[f"{column}_min"],
+                    "max": row[f"{column}_max"],
+                    "avg": row[f"{column}_avg"],
+                    "count": row[f"{column}_count"],
+                }
+                for column, field in zip(registered.value_columns, registered.fields)
+            },
+        }
+        for row in rows
+    ]
+    return {
+        "node_id": node_id,
+        "measurement": measurement,
+        "bucket": bucket,
+        "rollup": rollup,
+        "aggregates": aggregates,
+    }
+
+
+@sensors_router.get("/latest")
+async def latest_readings(measurement: str, bbox: str | None = None):
+    """
+    Most recent reading of a measurement of every node, or of the nodes within bbox
+    ("min_lon,min_lat,max_lon,max_lat"). Served from node_latest, which ingest keeps
+    up to date, so the hypertables are not scanned.
+    """
+    registered = measurements.get(measurement)
+    if registered is None:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown measurement {measurement}"
+        )
 
+    try:
+        box = parse_bbox(bbox) if bbox is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    key = (measurement, box)
+    body = latest_cache.get(key)
+    if body is None:
+        query, args = latest_query(registered, box)
+        readings = [
+            {
+                "node_id": row["node_id"],
+                "time": row["time"].isoformat(),
+                "latitude": row["latitude"],
+                "longitude": row["longitude"],
+                "location": row["location"],
+                "sensor_name": row["sensor_name"],
+                **json.loads(row["reading"]),
+            }
+            for row in await fetch_query(query, *args)
+        ]
+        body = json.dumps({"measurement": measurement, "readings": readings}).encode()
+        latest_cache.set(key, body)
+
+    return Response(body, media_type="application/json")
+
+
+@sensors_router.post("/push-sensor-data", status_code=202)
+async def post_data(request: Request, device_node_id: DeviceNodeDep):
+    """
+    Validates the payload and hands its rows to the ingest buffer, which writes them
+    to the hypertables in the background. Nodes can only push their own readings.
+
+    The body is validated straight from the raw bytes against the envelope model of
+    sensors.measurements, instead of letting FastAPI decode it into dicts first.
+    """
+    body = await request.body()
+    try:
+        with timed(ingest_stage_duration, stage="validate"):
+            records = decode_measurement_records(body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid payload: {e}")
+
+    # records start with (time, node_id)
+    if any(record[1] != device_node_id for _, record in records):
+        raise HTTPException(
+            status_code=403, detail="node_id does not match the device key"
+        )
 
-async def get_node(node_id) -> Node:
-    print(node_id)
-    # session = Session(engine)
-    session = next(get_session())
-    stmt = select(Node).where(Node.node_id == node_id)
-    result = session.exec(stmt).all()
-    session.close()
-    if len(result) > 1:
-        print("Result has more than one node")
-        for node in result:
-            print(node)
-        # Probably alert admin about this
-        return None
+    buffer = ingest.ingest_buffer
+    with timed(ingest_stage_duration, stage="enqueue"):
+        enqueued = buffer is not None and buffer.put(records)
+    if not enqueued:
+        raise HTTPException(
+            status_code=503,
+            detail="Ingest buffer is full, please retry later",
+            headers={"Retry-After": "1"},
+        )
 
-    elif not result:
-        return None
+    broker.publish(records)
+    return {"received_data": "OK"}
 
-    return result[0]
+
+StreamFilter = Annotated[list[str], Query()]
 
 
-def get_location(country, location) -> Location:
-    # session = Session(engine)
-    session = next(get_session())
-    stmt = select(Location).where(
-        Location.country == country and Location.location == location
+def unknown_measurements(names: list[str]) -> list[str]:
+    return [name for name in names if name not in measurements]
+
+
+@sensors_router.websocket("/stream")
+async def stream_websocket(
+    websocket: WebSocket,
+    node_id: StreamFilter = [],
+    location: StreamFilter = [],
+    measurement: StreamFilter = [],
+):
+    """
+    Sends every accepted reading matching the filters as a JSON text message. Each
+    filter may be repeated, readings match any of its values, an absent one matches all.
+    """
+    if unknown_measurements(measurement):
+        await websocket.close(code=1008, reason="Unknown measurement")
+        return
+    try:
+        subscription = broker.subscribe(set(node_id), set(location), set(measurement))
+    except StreamFull:
+        await websocket.close(code=1013, reason="Too many subscribers")
+        return
+
+    async def forward():
+        while True:
+            await websocket.send_text(await subscription.get())
+
+    try:
+        await websocket.accept()
+        sender = asyncio.create_task(forward())
+        try:
+            # incoming messages are ignored, this only waits for the client to leave
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            sender.cancel()
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@sensors_router.get("/stream/sse")
+async def stream_sse(
+    node_id: StreamFilter = [],
+    location: StreamFilter = [],
+    measurement: StreamFilter = [],
+):
+    """
+    Server-sent events variant of /stream, one event per reading and a comment line
+    every STREAM_KEEPALIVE_SECONDS so proxies keep the connection open.
+    """
+    unknown = unknown_measurements(measurement)
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown measurement {unknown[0]}")
+    try:
+        subscription = broker.subscribe(set(node_id), set(location), set(measurement))
+    except StreamFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many stream subscribers, please retry later",
+            headers={"Retry-After": "5"},
+        )
+
+    async def events():
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        subscription.get(), STREAM_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {data}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    # also unsubscribes when the client leaves before the first event
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(broker.unsubscribe, subscription),
     )
-    result = session.exec(stmt).all()
-    session.close()
-    if not result:
-        return None
-    return result[0]
 
 
-def get_location_tag(tag) -> LocationTag:
-    # session = Session(engine)
-    session = next(get_session())
-    stmt = select(LocationTag).where(LocationTag.location_tag == tag)
-    result = session.exec(stmt).all()
-    session.close()
-    if not result:
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """
+    The request body, or a 413 as soon as it turns out longer than max_bytes: before
+    reading from Content-Length, for chunked bodies while reading.
+    """
+    too_large = HTTPException(
+        status_code=413, detail=f"Request body is larger than {max_bytes} bytes"
+    )
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+@sensors_router.post("/push-sensor-data/batch")
+async def post_data_batch(request: Request, device_node_id: DeviceNodeDep):
+    """
+    Accepts an array of up to INGEST_BATCH_MAX_ITEMS payloads in the /push-sensor-data
+    shape and writes all valid readings with one COPY per hypertable inside a single
+    transaction. Payloads of other nodes than the one of the device key are rejected.
+    """
+    body = await read_body(request, INGEST_BATCH_MAX_BYTES)
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid JSON: {e}")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=422, detail="Expected an array of payloads")
+    if len(data) > INGEST_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {INGEST_BATCH_MAX_ITEMS} payloads per batch",
+        )
+
+    items = []
+    records_by_table = {}
+    accepted_records = []
+
+    for index, item in enumerate(data):
+        status = {"index": index, "node_id": None, "status": "accepted"}
+        items.append(status)
+        try:
+            status["node_id"] = item["node_id"]
+            with timed(ingest_stage_duration, stage="validate"):
+                records = build_measurement_records(item)
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            status["status"] = "rejected"
+            status["detail"] = f"Invalid payload: {e}"
+            continue
+
+        if item["node_id"] != device_node_id:
+            status["status"] = "rejected"
+            status["detail"] = "node_id does not match the device key"
+            continue
+
+        accepted_records.extend(records)
+        for measurement, record in records:
+            if measurement.table not in records_by_table:
+                records_by_table[measurement.table] = (measurement.columns, [])
+            records_by_table[measurement.table][1].append(record)
+
+    if records_by_table:
+        try:
+            upsert = latest_upsert(accepted_records)
+            with timed(ingest_stage_duration, stage="db_write"):
+                await copy_records(records_by_table, [upsert])
+        except Exception as e:
+            logger.error("Could not write a sensor data batch: %s", e)
+            for status in items:
+                if status["status"] == "accepted":
+                    status["status"] = "rejected"
+                    status["detail"] = "Could not write readings to the database"
+
+    accepted = sum(1 for status in items if status["status"] == "accepted")
+    if accepted:
+        broker.publish(accepted_records)
+    return {
+        "received_data": "OK",
+        "accepted": accepted,
+        "rejected": len(items) - accepted,
+        "items": items,
+    }
+
+
+async def stream_readings(measurement: Measurement, query: str, args: list, limit: int):
+    fields = measurement.fields
+    count = 0
+    last = None
+    chunk = []
+    yield '{"readings": ['
+    async for row in stream_query(query, *args):
+        values = list(row.values())
+        reading = {
+            "time": row["time"].isoformat(),
+            "sensor_name": row["sensor_name"],
+            "location": row["location"],
+            **dict(zip(fields, values[3:])),
+        }
+        chunk.append(json.dumps(reading))
+        count += 1
+        last = row
+        if len(chunk) == 500:
+            yield ("," if count > len(chunk) else "") + ",".join(chunk)
+            chunk = []
+
+    if chunk:
+        yield ("," if count > len(chunk) else "") + ",".join(chunk)
+
+    next_cursor = None
+    if count == limit:
+        next_cursor = encode_cursor(last["time"], last["sensor_name"])
+    yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+
+async def versioned_response(
+    request: Request,
+    tables: tuple[str, ...],
+    params,
+    cache: TTLCache,
+    render: Callable[[], Awaitable[bytes]],
+) -> Response:
+    """
+    Serves the JSON body render builds from the given tables, keyed by an ETag of
+    their versions and params. Unchanged responses cost one lookup of the versions:
+    a 304 if the client has the body already, the cached body otherwise.
+    """
+    versions = await table_versions(tables)
+    etag = versions_etag(tables, versions, params)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    body = cache.get(etag)
+    if body is None:
+        body = await render()
+        cache.set(etag, body)
+
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def render_listing(name: str, query: str, args: list, limit: int) -> bytes:
+    rows = [dict(row) for row in await fetch_query(query, *args)]
+    next_cursor = rows[-1]["id"] if len(rows) == limit else None
+    return json.dumps(
+        {name: rows, "next_cursor": next_cursor},
+        default=lambda value: value.isoformat(),
+    ).encode()
+
+
+# getters like
+
+
+async def get_node(session: SessionDep, node_id) -> Node:
+    cached = node_cache.get(node_id)
+    if cached is MISSING:
         return None
-    return result[0]
+    elif cached is not None:
+        return cached
 
+    stmt = select(Node).where(Node.node_id == node_id)
+    result = (await session.exec(stmt)).all()
+    if len(result) > 1:
+        logger.error("Found %d nodes with node_id %s", len(result), node_id)
+        # Probably alert admin about this
+        return None
 
-def get_custodian(name, email, phone) -> Custodian:
-    # session = Session(engine)
-    session = next(get_session())
-    stmt = select(Custodian).where(
-        Custodian.name == name and Custodian.email == email or Custodian.phone == phone
-    )
-    result = session.exec(stmt).all()
-    session.close()
-    if not result:
+    elif not result:
+        node_cache.set(node_id, MISSING, ttl=NODE_CACHE_NEGATIVE_TTL_SECONDS)
         return None
+
+    node_cache.set(node_id, result[0])
     return result[0]
 
 
-def get_all_locations(
-    offset: int = 0, limit: Annotated[int, Query(le=100)] = 100
-) -> list[Location]:
-    # session = Session(engine)
-    session = next(get_session())
-    Locations = session.exec(select(Location).offset(offset).limit(limit)).all()
-    return Locations
+# setters like
 
 
-# setters like
+async def onboard_node(
+    session: SessionDep,
+    node_id: str,
+    lat: float,
+    long: float,
+    country: str,
+    location: str,
+    city: str,
+    location_tag: str,
+    custodian_name: str,
+    custodian_email: str,
+    custodian_phone: str,
+) -> tuple[Node, str | None]:
+    """
+    Registers a node and upserts its location, location tag and custodian in a single
+    transaction. Concurrent onboardings sharing a location or custodian resolve to the
+    same rows through the natural unique keys instead of creating duplicates.
+    Returns the node and a newly issued device key for it, None when a concurrent
+    registration inserted the node first.
+    """
+    try:
+        location_id = await upsert_location(session, country, location, city)
+
+        if location_tag != "":
+            await upsert_location_tag(session, location_id, location_tag)
+
+        custodian_id = None
+        if custodian_name != "" and (
+            custodian_email != "" or custodian_phone != ""
+        ):  # no point of registering a custodian if there is no contact details
+            custodian_id = await upsert_custodian(
+                session, custodian_name, custodian_email, custodian_phone
+            )
 
+        node, created = await create_node(
+            session,
+            Node(
+                node_id=node_id,
+                custodian_id=custodian_id,
+                latitude=lat,
+                longitude=long,
+                location_id=location_id,
+            ),
+        )
+        device_key = None
+        if created:
+            _, device_key = await issue_device_key(session, node.id)
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+
+    node_cache.set(node.node_id, node)
+    node_index.add(IndexedNode(node.node_id, node.latitude, node.longitude))
+    return node, device_key
+
+
+async def upsert_location(session: SessionDep, country, location, city) -> int:
+    stmt = pg_insert(Location).values(country=country, location=location, city=city)
+    # DO UPDATE (rather than DO NOTHING) so RETURNING also yields the existing row
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_sensor_locations_country_location",
+        set_={"location": stmt.excluded.location},
+    ).returning(Location.id)
+    return (await session.execute(stmt)).scalar_one()
+
+
+async def upsert_location_tag(session: SessionDep, location_id, tag) -> int:
+    stmt = pg_insert(LocationTag).values(location_id=location_id, location_tag=tag)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_locationtag_location_id_tag",
+        set_={"location_tag": stmt.excluded.location_tag},
+    ).returning(LocationTag.id)
+    return (await session.execute(stmt)).scalar_one()
+
+
+async def upsert_custodian(session: SessionDep, name, email, phone) -> int:
+    stmt = pg_insert(Custodian).values(name=name, email=email, phone=phone)
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_custodian_name_email_phone",
+        set_={"name": stmt.excluded.name},
+    ).returning(Custodian.id)
+    return (await session.execute(stmt)).scalar_one()
+
+
+async def create_node(session: SessionDep, node: Node) -> tuple[Node, bool]:
+    """
+    Inserts the node unless a concurrent registration got there first, in which case
+    the existing row is returned. The flag tells whether the row was inserted by this
+    call. Does not commit.
+    """
+    values = node.model_dump(exclude={"id", "date_updated"})
+    stmt = (
+        pg_insert(Node)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=["node_id"])
+        .returning(Node)
+    )
+    created = (await session.execute(stmt)).scalars().first()
+    # DO NOTHING returns no row on conflict, so a returned row is always a new one
+    if created is not None:
+        return created, True
 
-def register_node(node: Node) -> Node:
-    session = next(get_session())
-    # session = Session(engine)
-    session.add(node)
-    session.commit()
-    session.refresh(node)
-    return node
-
-
-def create_sensor_location(location: Location) -> Location:
-    # session = Session(engine)
-    session = next(get_session())
-    session.add(location)
-    session.commit()
-    session.refresh(location)
-    return location
-
-
-def create_location_tag(tag: LocationTag) -> LocationTag:
-    # session = Session(engine)
-    session = next(get_session())
-    session.add(tag)
-    session.commit()
-    session.refresh(tag)
-    return tag
-
-
-def register_custodian(custodian: Custodian) -> Custodian:
-    # session = Session(engine)
-    session = next(get_session())
-    session.add(custodian)
-    session.commit()
-    session.refresh(custodian)
-    return custodian
+    stmt = select(Node).where(Node.node_id == node.node_id)
+    return (await session.exec(stmt)).one(), False
@@ -0,0 +1,191 @@
+import asyncio, logging, math, time
+from typing import NamedTuple
+
+from config import NODE_INDEX_CELL_DEGREES, NODE_INDEX_REFRESH_SECONDS
+from db import fetch_query
+from .cache import table_versions
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class IndexedNode(NamedTuple):
+    node_id: str
+    latitude: float
+    longitude: float
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # haversine
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class NodeIndex:
+    """
+    Coordinates of all registered nodes in a grid of cell_degrees sized cells, so
+    /nodes/near and /nodes/within only look at the cells their area overlaps.
+    Rebuilt from the node table whenever its version changes, checked every
+    refresh_interval. Nodes registered by this worker are added at once.
+    """
+
+    def __init__(self, cell_degrees: float, refresh_interval: float):
+        self.cell_degrees = cell_degrees
+        self.refresh_interval = refresh_interval
+        self.lat_cells = math.ceil(180 / cell_degrees)
+        self.lon_cells = math.ceil(360 / cell_degrees)
+        self._cells: dict[tuple[int, int], list[IndexedNode]] = {}
+        self._nodes: dict[str, IndexedNode] = {}
+        self._version: tuple[int, ...] | None = None
+        self._refresher: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def _lat_cell(self, latitude: float) -> int:
+        return min(
+            max(int((latitude + 90) // self.cell_degrees), 0), self.lat_cells - 1
+        )
+
+    def _lon_cell(self, longitude: float) -> int:
+        return int((longitude + 180) // self.cell_degrees) % self.lon_cells
+
+    def build(self, nodes: list[IndexedNode]):
+        cells: dict[tuple[int, int], list[IndexedNode]] = {}
+        for node in nodes:
+            cell = (self._lat_cell(node.latitude), self._lon_cell(node.longitude))
+            cells.setdefault(cell, []).append(node)
+        # swapped in whole, requests never see a half built index
+        self._cells = cells
+        self._nodes = {node.node_id: node for node in nodes}
+
+    def add(self, node: IndexedNode):
+        previous = self._nodes.get(node.node_id)
+        if previous is not None:
+            cell = (
+                self._lat_cell(previous.latitude),
+                self._lon_cell(previous.longitude),
+            )
+            self._cells[cell].remove(previous)
+        cell = (self._lat_cell(node.latitude), self._lon_cell(node.longitude))
+        self._cells.setdefault(cell, []).append(node)
+        self._nodes[node.node_id] = node
+
+    def _candidates(self, lat_range: range, lon_range: list[int]):
+        # a wide area can span more cells than there are occupied ones
+        if len(lat_range) * len(lon_range) > len(self._cells):
+            lon_cells = set(lon_range)
+            for (lat_cell, lon_cell), nodes in self._cells.items():
+                if lat_cell in lat_range and lon_cell in lon_cells:
+                    yield from nodes
+            return
+        for lat_cell in lat_range:
+            for lon_cell in lon_range:
+                yield from self._cells.get((lat_cell, lon_cell), ())
+
+    def within(
+        self, min_lon: float, min_lat: float, max_lon: float, max_lat: float
+    ) -> list[IndexedNode]:
+        """
+        Nodes within the bounding box, in node_id order.
+        """
+        lat_range = range(self._lat_cell(min_lat), self._lat_cell(max_lat) + 1)
+        if max_lon - min_lon >= 360:
+            lon_range = list(range(self.lon_cells))
+        else:
+            first = int((min_lon + 180) // self.cell_degrees)
+            last = int((max_lon + 180) // self.cell_degrees)
+            lon_range = [cell % self.lon_cells for cell in range(first, last + 1)]
+        return sorted(
+            (
+                node
+                for node in self._candidates(lat_range, lon_range)
+                if min_lat <= node.latitude <= max_lat
+                and min_lon <= node.longitude <= max_lon
+            ),
+            key=lambda node: node.node_id,
+        )
+
+    def near(
+        self, latitude: float, longitude: float, radius_km: float, limit: int
+    ) -> list[tuple[IndexedNode, float]]:
+        """
+        Up to limit (node, distance in km) pairs within radius_km, nearest first.
+        """
+        lat_delta = radius_km / KM_PER_DEGREE
+        lat_range = range(
+            self._lat_cell(latitude - lat_delta),
+            self._lat_cell(latitude + lat_delta) + 1,
+        )
+        # meridians converge, the box widens towards the poles and covers them whole
+        cos_lat = math.cos(math.radians(min(abs(latitude) + lat_delta, 90)))
+        lon_delta = 360 if cos_lat < 1e-9 else lat_delta / cos_lat
+        if lon_delta >= 180:
+            lon_range = list(range(self.lon_cells))
+        else:
+            first = int((longitude - lon_delta + 180) // self.cell_degrees)
+            last = int((longitude + lon_delta + 180) // self.cell_degrees)
+            lon_range = [cell % self.lon_cells for cell in range(first, last + 1)]
+
+        found = []
+        for node in self._candidates(lat_range, lon_range):
+            distance = distance_km(latitude, longitude, node.latitude, node.longitude)
+            if distance <= radius_km:
+                found.append((node, distance))
+        found.sort(key=lambda pair: pair[1])
+        return found[:limit]
+
+    async def refresh(self):
+        versions = await table_versions(("node",))
+        if versions == self._version:
+            return
+        start = time.perf_counter()
+        rows = await fetch_query("SELECT node_id, latitude, longitude FROM node")
+        self.build([IndexedNode(*row) for row in rows])
+        self._version = versions
+        logger.info(
+            "Node index rebuilt with %d nodes in %.3fs",
+            len(rows),
+            time.perf_counter() - start,
+        )
+
+    def start(self):
+        self._refresher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                # keep serving the last built index
+                logger.warning("Could not refresh the node index: %s", e)
+
+
+node_index = NodeIndex(
+    cell_degrees=NODE_INDEX_CELL_DEGREES, refresh_interval=NODE_INDEX_REFRESH_SECONDS
+)
+
+
+async def start_node_index():
+    await node_index.refresh()
+    node_index.start()
+
+
+async def stop_node_index():
+    await node_index.stop()
@@ -0,0 +1,59 @@
+"""
+Applies the SENSOR_DATA_* chunk interval, compression and retention settings to the
+hypertables of all registered measurements. Every statement is idempotent and the
+policies are replaced, so changed settings take effect on the next start. The Docker
+entrypoint runs it after `alembic upgrade head`.
+
+    python -m sensors.storage_policies
+"""
+
+import asyncio, logging
+import asyncpg
+
+from config import (
+    TIMESCALE_DB_CONNECTION,
+    SENSOR_DATA_CHUNK_INTERVAL,
+    SENSOR_DATA_COMPRESS_AFTER,
+    SENSOR_DATA_RETENTION,
+)
+from logs import configure_logging, stop_logging
+from .measurements import measurements
+
+logger = logging.getLogger(__name__)
+
+# the key of migrations/env.py, containers starting together apply them one at a time
+POLICY_LOCK_KEY = 0x53454E53
+
+
+async def sync_storage_policies():
+    conn = await asyncpg.connect(TIMESCALE_DB_CONNECTION)
+    try:
+        await conn.execute("SELECT pg_advisory_lock($1)", POLICY_LOCK_KEY)
+        try:
+            for measurement in measurements.values():
+                for statement in measurement.storage_policy_ddl(
+                    SENSOR_DATA_CHUNK_INTERVAL,
+                    SENSOR_DATA_COMPRESS_AFTER,
+                    SENSOR_DATA_RETENTION,
+                ):
+                    await conn.execute(statement)
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", POLICY_LOCK_KEY)
+    finally:
+        await conn.close()
+    logger.info(
+        "Storage policies of %d hypertables synced (chunks %s, compress after %s,"
+        " retention %s)",
+        len(measurements),
+        SENSOR_DATA_CHUNK_INTERVAL,
+        SENSOR_DATA_COMPRESS_AFTER,
+        SENSOR_DATA_RETENTION or "none",
+    )
+
+
+if __name__ == "__main__":
+    configure_logging()
+    try:
+        asyncio.run(sync_storage_policies())
+    finally:
+        stop_logging()
@@ -0,0 +1,290 @@
+import asyncio, json, logging, os, uuid
+from typing import NamedTuple, Optional
+import asyncpg
+
+from config import (
+    STREAM_QUEUE_SIZE,
+    STREAM_MAX_SUBSCRIBERS,
+    STREAM_PG_NOTIFY,
+    STREAM_NOTIFY_INTERVAL_MS,
+    TIMESCALE_DB_CONNECTION,
+)
+from db import server_settings
+from metrics import stream_subscribers, stream_events_dropped
+from .measurements import Measurement
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "sensor_readings"
+# pg_notify payloads must stay below 8000 bytes
+NOTIFY_PAYLOAD_LIMIT = 7_900
+# backoff between reconnects of the relay connection
+RECONNECT_FIRST_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30
+# an idle relay checks its connection this often
+IDLE_CHECK_SECONDS = 30
+
+
+class ReadingEvent(NamedTuple):
+    measurement: str
+    node_id: str
+    location: str
+    data: str  # the JSON sent to subscribers, rendered once per reading
+
+
+def reading_event(measurement: Measurement, record: tuple) -> ReadingEvent:
+    # records are (time, node_id, *values, location, sensor_name)
+    data = {
+        "measurement": measurement.name,
+        "node_id": record[1],
+        "time": record[0].isoformat(),
+        "location": record[-2],
+        "sensor_name": record[-1],
+        **dict(zip(measurement.fields, record[2:-2])),
+    }
+    return ReadingEvent(measurement.name, record[1], record[-2], json.dumps(data))
+
+
+class Subscription:
+    """
+    Readings of the given node ids, locations and measurements (empty for any) waiting
+    to be sent to one client. When the client falls behind by more than maxsize
+    readings the oldest ones are dropped, publishing never waits for a subscriber.
+    """
+
+    def __init__(
+        self,
+        node_ids: set[str],
+        locations: set[str],
+        measurements: set[str],
+        maxsize: int,
+    ):
+        self.node_ids = node_ids
+        self.locations = locations
+        self.measurements = measurements
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def matches(self, event: ReadingEvent) -> bool:
+        return (
+            (not self.node_ids or event.node_id in self.node_ids)
+            and (not self.locations or event.location in self.locations)
+            and (not self.measurements or event.measurement in self.measurements)
+        )
+
+    def offer(self, data: str):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+            stream_events_dropped.inc()
+        self._queue.put_nowait(data)
+
+    async def get(self) -> str:
+        return await self._queue.get()
+
+
+class StreamFull(Exception):
+    pass
+
+
+class ReadingBroker:
+    """
+    In-process fan-out of accepted readings to the /stream subscribers of this worker.
+    With a relay, readings are also passed on to, and received from, the other workers.
+    """
+
+    def __init__(self, queue_size: int, max_subscribers: int):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: set[Subscription] = set()
+        self.relay: Optional["NotifyRelay"] = None
+
+    def subscribe(
+        self, node_ids: set[str], locations: set[str], measurements: set[str]
+    ) -> Subscription:
+        if len(self._subscribers) >= self.max_subscribers:
+            raise StreamFull()
+        subscription = Subscription(
+            node_ids, locations, measurements, maxsize=self.queue_size
+        )
+        self._subscribers.add(subscription)
+        stream_subscribers.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscribers:
+            self._subscribers.remove(subscription)
+            stream_subscribers.dec()
+
+    def publish(self, records: list[tuple[Measurement, tuple]]):
+        """
+        Hands the (measurement, record) pairs of accepted readings to the subscribers.
+        """
+        if not self._subscribers and self.relay is None:
+            return
+        events = [reading_event(measurement, record) for measurement, record in records]
+        self.deliver(events)
+        if self.relay is not None:
+            self.relay.send(events)
+
+    def deliver(self, events: list[ReadingEvent]):
+        for subscription in self._subscribers:
+            for event in events:
+                if subscription.matches(event):
+                    subscription.offer(event.data)
+
+
+class NotifyRelay:
+    """
+    Passes readings between the workers (and containers) sharing a database through
+    Postgres LISTEN/NOTIFY, on a connection of its own. Readings are sent in batches
+    every interval, a worker ignores its own notifications. A lost connection is
+    re-established with backoff, readings relayed meanwhile are dropped.
+    """
+
+    def __init__(self, broker: ReadingBroker, interval: float, max_pending: int):
+        self.broker = broker
+        self.interval = interval
+        self.max_pending = max_pending
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._pending: list[ReadingEvent] = []
+        self._conn: Optional[asyncpg.Connection] = None
+        self._sender: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self._connect()
+        self._sender = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._sender is not None:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+        await self._disconnect()
+
+    async def _connect(self):
+        conn = await asyncpg.connect(
+            TIMESCALE_DB_CONNECTION, server_settings=server_settings
+        )
+        await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+        conn.add_termination_listener(self._on_terminate)
+        self._conn = conn
+
+    async def _disconnect(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.remove_termination_listener(self._on_terminate)
+            try:
+                await conn.close(timeout=5)
+            except Exception:
+                conn.terminate()
+
+    def _on_terminate(self, connection):
+        if connection is self._conn:
+            logger.warning("Stream relay connection lost, reconnecting")
+            self._conn = None
+
+    @property
+    def connected(self) -> bool:
+        return self._conn is not None and not self._conn.is_closed()
+
+    def send(self, events: list[ReadingEvent]):
+        room = self.max_pending - len(self._pending)
+        if room < len(events):
+            stream_events_dropped.inc(len(events) - max(room, 0))
+        self._pending.extend(events[: max(room, 0)])
+
+    async def _run(self):
+        attempt = 0
+        idle = 0.0
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.connected:
+                # readings of other workers are missed until then, drop ours too
+                # rather than sending a burst of stale ones
+                stream_events_dropped.inc(len(self._pending))
+                self._pending = []
+                try:
+                    await self._disconnect()
+                    await self._connect()
+                    logger.info("Stream relay reconnected")
+                    attempt = 0
+                except Exception as e:
+                    delay = min(RECONNECT_FIRST_DELAY * 2**attempt, RECONNECT_MAX_DELAY)
+                    attempt += 1
+                    logger.warning(
+                        "Could not reconnect the stream relay (%s), retrying in %.1fs",
+                        e,
+                        delay,
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+
+            if not self._pending:
+                # a connection that silently went away is only noticed when used
+                idle += self.interval
+                if idle >= IDLE_CHECK_SECONDS:
+                    idle = 0.0
+                    try:
+                        await self._conn.execute("SELECT 1")
+                    except Exception as e:
+                        logger.warning("Stream relay connection failed: %s", e)
+                        await self._disconnect()
+                continue
+
+            idle = 0.0
+            pending, self._pending = self._pending, []
+            try:
+                for payload in self._payloads(pending):
+                    await self._conn.execute(
+                        "SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, payload
+                    )
+            except Exception as e:
+                stream_events_dropped.inc(len(pending))
+                logger.warning("Could not relay %d readings: %s", len(pending), e)
+                await self._disconnect()
+
+    def _payloads(self, events: list[ReadingEvent]):
+        # origin, then one event per line
+        payload = self.origin
+        for event in events:
+            line = "\n" + json.dumps(event)
+            if len(line) + len(self.origin) > NOTIFY_PAYLOAD_LIMIT:
+                continue  # cannot be relayed
+            if len(payload) + len(line) > NOTIFY_PAYLOAD_LIMIT:
+                yield payload
+                payload = self.origin
+            payload += line
+        if payload != self.origin:
+            yield payload
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        origin, _, lines = payload.partition("\n")
+        if origin == self.origin:
+            return
+        self.broker.deliver(
+            [ReadingEvent(*json.loads(line)) for line in lines.split("\n")]
+        )
+
+
+broker = ReadingBroker(
+    queue_size=STREAM_QUEUE_SIZE, max_subscribers=STREAM_MAX_SUBSCRIBERS
+)
+
+
+async def start_stream_relay():
+    if STREAM_PG_NOTIFY:
+        broker.relay = NotifyRelay(
+            broker,
+            interval=STREAM_NOTIFY_INTERVAL_MS / 1000,
+            max_pending=STREAM_QUEUE_SIZE * 10,
+        )
+        await broker.relay.start()
+
+
+async def stop_stream_relay():
+    if broker.relay is not None:
+        await broker.relay.stop()
+        broker.relay = None
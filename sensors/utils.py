@@ -1,47 +1,383 @@
+import base64, datetime, json, re
+from pydantic import BaseModel
+
+from config import INGEST_JSON_DECODER
 from db import run_query
+from metrics import sensor_rows_inserted
+from .measurements import Measurement, envelope_model, measurements, sensor_data_rollups
+from .models import (
+    CustodianDetail,
+    LocationDetail,
+    NodeDetail,
+    OrganizationDetail,
+    ProjectDetail,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if INGEST_JSON_DECODER not in ("pydantic", "orjson"):
+    raise ValueError(f"Unknown INGEST_JSON_DECODER {INGEST_JSON_DECODER}")
+if INGEST_JSON_DECODER == "orjson" and orjson is None:
+    raise ImportError("INGEST_JSON_DECODER is orjson but orjson is not installed")
+
+
+def as_utc(time: datetime.datetime | None) -> datetime.datetime | None:
+    # naive timestamps in query parameters are taken to be UTC
+    if time is not None and time.tzinfo is None:
+        return time.replace(tzinfo=datetime.timezone.utc)
+    return time
+
+
+def encode_cursor(time: datetime.datetime, sensor_name: str) -> str:
+    raw = json.dumps([time.isoformat(), sensor_name]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, str]:
+    """
+    Raises ValueError for cursors that were not produced by encode_cursor.
+    """
+    try:
+        time, sensor_name = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.datetime.fromisoformat(time), str(sensor_name)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+async def insert_data(measurement: Measurement, record: tuple):
+    await run_query(measurement.insert_sql, *record)
+    sensor_rows_inserted.labels(measurement.table).inc()
+
+
+def envelope_records(envelope: BaseModel) -> list[tuple[Measurement, tuple]]:
+    """
+    (measurement, record) pairs of a validated payload, values ordered as in measurement.columns.
+    """
+    return [
+        (
+            measurements[name],
+            measurements[name].build_record(
+                envelope.timestamp, envelope.node_id, envelope.location, reading
+            ),
+        )
+        for name, reading in envelope.sensordata.items()
+    ]
+
+
+def build_measurement_records(data: dict) -> list[tuple[Measurement, tuple]]:
+    """
+    Validate an already decoded sensor data payload and build one record per measurement.
+    """
+    return envelope_records(envelope_model().model_validate(data))
+
+
+def decode_measurement_records(body: bytes) -> list[tuple[Measurement, tuple]]:
+    """
+    Validate a raw JSON request body and build one record per measurement, without
+    going through intermediate dicts unless INGEST_JSON_DECODER is orjson.
+    Raises ValueError (pydantic's ValidationError or a JSON decode error) for bad payloads.
+    """
+    if INGEST_JSON_DECODER == "orjson":
+        return envelope_records(envelope_model().model_validate(orjson.loads(body)))
+    return envelope_records(envelope_model().model_validate_json(body))
+
+
+# Newest reading per measurement and node, kept up to date by every ingest flush.
+# Readings arriving out of order never replace a newer one.
+NODE_LATEST_UPSERT = """INSERT INTO node_latest (measurement, node_id, time, location, sensor_name, reading)
+SELECT measurement, node_id, time, location, sensor_name, reading::jsonb
+FROM unnest($1::text[], $2::text[], $3::timestamptz[], $4::text[], $5::text[], $6::text[])
+    AS latest(measurement, node_id, time, location, sensor_name, reading)
+ON CONFLICT (measurement, node_id) DO UPDATE
+SET time = EXCLUDED.time, location = EXCLUDED.location,
+    sensor_name = EXCLUDED.sensor_name, reading = EXCLUDED.reading
+WHERE node_latest.time < EXCLUDED.time"""
+
+
+def latest_upsert(records) -> tuple[str, tuple] | None:
+    """
+    (query, args) upserting the newest of the given (measurement, record) pairs per
+    measurement and node into node_latest, None when there are no pairs.
+    """
+    latest = {}
+    for measurement, record in records:
+        key = (measurement.name, record[1])
+        # naive and aware timestamps do not compare, naive ones are taken to be UTC
+        time = as_utc(record[0])
+        if key not in latest or latest[key][0] < time:
+            latest[key] = (time, measurement, record)
+    if not latest:
+        return None
+
+    args = ([], [], [], [], [], [])
+    # Rows are upserted, and so locked, in array order. Sorted, concurrent flushes of
+    # several workers lock shared rows in the same order and cannot deadlock.
+    for (name, node_id), (time, measurement, record) in sorted(latest.items()):
+        # records are (time, node_id, *values, location, sensor_name)
+        reading = dict(zip(measurement.fields, record[2:-2]))
+        for column, value in zip(
+            args, (name, node_id, time, record[-2], record[-1], json.dumps(reading))
+        ):
+            column.append(value)
+    return NODE_LATEST_UPSERT, args
+
+
+def latest_query(
+    measurement: Measurement, bbox: tuple[float, float, float, float] | None
+) -> tuple[str, list]:
+    """
+    Latest reading of every node for a measurement, optionally only of the nodes
+    within bbox (min longitude, min latitude, max longitude, max latitude).
+    """
+    args = [measurement.name]
+    conditions = ["l.measurement = $1"]
+    if bbox is not None:
+        args.extend(bbox)
+        conditions.append("n.longitude BETWEEN $2 AND $4")
+        conditions.append("n.latitude BETWEEN $3 AND $5")
+
+    query = f"""SELECT l.node_id, l.time, l.location, l.sensor_name, l.reading,
+    n.latitude, n.longitude
+    FROM node_latest l
+    JOIN node n ON n.node_id = l.node_id
+    WHERE {" AND ".join(conditions)}
+    ORDER BY l.node_id"""
+    return query, args
+
+
+def parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    """
+    Parses "min_lon,min_lat,max_lon,max_lat". Raises ValueError for anything else.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise ValueError(
+            f"Invalid bbox {bbox}, expected min_lon,min_lat,max_lon,max_lat"
+        ) from None
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError(f"Invalid bbox {bbox}, minimum above maximum")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def readings_query(
+    measurement: Measurement,
+    node_id: str,
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+    after: tuple[datetime.datetime, str] | None,
+    limit: int,
+) -> tuple[str, list]:
+    """
+    Keyset paginated query over a measurement hypertable, newest first.
+    Pages continue strictly after the (time, sensor_name) of the previous page's last row.
+    """
+    conditions = ["node_id = $1"]
+    args = [node_id]
+    if start is not None:
+        args.append(start)
+        conditions.append(f"time >= ${len(args)}")
+    if end is not None:
+        args.append(end)
+        conditions.append(f"time < ${len(args)}")
+    if after is not None:
+        args.extend(after)
+        conditions.append(f"(time, sensor_name) < (${len(args) - 1}, ${len(args)})")
+    args.append(limit)
+
+    query = f"""SELECT time, sensor_name, location, {", ".join(measurement.value_columns)}
+    FROM {measurement.table}
+    WHERE {" AND ".join(conditions)}
+    ORDER BY time DESC, sensor_name DESC
+    LIMIT ${len(args)}"""
+    return query, args
+
+
+BUCKET_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+BUCKET_MAX_WIDTH = datetime.timedelta(days=366)
+
+
+def parse_bucket(bucket: str) -> datetime.timedelta:
+    """
+    Parses bucket widths like 15m, 1h or 7d, up to BUCKET_MAX_WIDTH. Raises ValueError
+    for anything else.
+    """
+    match = re.fullmatch(r"(\d+)([mhd])", bucket)
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid bucket {bucket}, expected e.g. 15m, 1h or 1d")
+    count, unit = int(match.group(1)), BUCKET_UNITS[match.group(2)]
+    try:
+        width = datetime.timedelta(**{unit: count})
+    except OverflowError:
+        width = None
+    if width is None or width > BUCKET_MAX_WIDTH:
+        raise ValueError(f"Invalid bucket {bucket}, buckets are at most 366d wide")
+    return width
+
+
+def pick_rollup(width: datetime.timedelta) -> str | None:
+    # coarsest rollup whose buckets add up exactly to the requested width
+    for rollup, options in reversed(sensor_data_rollups.items()):
+        if width >= options["width"] and not width % options["width"]:
+            return rollup
+    return None
+
+
+def aggregates_query(
+    measurement: Measurement,
+    rollup: str,
+    node_id: str,
+    width: datetime.timedelta,
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> tuple[str, list]:
+    """
+    Re-buckets a rollup to the requested width. Averages are weighted by the
+    number of readings behind each rollup bucket.
+    """
+    aggregates = ",\n    ".join(
+        f"min({column}_min) AS {column}_min, max({column}_max) AS {column}_max, "
+        f"sum({column}_avg * {column}_count) / NULLIF(sum({column}_count), 0) AS {column}_avg, "
+        f"sum({column}_count)::bigint AS {column}_count"
+        for column in measurement.value_columns
+    )
+    query = f"""SELECT time_bucket($2::interval, bucket) AS time,
+    {aggregates}
+    FROM {measurement.rollup_view(rollup)}
+    WHERE node_id = $1 AND bucket >= $3 AND bucket < $4
+    GROUP BY 1
+    ORDER BY 1"""
+    return query, [node_id, width, start, end]
+
+
+def listing_conditions(filters: dict, args: list) -> list[str]:
+    # filters maps qualified column -> value, None values are left out
+    conditions = []
+    for column, value in filters.items():
+        if value is not None:
+            args.append(value)
+            conditions.append(f"{column} = ${len(args)}")
+    return conditions
+
+
+def nodes_query(filters: dict, after: int | None, limit: int) -> tuple[str, list]:
+    """
+    Keyset paginated node listing in id order, with location and custodian names.
+    Pages continue strictly after the id of the previous page's last node.
+    """
+    args = []
+    conditions = listing_conditions(filters, args)
+    if after is not None:
+        args.append(after)
+        conditions.append(f"n.id > ${len(args)}")
+    args.append(limit)
+
+    query = f"""SELECT n.id, n.node_id, n.latitude, n.longitude, n.commissioned,
+    n.date_registered, n.description, l.location, l.city, l.country,
+    c.name AS custodian
+    FROM node n
+    LEFT JOIN sensor_locations l ON l.id = n.location_id
+    LEFT JOIN custodian c ON c.id = n.custodian_id
+    {"WHERE " + " AND ".join(conditions) if conditions else ""}
+    ORDER BY n.id
+    LIMIT ${len(args)}"""
+    return query, args
+
+
+def locations_query(filters: dict, after: int | None, limit: int) -> tuple[str, list]:
+    """
+    Keyset paginated location listing in id order, like nodes_query.
+    """
+    args = []
+    conditions = listing_conditions(filters, args)
+    if after is not None:
+        args.append(after)
+        conditions.append(f"l.id > ${len(args)}")
+    args.append(limit)
+
+    query = f"""SELECT l.id, l.location, l.city, l.country
+    FROM sensor_locations l
+    {"WHERE " + " AND ".join(conditions) if conditions else ""}
+    ORDER BY l.id
+    LIMIT ${len(args)}"""
+    return query, args
+
+
+# One indexed lookup of the node by node_id, each join follows a primary key and the
+# tags come from the (location_id, location_tag) unique index. GROUP BY collapses the
+# tag rows, the other columns depend on the grouped primary keys.
+NODE_DETAIL_QUERY = """SELECT n.id, n.node_id, n.date_registered, n.date_updated,
+    n.commissioned, n.latitude, n.longitude, n.description,
+    l.id AS location_id, l.location, l.country, l.city,
+    array_agg(t.location_tag ORDER BY t.location_tag)
+        FILTER (WHERE t.location_tag IS NOT NULL) AS location_tags,
+    c.id AS custodian_id, c.name AS custodian_name, c.email AS custodian_email,
+    c.phone AS custodian_phone,
+    o.id AS organization_id, o.name AS organization_name, o.headquaters,
+    o.email AS organization_email,
+    p.id AS project_id, p.project_name, p.description AS project_description
+FROM node n
+LEFT JOIN sensor_locations l ON l.id = n.location_id
+LEFT JOIN locationtag t ON t.location_id = l.id
+LEFT JOIN custodian c ON c.id = n.custodian_id
+LEFT JOIN organization o ON o.id = c.affiliation
+LEFT JOIN project p ON p.id = c.project
+WHERE n.node_id = $1
+GROUP BY n.id, l.id, c.id, o.id, p.id"""
+
+
+def node_detail(row) -> NodeDetail:
+    """
+    Response model of a NODE_DETAIL_QUERY row, missing joined rows become None.
+    """
+    location = None
+    if row["location_id"] is not None:
+        location = LocationDetail(
+            id=row["location_id"],
+            location=row["location"],
+            country=row["country"],
+            city=row["city"],
+            tags=row["location_tags"] or [],
+        )
 
+    custodian = None
+    if row["custodian_id"] is not None:
+        organization = None
+        if row["organization_id"] is not None:
+            organization = OrganizationDetail(
+                id=row["organization_id"],
+                name=row["organization_name"],
+                headquaters=row["headquaters"],
+                email=row["organization_email"],
+            )
+        project = None
+        if row["project_id"] is not None:
+            project = ProjectDetail(
+                id=row["project_id"],
+                project_name=row["project_name"],
+                description=row["project_description"],
+            )
+        custodian = CustodianDetail(
+            id=row["custodian_id"],
+            name=row["custodian_name"],
+            email=row["custodian_email"],
+            phone=row["custodian_phone"],
+            organization=organization,
+            project=project,
+        )
 
-def delete_none_values(dic):
-    data = dict(dic)
-    keys_to_delete = []
-    # cannot delete dictionary while running a loop (RuntimeError: dictionary changed size during iteration)
-    for key, val in data.items():
-        if val is None:
-            keys_to_delete.append(key)
-    # delete items where value is None
-    for key in keys_to_delete:
-        del data[key]
-
-    return data
-
-
-def generate_insert_query(data: dict, table: str):
-    keys = data.keys()
-    vals = data.values()
-
-    columns = ""
-    for key in keys:
-        columns += key + ","
-    values = ""
-    for val in vals:
-        if (type(val).__name__) != "str":
-            val = str(val)
-            values += val + ","
-        else:
-            values += "'" + val + "',"
-
-    # Remove last comma which will result in an invalid SQL statement
-    columns = columns[:-1]
-    values = values[:-1]
-
-    insert_query = f"""INSERT INTO {table}({columns}) 
-    VALUES({values});
-        """
-    return insert_query
-
-
-async def insert_data(stmt):
-    res = await run_query(stmt)
-    print("Insert data response")
-    print(res)
-    return
+    return NodeDetail(
+        id=row["id"],
+        node_id=row["node_id"],
+        date_registered=row["date_registered"],
+        date_updated=row["date_updated"],
+        commissioned=row["commissioned"],
+        latitude=row["latitude"],
+        longitude=row["longitude"],
+        description=row["description"],
+        location=location,
+        custodian=custodian,
+    )
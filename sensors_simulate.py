@@ -1,25 +1,27 @@
-# 1. Create list dummy sensor nodes
-# 2. Create list of locations
-# 2. Create list of custodians
-# 2. Create list of organizations
-# 3. Create list of sensor types
-
-from random import randrange, uniform
-import requests, time
+"""
+Load generator simulating a network of sensor nodes against a running API.
+
+The simulated nodes are registered through /register-node/ by the admin given
+with --email and --password, who also obtains their device keys. Every node then takes a reading
+every --interval seconds and uploads its readings in batches of --batch-size
+(one /push-sensor-data request per reading when the batch size is 1, otherwise
+one /push-sensor-data/batch request). Which sensors a node carries is drawn from
+--mix. Nodes start at random offsets within the first interval so the load is
+spread evenly.
+
+Reports throughput, error rate and latency percentiles every --report-every
+seconds and once more at the end. Latencies are measured from the time a request
+was due, so time spent waiting for a free connection counts as well. Exits with
+status 1 when the error rate exceeds --max-error-rate.
+
+    python sensors_simulate.py --email <admin email> --password <password> --nodes 5000
+    python sensors_simulate.py --email <admin email> --password <password> --batch-size 10 --mix PM_data=1,Co2=0.3
+"""
+
+import argparse, asyncio, random, statistics, sys, time
+from collections import Counter
 from datetime import datetime, timezone
-
-API_ENDPOINT = "http://127.0.0.1:8000"
-REGISTER_NODE = API_ENDPOINT + "/register-node"
-POST_DATA = API_ENDPOINT + "/push-sensor-data"
-current_node = None
-current_node_name = None
-start_time = time.time()
-generate_data_duration = 30 * 60
-register_random_node_interval = 5 * 60
-send_data_interval = 30
-
-last_register_node_time = 0
-last_send_data_time = 0
+import httpx
 
 sensor_locations = {
     "Ruiru": {
@@ -48,236 +50,324 @@ sensor_locations = {
     },
 }
 
-projects = ["Clean Air Catalyst", "Respira", "Clean Air One"]
-
-partner_orgs = {
-    "Air Gradient": {
-        "name": "Air Gradient",
-        "headquaters": "Somewhere in Malaysia",
-        "email": "air@gradient.com",
-    },
-    "GIZ": {
-        "name": "GIZ",
-        "headquaters": "Somewhere in Nairobi",
-        "email": "giz@gmbh.de",
-    },
-    "UNEP": {
-        "name": "UNEP",
-        "headquaters": "Gigiri, Nairobi",
-        "email": "info@unep.org",
-    },
-    "WRI": {
-        "name": "WRI",
-        "headquaters": "westlands, nairobi",
-        "email": "hello@wri.org",
-    },
-}
-
 sensor_custodians = {
     "Alice": {
         "name": "Alice",
         "phone": "+1 (123) 456-7890",
         "email": "alice@example.com",
-        "affiliated_org": partner_orgs["Air Gradient"],
     },
     "Bob": {
         "name": "Bob",
         "phone": "+1 (987) 654-3210",
         "email": "bob@example.com",
-        "affiliated_org": partner_orgs["GIZ"],
     },
     "Charlie": {
         "name": "Charlie",
         "phone": "+1 (555) 555-5555",
         "email": "charlie@example.com",
-        "affiliated_org": partner_orgs["UNEP"],
-    },
-    "John": {
-        "name": "John",
-        "phone": "+1 (666) 666-666",
-        "email": "charlie@example.com",
-        "affiliated_org": None,
     },
 }
 
+projects = ["Clean Air Catalyst", "Respira", "Clean Air One"]
 
-sensor_types = ["PM_Sensor", "temp_humidity", "Co2", "So2"]
-sensors_brands = [
-    "Plant Tower",
-]
-
-nodes_list = [
-    {
-        "esp8266-12": {
-            "location": sensor_locations["Ruiru"],
-            "custodian": sensor_custodians["Alice"],
-            "project": projects[0],
-            "sensors": [sensor_types[0], sensor_types[1]],
-        }
-    },
-    {
-        "esp8266-34": {
-            "location": sensor_locations["Mathare"],
-            "custodian": sensor_custodians["Bob"],
-            "project": projects[1],
-            "sensors": [sensor_types[0], sensor_types[2]],
-        }
-    },
-    {
-        "esp8266-56": {
-            "location": sensor_locations["Langas"],
-            "custodian": sensor_custodians["Charlie"],
-            "project": projects[2],
-            "sensors": [sensor_types[0], sensor_types[1]],
-        }
-    },
-    {
-        "esp8266-78": {
-            "location": sensor_locations["Makongeni"],
-            "custodian": sensor_custodians["John"],
-            "project": None,
-            "sensors": [sensor_types[2], sensor_types[3]],
-        }
-    },
-]
-
-
-def register_random_node():
-
-    node_list_length = len(nodes_list)
-    random_index = randrange(node_list_length)
-    node = nodes_list[random_index]
-    global current_node
-    current_node = node
-    node_keys = node.keys()
-    # first_sensor_key = next(iter(sensors_keys))
-    first_node_key = list(node_keys)[0]
-    global current_node_name
-    current_node_name = first_node_key
-
-    data = {
-        "node_id": current_node_name,
-        "lat": node[first_node_key]["location"]["coords"]["lat"],
-        "long": node[first_node_key]["location"]["coords"]["long"],
-        "country": node[first_node_key]["location"]["country"],
-        "location": node[first_node_key]["location"]["name"],
-        "city": node[first_node_key]["location"]["city"],
-        "location_tag": "",
-        "custodian_name": node[first_node_key]["custodian"]["name"],
-        "custodian_email": node[first_node_key]["custodian"]["email"],
-        "custodian_phone": node[first_node_key]["custodian"]["phone"],
-        "software_version": "",
-        "project_name": node[first_node_key]["project"],
-    }
-
-    # # print(data)
-
-    response = requests.get(REGISTER_NODE, params=data)
-    print(response)
-
-    # send random data for this node
-    send_random_data()
-
-
-# register_random_node()
-
-
-def generate_dummy_data(lower_limit, upper_limit):
-    return round(uniform(lower_limit, upper_limit), 2)
-
-
-def send_random_data():
-    # Which sensor was randomly selected
-    # Get the sensor types
-    """sensor_data_payload_template = {
-        "timestamp": "UTC time",
-        "location": "Mathare",
-        "nodeid": "esp32-8232",
-        "sensordata": {
-            "PM_data": {
-                "values": {"PM1": 39.4, "PM2_5": 12.3, "PM10": 23.4},
-                "sensor_name": "PM55003",
-                "units": "ug/m3",
-            },
-        },
-        "temp_humidity": {
-            "values": {"temp": 25, "rel_hum": 60, "abs_hum": 45},
-            "sensor_name": "DHT22",
-            "units": "C",
-        },
-        "geo_data": {"long": 36.30503, "lat": -1.1244, "alt": 1466},
-    }"""
-    sensordata = {
-        "PM_data": {
-            "values": {
-                "PM1": None,
-                "PM2_5": None,
-                "PM10": None,
-            },
-            "sensor_name": "PMS5003",
+# measurement -> (sensor name, value ranges)
+sensor_types = {
+    "PM_data": ("PMS5003", {"PM1": (0, 200), "PM2_5": (0, 200), "PM10": (0, 300)}),
+    "temp_humidity": (
+        "DHT22",
+        {
+            "temperature": (0, 45),
+            "rel_hum": (0, 100),
+            "abs_hum": (0, 30),
+            "heat_index": (0, 50),
         },
-        "temp_humidity": {
-            "values": {"temperature": None, "rel_hum": None, "abs_hum": None},
-            "sensor_name": "DHT22",
-        },
-    }
-    # for each sensor type generate random values
-    for sensor in current_node[current_node_name]["sensors"]:
-        print(sensor)
-        match (sensor):  # Supported from Python 3.10
-            case "PM_Sensor":
-                sensordata["PM_data"]["values"]["PM1"] = generate_dummy_data(0, 200)
-                sensordata["PM_data"]["values"]["PM2_5"] = generate_dummy_data(0, 200)
-            case "temp_humidity":
-
-                sensordata["temp_humidity"]["values"]["temperature"] = (
-                    generate_dummy_data(0, 100)
-                )
-                sensordata["temp_humidity"]["values"]["rel_hum"] = generate_dummy_data(
-                    0, 100
-                )
-            case _:
-                print(f"{sensor} Sensor not evaluated in this case")
-
-    is_all_data_empty = all(
-        value == None for value in sensordata["PM_data"]["values"].values()
-    )  # now just checks only PM data
-
-    if is_all_data_empty:
-        print("Data contains empty values in all cases")
-        print("No need to send..")
-        return
-
-    print(sensordata)
-
-    # post to timescale DB
-    payload = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "node_id": current_node_name,
-        "location": current_node[current_node_name]["location"]["name"],
-        "sensordata": sensordata,
-    }
-
-    print(payload)
-
-    response = requests.post(POST_DATA, json=payload)
-    print("Insert sensor data response")
-    print(response.status_code)
-
+    ),
+    "Co2": ("SCD30", {"CO2": (350, 2000)}),
+    "So2": ("SGX-4SO2", {"SO2": (0, 20)}),
+}
 
-# iniatialize registration and data send for first time
-register_random_node()
-last_register_node_time = time.time()
-send_random_data()
-last_send_data_time = time.time()
 
-while time.time() - start_time < generate_data_duration:
-    if time.time() - last_register_node_time > register_random_node_interval:
-        register_random_node
-        last_register_node_time = time.time()
+def parse_mix(mix: str) -> dict[str, float]:
+    """
+    "PM_data=1,Co2=0.3" -> probability of a node carrying each sensor type
+    """
+    probabilities = {}
+    for item in mix.split(","):
+        name, _, probability = item.partition("=")
+        if name not in sensor_types:
+            raise argparse.ArgumentTypeError(
+                f"Unknown sensor type {name}, expected one of {', '.join(sensor_types)}"
+            )
+        probabilities[name] = float(probability or 1)
+    return probabilities
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.readings = 0
+        self.errors = Counter()
+        self.latencies: list[float] = []
+
+    def record(self, latency: float, readings: int, error: str | None):
+        self.requests += 1
+        self.latencies.append(latency)
+        if error is None:
+            self.readings += readings
+        else:
+            self.errors[error] += 1
+
+    def report(self, label: str) -> str:
+        elapsed = time.perf_counter() - self.started
+        errors = sum(self.errors.values())
+        line = (
+            f"{label}: {self.requests / elapsed:,.0f} req/s, "
+            f"{self.readings / elapsed:,.0f} readings/s, "
+            f"{errors / self.requests if self.requests else 0:.2%} errors"
+        )
+        if len(self.latencies) >= 2:
+            q = statistics.quantiles(self.latencies, n=100)
+            line += (
+                f", latency ms p50 {q[49] * 1000:.1f} p90 {q[89] * 1000:.1f}"
+                f" p99 {q[98] * 1000:.1f} max {max(self.latencies) * 1000:.1f}"
+            )
+        return line
+
+
+class Recorder:
+    """
+    Stats of the whole run and of the current reporting window.
+    """
+
+    def __init__(self):
+        self.total = Stats()
+        self.window = Stats()
+
+    def record(self, latency: float, readings: int, error: str | None):
+        self.total.record(latency, readings, error)
+        self.window.record(latency, readings, error)
+
+    def next_window(self) -> Stats:
+        window, self.window = self.window, Stats()
+        return window
+
+
+class Node:
+    def __init__(self, node_id: str, sensors: list[str]):
+        self.node_id = node_id
+        self.sensors = sensors
+        self.location = random.choice(list(sensor_locations.values()))
+        self.custodian = random.choice(list(sensor_custodians.values()))
+        self.project = random.choice(projects)
+        self.device_key: str | None = None
+
+    def registration(self) -> dict:
+        return {
+            "node_id": self.node_id,
+            "lat": self.location["coords"]["lat"],
+            "long": self.location["coords"]["long"],
+            "country": self.location["country"],
+            "location": self.location["name"],
+            "city": self.location["city"],
+            "location_tag": "",
+            "custodian_name": self.custodian["name"],
+            "custodian_email": self.custodian["email"],
+            "custodian_phone": self.custodian["phone"],
+            "software_version": "",
+            "project_name": self.project,
+        }
 
-    elif time.time() - last_send_data_time > send_data_interval:
-        send_random_data
+    def reading(self) -> dict:
+        sensordata = {}
+        for sensor in self.sensors:
+            sensor_name, ranges = sensor_types[sensor]
+            sensordata[sensor] = {
+                "values": {
+                    field: round(random.uniform(low, high), 2)
+                    for field, (low, high) in ranges.items()
+                },
+                "sensor_name": sensor_name,
+            }
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "node_id": self.node_id,
+            "location": self.location["name"],
+            "sensordata": sensordata,
+        }
 
 
-# register_random_node()
+def make_nodes(count: int, prefix: str, mix: dict[str, float]) -> list[Node]:
+    nodes = []
+    for i in range(count):
+        sensors = [name for name, p in mix.items() if random.random() < p]
+        # every node carries at least one sensor
+        sensors = sensors or [random.choice(list(mix))]
+        nodes.append(Node(f"{prefix}-{i}", sensors))
+    return nodes
+
+
+async def sign_in(client: httpx.AsyncClient, email: str, password: str) -> dict:
+    """
+    Authorization header of the admin who registers the nodes.
+    """
+    response = await client.post("/login", json={"email": email, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def register_nodes(
+    client: httpx.AsyncClient,
+    nodes: list[Node],
+    concurrency: int,
+    headers: dict,
+    register: bool,
+):
+    """
+    Registers the nodes (unless register is false) and gets each a device key.
+    Nodes that were already registered get an additional key.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def setup(node: Node):
+        nonlocal failed
+        async with semaphore:
+            try:
+                if register:
+                    response = await client.get(
+                        "/register-node/", params=node.registration(), headers=headers
+                    )
+                    response.raise_for_status()
+                    node.device_key = response.json()["device_key"]
+                if node.device_key is None:
+                    response = await client.post(
+                        f"/nodes/{node.node_id}/keys", headers=headers
+                    )
+                    response.raise_for_status()
+                    node.device_key = response.json()["device_key"]
+            except httpx.HTTPError:
+                failed += 1
+
+    await asyncio.gather(*(setup(node) for node in nodes))
+    return failed
+
+
+async def send(client, node: Node, batch: list[dict], due: float, recorder: Recorder):
+    error = None
+    headers = {"X-Device-Key": node.device_key}
+    try:
+        if len(batch) == 1:
+            response = await client.post(
+                "/push-sensor-data", json=batch[0], headers=headers
+            )
+        else:
+            response = await client.post(
+                "/push-sensor-data/batch", json=batch, headers=headers
+            )
+        if response.status_code >= 400:
+            error = str(response.status_code)
+        elif len(batch) > 1 and response.json().get("rejected"):
+            error = "rejected items"
+    except httpx.HTTPError as e:
+        error = type(e).__name__
+
+    recorder.record(time.perf_counter() - due, len(batch), error)
+
+
+async def simulate_node(client, node: Node, args, deadline: float, recorder: Recorder):
+    loop_start = time.perf_counter() + random.uniform(0, args.interval)
+    batch = []
+    tick = 0
+    while True:
+        due = loop_start + tick * args.interval
+        if due >= deadline:
+            break
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        batch.append(node.reading())
+        tick += 1
+        if len(batch) >= args.batch_size:
+            await send(client, node, batch, due, recorder)
+            batch = []
+
+
+async def main(args) -> int:
+    nodes = make_nodes(args.nodes, args.node_prefix, args.mix)
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=args.api, limits=limits, timeout=30
+    ) as client:
+        start = time.perf_counter()
+        headers = await sign_in(client, args.email, args.password)
+        failed = await register_nodes(
+            client, nodes, args.concurrency, headers, not args.skip_register
+        )
+        print(
+            f"set up {len(nodes) - failed}/{len(nodes)} nodes "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        nodes = [node for node in nodes if node.device_key is not None]
+
+        recorder = Recorder()
+        deadline = time.perf_counter() + args.duration
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(args.report_every)
+                elapsed = time.perf_counter() - recorder.total.started
+                print(recorder.next_window().report(f"{elapsed:>6.0f}s"))
+
+        reporting = asyncio.create_task(reporter())
+        try:
+            await asyncio.gather(
+                *(
+                    simulate_node(client, node, args, deadline, recorder)
+                    for node in nodes
+                )
+            )
+        finally:
+            reporting.cancel()
+
+    total = recorder.total
+    print(total.report("total"))
+    if total.errors:
+        print(
+            "errors: " + ", ".join(f"{k} x{v}" for k, v in total.errors.most_common())
+        )
+    error_rate = sum(total.errors.values()) / total.requests if total.requests else 1.0
+    return 1 if error_rate > args.max_error_rate else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--api", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", required=True, help="of an admin user")
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument(
+        "--interval", type=float, default=30, help="seconds between readings of a node"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=1, help="readings per upload of a node"
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default="PM_data=1,temp_humidity=0.5,Co2=0.2,So2=0.1",
+        help="probability of a node carrying each sensor type",
+    )
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=200, help="max connections")
+    parser.add_argument("--node-prefix", default="sim")
+    parser.add_argument(
+        "--skip-register",
+        action="store_true",
+        help="nodes are registered already, only issue device keys",
+    )
+    parser.add_argument("--report-every", type=float, default=5)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    sys.exit(asyncio.run(main(parser.parse_args())))
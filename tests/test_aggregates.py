@@ -0,0 +1,44 @@
+import datetime
+import pytest
+
+from sensors.utils import parse_bucket, pick_rollup
+
+
+@pytest.mark.parametrize(
+    "bucket, width",
+    [
+        ("15m", datetime.timedelta(minutes=15)),
+        ("1h", datetime.timedelta(hours=1)),
+        ("7d", datetime.timedelta(days=7)),
+        ("366d", datetime.timedelta(days=366)),
+    ],
+)
+def test_parse_bucket(bucket, width):
+    assert parse_bucket(bucket) == width
+
+
+@pytest.mark.parametrize(
+    "bucket", ["", "0m", "1w", "1.5h", "h", "367d", "99999999999d"]
+)
+def test_parse_bucket_rejects_invalid_and_huge_widths(bucket):
+    with pytest.raises(ValueError):
+        parse_bucket(bucket)
+
+
+@pytest.mark.parametrize(
+    "bucket, rollup",
+    [
+        ("1m", "1m"),
+        ("15m", "1m"),
+        ("1h", "1h"),
+        ("90m", "1m"),
+        ("6h", "1h"),
+        ("2d", "1d"),
+    ],
+)
+def test_pick_rollup_takes_the_coarsest_that_divides_the_width(bucket, rollup):
+    assert pick_rollup(parse_bucket(bucket)) == rollup
+
+
+def test_pick_rollup_without_a_fitting_rollup():
+    assert pick_rollup(datetime.timedelta(seconds=30)) is None
@@ -0,0 +1,69 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from sensors import router
+
+
+def payload(node_id: str = "node-1") -> dict:
+    return {
+        "timestamp": "2026-10-18T10:00:00+00:00",
+        "node_id": node_id,
+        "location": "Mathare",
+        "sensordata": {
+            "PM_data": {
+                "values": {"PM1": 1.0, "PM2_5": 2.0, "PM10": 3.0},
+                "sensor_name": "PMS5003",
+            }
+        },
+    }
+
+
+@pytest.fixture
+def writes(monkeypatch) -> list:
+    writes = []
+
+    async def copy_records(records_by_table, statements=()):
+        writes.append(records_by_table)
+
+    monkeypatch.setattr(router, "copy_records", copy_records)
+    return writes
+
+
+def post(device_key: str, body):
+    return TestClient(app).post(
+        "/push-sensor-data/batch",
+        content=body if isinstance(body, bytes) else json.dumps(body),
+        headers={"X-Device-Key": device_key},
+    )
+
+
+def test_batch_reports_every_item(device_key, writes):
+    response = post(device_key, [payload(), payload("node-2"), {"node_id": "node-1"}])
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()["items"]] == [
+        "accepted",
+        "rejected",
+        "rejected",
+    ]
+    assert len(writes) == 1
+
+
+def test_batch_with_too_many_items_is_refused(device_key, writes, monkeypatch):
+    monkeypatch.setattr(router, "INGEST_BATCH_MAX_ITEMS", 2)
+    response = post(device_key, [payload()] * 3)
+    assert response.status_code == 413
+    assert writes == []
+
+
+def test_batch_with_too_large_a_body_is_refused(device_key, writes, monkeypatch):
+    monkeypatch.setattr(router, "INGEST_BATCH_MAX_BYTES", 100)
+    response = post(device_key, [payload()])
+    assert response.status_code == 413
+    assert writes == []
+
+
+@pytest.mark.parametrize("body", [b"[{", b'{"node_id": "node-1"}'])
+def test_batch_must_be_a_json_array(device_key, writes, body):
+    assert post(device_key, body).status_code == 422
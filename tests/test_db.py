@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+
+import db
+
+
+class ExhaustedPool:
+    """
+    A pool without free connections, checkouts wait for as long as they are allowed.
+    """
+
+    def __init__(self):
+        self.timeouts = []
+
+    def acquire(self, timeout=None):
+        self.timeouts.append(timeout)
+        return self
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.timeouts[-1])
+        raise asyncio.TimeoutError
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def get_idle_size(self):
+        return 0
+
+    def get_size(self):
+        return 1
+
+    def get_max_size(self):
+        return 1
+
+
+def test_checkouts_of_an_exhausted_pool_time_out(monkeypatch):
+    pool = ExhaustedPool()
+    monkeypatch.setattr(db, "tsb_conn_pool", pool)
+    monkeypatch.setattr(db, "ASYNCPG_POOL_ACQUIRE_TIMEOUT_SECONDS", 0)
+
+    async def test():
+        async with db.acquire():
+            pass
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(test())
+    assert pool.timeouts == [0]
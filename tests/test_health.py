@@ -0,0 +1,19 @@
+from fastapi.testclient import TestClient
+
+from main import app
+from sensors import ingest
+from sensors.ingest import IngestBuffer
+
+
+def test_ingest_stats_before_the_buffer_is_started(monkeypatch):
+    monkeypatch.setattr(ingest, "ingest_buffer", None)
+    response = TestClient(app).get("/ingest/stats")
+    assert response.status_code == 503
+
+
+def test_ingest_stats(monkeypatch):
+    buffer = IngestBuffer(capacity=10, flush_rows=5, flush_interval_ms=0)
+    monkeypatch.setattr(ingest, "ingest_buffer", buffer)
+    response = TestClient(app).get("/ingest/stats")
+    assert response.status_code == 200
+    assert response.json()["capacity"] == 10
@@ -0,0 +1,175 @@
+import asyncio, asyncpg, datetime
+import pytest
+
+from sensors import ingest
+from sensors.ingest import IngestBuffer
+from sensors.measurements import measurements
+
+
+def rows(count: int, node_id: str = "node-1") -> list:
+    time = datetime.datetime(2026, 10, 18, 10, tzinfo=datetime.timezone.utc)
+    return [
+        (
+            measurements["PM_data"],
+            (time, node_id, float(i), 2.0, 3.0, "Mathare", "PMS5003"),
+        )
+        for i in range(count)
+    ]
+
+
+class Writes:
+    """
+    Batch sizes passed to copy_records, which fails with the queued errors first.
+    Tests await next_batch() instead of sleeping until the flusher got to a batch.
+    """
+
+    def __init__(self):
+        self.batches: list[int] = []
+        self.errors: list[Exception] = []
+        self._attempts: asyncio.Queue = asyncio.Queue()
+
+    async def copy_records(self, records_by_table, statements=()):
+        size = sum(len(records) for _, records in records_by_table.values())
+        self._attempts.put_nowait(size)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.batches.append(size)
+
+    async def next_batch(self) -> int:
+        # the timeout only keeps a broken flusher from hanging the test run
+        return await asyncio.wait_for(self._attempts.get(), timeout=5)
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    writes = Writes()
+    monkeypatch.setattr(ingest, "copy_records", writes.copy_records)
+    monkeypatch.setattr(ingest, "RETRY_FIRST_DELAY", 0)
+    return writes
+
+
+def run(test):
+    return asyncio.run(test())
+
+
+def test_pending_rows_are_flushed_in_batches_of_flush_rows(writes):
+    async def test():
+        # rows queued before the flusher first runs are all pending at once
+        buffer = IngestBuffer(capacity=100, flush_rows=10, flush_interval_ms=0)
+        buffer.start()
+        assert buffer.put(rows(25))
+        assert [await writes.next_batch() for _ in range(3)] == [10, 10, 5]
+        await buffer.stop(drain_timeout=5)
+        assert buffer.stats()["rows_flushed"] == 25
+
+    run(test)
+
+
+def test_a_partial_batch_waits_for_the_interval_or_more_rows(writes):
+    async def test():
+        buffer = IngestBuffer(capacity=100, flush_rows=10, flush_interval_ms=60_000)
+        buffer.start()
+        buffer.put(rows(3))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert writes.batches == []
+        # filling the batch flushes it without waiting for the interval
+        buffer.put(rows(7))
+        assert await writes.next_batch() == 10
+        await buffer.stop(drain_timeout=5)
+
+    run(test)
+
+
+def test_put_is_all_or_nothing(writes):
+    async def test():
+        buffer = IngestBuffer(capacity=5, flush_rows=10, flush_interval_ms=0)
+        assert not buffer.put(rows(1))  # not started
+        buffer.start()
+        assert buffer.put(rows(4))
+        assert not buffer.put(rows(2))
+        assert buffer.stats()["rows_rejected"] == 3
+        assert buffer.stats()["queue_depth"] == 4
+        await buffer.stop(drain_timeout=5)
+        assert not buffer.accepting
+
+    run(test)
+
+
+def test_stop_drains_pending_rows(writes):
+    async def test():
+        buffer = IngestBuffer(capacity=100, flush_rows=10, flush_interval_ms=0)
+        buffer.start()
+        buffer.put(rows(3))
+        await buffer.stop(drain_timeout=5)
+
+    run(test)
+    assert writes.batches == [3]
+
+
+def test_flusher_survives_a_failed_batch(writes):
+    writes.errors.append(TypeError("unexpected"))
+
+    async def test():
+        buffer = IngestBuffer(capacity=100, flush_rows=5, flush_interval_ms=0)
+        buffer.start()
+        buffer.put(rows(5))
+        buffer.put(rows(5))
+        assert [await writes.next_batch() for _ in range(2)] == [5, 5]
+        await buffer.stop(drain_timeout=5)
+        assert buffer.stats()["rows_failed"] == 5
+        assert buffer.stats()["rows_flushed"] == 5
+
+    run(test)
+    assert writes.batches == [5]
+
+
+def test_connection_errors_and_deadlocks_retry_the_whole_batch(writes, monkeypatch):
+    writes.errors.extend(
+        [
+            ConnectionResetError(),
+            asyncio.TimeoutError(),
+            asyncpg.DeadlockDetectedError("deadlock detected"),
+        ]
+    )
+
+    async def insert_data(measurement, record):
+        raise AssertionError("rows must not be retried one by one")
+
+    monkeypatch.setattr(ingest, "insert_data", insert_data)
+
+    async def test():
+        buffer = IngestBuffer(capacity=100, flush_rows=10, flush_interval_ms=10)
+        await buffer._flush(rows(4))
+        assert buffer.stats()["flush_retries"] == 3
+        assert buffer.stats()["rows_flushed"] == 4
+
+    run(test)
+    assert writes.batches == [4]
+
+
+def test_data_errors_fall_back_to_row_by_row_inserts(writes, monkeypatch):
+    writes.errors.append(asyncpg.ForeignKeyViolationError("unregistered node"))
+    inserted, upserts = [], []
+
+    async def insert_data(measurement, record):
+        if record[1] == "unknown":
+            raise asyncpg.ForeignKeyViolationError("unregistered node")
+        inserted.append(record)
+
+    async def run_query(query, *args):
+        upserts.append(args)
+
+    monkeypatch.setattr(ingest, "insert_data", insert_data)
+    monkeypatch.setattr(ingest, "run_query", run_query)
+
+    async def test():
+        buffer = IngestBuffer(capacity=100, flush_rows=10, flush_interval_ms=10)
+        await buffer._flush(rows(3) + rows(1, node_id="unknown"))
+        assert buffer.stats()["rows_flushed"] == 3
+        assert buffer.stats()["rows_failed"] == 1
+
+    run(test)
+    assert len(inserted) == 3
+    # node_latest only gets the inserted rows
+    assert [node_ids for _, node_ids, *_ in upserts] == [["node-1"]]
@@ -0,0 +1,60 @@
+import datetime, json
+import pytest
+
+from sensors.measurements import measurements
+from sensors.utils import latest_upsert, parse_bbox
+
+UTC = datetime.timezone.utc
+
+
+def test_parse_bbox():
+    assert parse_bbox("36.6,-1.45,37.1,-1.1") == (36.6, -1.45, 37.1, -1.1)
+    for bbox in ["1,2,3", "a,b,c,d", "37.1,-1.45,36.6,-1.1"]:
+        with pytest.raises(ValueError):
+            parse_bbox(bbox)
+
+
+def pm_record(time, node_id="node-1", pm1=1.0):
+    # (time, node_id, *values, location, sensor_name)
+    return (
+        measurements["PM_data"],
+        (time, node_id, pm1, 2.0, 3.0, "Mathare", "PMS5003"),
+    )
+
+
+def test_latest_upsert_keeps_the_newest_reading_per_node():
+    old = datetime.datetime(2026, 10, 18, 10, tzinfo=UTC)
+    new = old + datetime.timedelta(minutes=1)
+    query, args = latest_upsert(
+        [pm_record(new, pm1=2.0), pm_record(old), pm_record(old, node_id="node-2")]
+    )
+
+    assert "ON CONFLICT (measurement, node_id)" in query
+    rows = dict(zip(args[1], zip(args[0], args[2], args[5])))
+    assert rows["node-1"][:2] == ("PM_data", new)
+    assert json.loads(rows["node-1"][2]) == {"PM1": 2.0, "PM2_5": 2.0, "PM10": 3.0}
+    assert rows["node-2"][1] == old
+
+
+def test_latest_upsert_compares_naive_timestamps_as_utc():
+    aware = datetime.datetime(2026, 10, 18, 10, tzinfo=UTC)
+    naive = datetime.datetime(2026, 10, 18, 11)
+    _, args = latest_upsert([pm_record(aware), pm_record(naive)])
+    assert args[2] == [naive.replace(tzinfo=UTC)]
+
+
+def test_latest_upsert_without_records():
+    assert latest_upsert([]) is None
+
+
+def test_latest_upsert_orders_rows_by_measurement_and_node():
+    time = datetime.datetime(2026, 10, 18, 10, tzinfo=UTC)
+    records = [pm_record(time, node_id=node_id) for node_id in ["c", "a", "b"]]
+    records.append((measurements["Co2"], (time, "a", 400.0, "Mathare", "MH-Z19")))
+    _, args = latest_upsert(records)
+    assert list(zip(args[0], args[1])) == [
+        ("Co2", "a"),
+        ("PM_data", "a"),
+        ("PM_data", "b"),
+        ("PM_data", "c"),
+    ]
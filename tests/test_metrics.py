@@ -0,0 +1,98 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from main import app
+from sensors import ingest
+from sensors.spatial import IndexedNode, node_index
+
+
+class AcceptingBuffer:
+    def __init__(self):
+        self.records = []
+
+    def put(self, records) -> bool:
+        self.records.extend(records)
+        return True
+
+
+@pytest.fixture
+def client():
+    # without a with block the lifespan, and so the database, is never started
+    return TestClient(app)
+
+
+def scrape(client: TestClient, sample_name: str, **labels) -> float:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            if sample.name == sample_name and all(
+                sample.labels.get(label) == value for label, value in labels.items()
+            ):
+                return sample.value
+    return 0.0
+
+
+def test_requests_are_counted_by_route_template(client, monkeypatch):
+    monkeypatch.setattr(node_index, "_cells", {})
+    monkeypatch.setattr(node_index, "_nodes", {})
+    node_index.build([IndexedNode("node-1", -1.2864, 36.8172)])
+    labels = {"method": "GET", "route": "/nodes/near", "status": "200"}
+    before = scrape(client, "http_request_duration_seconds_count", **labels)
+
+    for lat in (-1.28, -1.29):
+        response = client.get("/nodes/near", params={"lat": lat, "long": 36.82})
+        assert response.status_code == 200
+        assert response.json()["nodes"][0]["node_id"] == "node-1"
+
+    after = scrape(client, "http_request_duration_seconds_count", **labels)
+    assert after - before == 2
+
+
+def test_unmatched_paths_share_one_route_label(client):
+    labels = {"method": "GET", "route": "unmatched", "status": "404"}
+    before = scrape(client, "http_request_duration_seconds_count", **labels)
+    client.get("/no-such-path/1")
+    client.get("/no-such-path/2")
+    assert scrape(client, "http_request_duration_seconds_count", **labels) - before == 2
+
+
+def test_ingest_stages_are_timed(client, device_key, monkeypatch):
+    buffer = AcceptingBuffer()
+    monkeypatch.setattr(ingest, "ingest_buffer", buffer)
+    payload = {
+        "timestamp": "2026-10-18T10:00:00+00:00",
+        "node_id": "node-1",
+        "location": "Mathare",
+        "sensordata": {
+            "PM_data": {
+                "values": {"PM1": 1.0, "PM2_5": 2.0, "PM10": 3.0},
+                "sensor_name": "PMS5003",
+            }
+        },
+    }
+    stage = "ingest_stage_duration_seconds_count"
+    validated = scrape(client, stage, stage="validate")
+    enqueued = scrape(client, stage, stage="enqueue")
+
+    response = client.post(
+        "/push-sensor-data",
+        content=json.dumps(payload),
+        headers={"X-Device-Key": device_key},
+    )
+    assert response.status_code == 202
+    assert len(buffer.records) == 1
+    assert scrape(client, stage, stage="validate") - validated == 1
+    assert scrape(client, stage, stage="enqueue") - enqueued == 1
+
+    # a naive timestamp fails validation and never reaches the buffer
+    response = client.post(
+        "/push-sensor-data",
+        content=json.dumps({**payload, "timestamp": "2026-10-18T10:00:00"}),
+        headers={"X-Device-Key": device_key},
+    )
+    assert response.status_code == 422
+    assert len(buffer.records) == 1
+    assert scrape(client, stage, stage="enqueue") - enqueued == 1
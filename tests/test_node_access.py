@@ -0,0 +1,85 @@
+import asyncio, uuid
+import pytest
+from fastapi import HTTPException
+
+from auth.models import User
+from sensors.models import Custodian, Node
+from sensors.router import authorize_custodian, authorize_node_access
+
+
+class FakeSession:
+    def __init__(self, *rows):
+        self.rows = {}
+        for row in rows:
+            key = row.uid if isinstance(row, User) else row.id
+            self.rows[type(row), key] = row
+
+    async def get(self, model, key):
+        return self.rows.get((model, key))
+
+
+def user(email="alice@example.com", **flags) -> User:
+    return User(
+        uid=uuid.uuid4(),
+        username=email.split("@")[0],
+        email=email,
+        hashed_password="",
+        **flags,
+    )
+
+
+def token(user: User) -> dict:
+    return {"user": {"email": user.email, "uid": str(user.uid)}, "refresh": False}
+
+
+CUSTODIAN = Custodian(id=1, name="Alice", email="Alice@Example.com")
+NODE = Node(id=1, node_id="node-1", custodian_id=1, latitude=-1.26, longitude=36.85)
+ORPHAN = Node(id=2, node_id="node-2", custodian_id=None, latitude=0, longitude=0)
+
+
+def authorized(user: User, node: Node) -> bool:
+    session = FakeSession(user, CUSTODIAN)
+    try:
+        asyncio.run(authorize_node_access(session, token(user), node))
+    except HTTPException as e:
+        assert e.status_code == 403
+        return False
+    return True
+
+
+def test_admins_manage_every_node():
+    admin = user("admin@example.com", is_admin=True)
+    assert authorized(admin, NODE)
+    assert authorized(admin, ORPHAN)
+
+
+def test_verified_custodians_manage_their_nodes():
+    custodian = user(is_verified=True)
+    assert authorized(custodian, NODE)
+    assert not authorized(custodian, ORPHAN)
+
+
+@pytest.mark.parametrize(
+    "other",
+    [
+        user(),  # the custodian's email, but never verified
+        user("mallory@example.com", is_verified=True),
+        user("admin@example.com", is_admin=True, is_active=False),
+    ],
+)
+def test_everyone_else_is_refused(other):
+    assert not authorized(other, NODE)
+
+
+def test_new_nodes_are_registered_by_their_custodian_or_an_admin():
+    custodian = user(is_verified=True)
+
+    async def register(as_user: User, custodian_email: str):
+        await authorize_custodian(FakeSession(as_user), token(as_user), custodian_email)
+
+    asyncio.run(register(custodian, "alice@example.com"))
+    asyncio.run(register(user("admin@example.com", is_admin=True), ""))
+    for email in ["bob@example.com", ""]:
+        with pytest.raises(HTTPException) as e:
+            asyncio.run(register(custodian, email))
+        assert e.value.status_code == 403
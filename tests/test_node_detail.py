@@ -0,0 +1,122 @@
+import asyncio, datetime, json, uuid
+import pytest
+
+from db import acquire, run_query
+from sensors.utils import NODE_DETAIL_QUERY
+
+pytestmark = pytest.mark.database
+
+SIZES = (1_000, 10_000)
+LOCATIONS = 20
+CUSTODIANS = 10
+
+
+def rows_read(plan: dict, relation: str) -> int:
+    """
+    Rows of relation read by the plan of EXPLAIN (ANALYZE, FORMAT JSON), including
+    those discarded by filters.
+    """
+    read = 0
+    if plan.get("Relation Name") == relation:
+        read = (
+            plan["Actual Rows"]
+            + plan.get("Rows Removed by Filter", 0)
+            + plan.get("Rows Removed by Index Recheck", 0)
+        ) * plan["Actual Loops"]
+    return read + sum(rows_read(child, relation) for child in plan.get("Plans", []))
+
+
+async def seed(conn, prefix: str, start: int, stop: int, locations, custodians):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    await conn.copy_records_to_table(
+        "node",
+        columns=[
+            "node_id",
+            "date_registered",
+            "commissioned",
+            "latitude",
+            "longitude",
+            "location_id",
+            "custodian_id",
+        ],
+        records=[
+            (
+                f"{prefix}-{i}",
+                now,
+                True,
+                -1.26,
+                36.85,
+                locations[i % len(locations)],
+                custodians[i % len(custodians)],
+            )
+            for i in range(start, stop)
+        ],
+    )
+    await conn.execute("ANALYZE node")
+
+
+def test_node_detail_reads_one_node_whatever_the_fleet_size(running_app):
+    prefix = f"detail-test-{uuid.uuid4().hex[:8]}"
+    pattern = f"{prefix}-%"
+    node_reads, details = {}, {}
+
+    async def test():
+        async with running_app() as client:
+            try:
+                async with acquire() as conn:
+                    locations = [
+                        await conn.fetchval(
+                            "INSERT INTO sensor_locations (country, location, city)"
+                            " VALUES ('Kenya', $1, 'Nairobi') RETURNING id",
+                            f"{prefix}-{i}",
+                        )
+                        for i in range(LOCATIONS)
+                    ]
+                    await conn.executemany(
+                        "INSERT INTO locationtag (location_id, location_tag)"
+                        " VALUES ($1, $2)",
+                        [(id, tag) for id in locations for tag in ("rooftop", "road")],
+                    )
+                    custodians = [
+                        await conn.fetchval(
+                            "INSERT INTO custodian (name, email)"
+                            " VALUES ($1, 'custodian@example.com') RETURNING id",
+                            f"{prefix}-{i}",
+                        )
+                        for i in range(CUSTODIANS)
+                    ]
+
+                    seeded = 0
+                    for size in SIZES:
+                        await seed(conn, prefix, seeded, size, locations, custodians)
+                        seeded = size
+                        node_id = f"{prefix}-{size // 2}"
+                        plan = await conn.fetchval(
+                            f"EXPLAIN (ANALYZE, FORMAT JSON) {NODE_DETAIL_QUERY}",
+                            node_id,
+                        )
+                        node_reads[size] = rows_read(
+                            json.loads(plan)[0]["Plan"], "node"
+                        )
+                        details[size] = (await client.get(f"/node/{node_id}")).json()
+            finally:
+                await run_query("DELETE FROM node WHERE node_id LIKE $1", pattern)
+                await run_query(
+                    "DELETE FROM locationtag WHERE location_id IN"
+                    " (SELECT id FROM sensor_locations WHERE location LIKE $1)",
+                    pattern,
+                )
+                await run_query(
+                    "DELETE FROM sensor_locations WHERE location LIKE $1", pattern
+                )
+                await run_query("DELETE FROM custodian WHERE name LIKE $1", pattern)
+
+    asyncio.run(test())
+
+    # looked up through the node_id index, not a scan of the fleet
+    assert node_reads == {size: 1 for size in SIZES}
+    for size, detail in details.items():
+        assert detail["node_id"] == f"{prefix}-{size // 2}"
+        assert detail["location"]["location"] == f"{prefix}-{size // 2 % LOCATIONS}"
+        assert detail["location"]["tags"] == ["road", "rooftop"]
+        assert detail["custodian"]["name"] == f"{prefix}-{size // 2 % CUSTODIANS}"
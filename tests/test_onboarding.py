@@ -0,0 +1,125 @@
+import asyncio, uuid
+import pytest
+
+from auth.utils import create_access_token
+from db import fetch_query, run_query
+
+pytestmark = pytest.mark.database
+
+REGISTRATIONS = 200
+# every fourth registration re-registers an already used node_id
+NODES = REGISTRATIONS // 4
+LOCATIONS = [
+    ("Kenya", "Ruiru", "Kiambu"),
+    ("Kenya", "Mathare", "Nairobi"),
+    ("Kenya", "Langas", "Nakuru"),
+]
+CUSTODIANS = [
+    ("Alice", "alice@example.com", "+1 (123) 456-7890"),
+    ("Bob", "bob@example.com", "+1 (987) 654-3210"),
+]
+
+
+def registration(prefix: str, i: int) -> dict:
+    country, location, city = LOCATIONS[i % len(LOCATIONS)]
+    name, email, phone = CUSTODIANS[i % len(CUSTODIANS)]
+    return {
+        "node_id": f"{prefix}-{i - i % 4}",
+        "lat": -1.26,
+        "long": 36.85,
+        "country": country,
+        "location": f"{prefix}-{location}",
+        "city": city,
+        "location_tag": "rooftop",
+        "custodian_name": f"{prefix}-{name}",
+        "custodian_email": email,
+        "custodian_phone": phone,
+    }
+
+
+async def count(query: str, prefix: str) -> int:
+    return (await fetch_query(query, f"{prefix}-%"))[0][0]
+
+
+async def delete_run(prefix: str, admin_uid: uuid.UUID):
+    pattern = f"{prefix}-%"
+    # device keys go with their nodes
+    await run_query("DELETE FROM node WHERE node_id LIKE $1", pattern)
+    await run_query(
+        "DELETE FROM locationtag WHERE location_id IN"
+        " (SELECT id FROM sensor_locations WHERE location LIKE $1)",
+        pattern,
+    )
+    await run_query("DELETE FROM sensor_locations WHERE location LIKE $1", pattern)
+    await run_query("DELETE FROM custodian WHERE name LIKE $1", pattern)
+    await run_query("DELETE FROM users WHERE uid = $1", admin_uid)
+
+
+def test_concurrent_registrations_create_no_duplicates(running_app):
+    prefix = f"onboard-test-{uuid.uuid4().hex[:8]}"
+    admin_uid = uuid.uuid4()
+    counts = {}
+
+    async def test():
+        async with running_app() as client:
+            await run_query(
+                "INSERT INTO users (uid, username, email, is_active, is_verified,"
+                " is_admin, created_at, hashed_password)"
+                " VALUES ($1, $2, $3, true, true, true, now(), '')",
+                admin_uid,
+                prefix,
+                f"{prefix}@example.com",
+            )
+            token = create_access_token(
+                {"email": f"{prefix}@example.com", "uid": str(admin_uid)}
+            )
+            headers = {"Authorization": f"Bearer {token}"}
+            try:
+                responses = await asyncio.gather(
+                    *(
+                        client.get(
+                            "/register-node/",
+                            params=registration(prefix, i),
+                            headers=headers,
+                        )
+                        for i in range(REGISTRATIONS)
+                    )
+                )
+                counts["node"] = await count(
+                    "SELECT count(*) FROM node WHERE node_id LIKE $1", prefix
+                )
+                counts["sensor_locations"] = await count(
+                    "SELECT count(*) FROM sensor_locations WHERE location LIKE $1",
+                    prefix,
+                )
+                counts["locationtag"] = await count(
+                    "SELECT count(*) FROM locationtag t"
+                    " JOIN sensor_locations l ON l.id = t.location_id"
+                    " WHERE l.location LIKE $1",
+                    prefix,
+                )
+                counts["custodian"] = await count(
+                    "SELECT count(*) FROM custodian WHERE name LIKE $1", prefix
+                )
+                counts["device_keys"] = await count(
+                    "SELECT count(*) FROM device_keys k JOIN node n ON n.id = k.node_id"
+                    " WHERE n.node_id LIKE $1",
+                    prefix,
+                )
+            finally:
+                await delete_run(prefix, admin_uid)
+        return responses
+
+    responses = asyncio.run(test())
+
+    assert [r.status_code for r in responses] == [200] * REGISTRATIONS
+    # only the registration that inserted a node got a key for it
+    keys = [r.json()["device_key"] for r in responses]
+    assert len([key for key in keys if key is not None]) == NODES
+    assert counts == {
+        "node": NODES,
+        "sensor_locations": len(LOCATIONS),
+        "locationtag": len(LOCATIONS),
+        "custodian": len(CUSTODIANS),
+        "device_keys": NODES,
+    }
@@ -0,0 +1,17 @@
+import datetime
+import pytest
+
+from sensors.utils import decode_cursor, encode_cursor
+
+UTC = datetime.timezone.utc
+
+
+def test_cursor_round_trip():
+    time = datetime.datetime(2026, 10, 18, 10, 0, 0, 123456, tzinfo=UTC)
+    assert decode_cursor(encode_cursor(time, "PMS5003")) == (time, "PMS5003")
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bnVsbA=="])
+def test_decode_cursor_rejects_foreign_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,100 @@
+import random
+import pytest
+
+from sensors.spatial import IndexedNode, NodeIndex, distance_km
+
+
+@pytest.fixture(scope="module")
+def nodes():
+    rng = random.Random(1)
+    spread = [
+        IndexedNode(f"world-{i}", rng.uniform(-90, 90), rng.uniform(-180, 180))
+        for i in range(3000)
+    ]
+    nairobi = [
+        IndexedNode(f"nairobi-{i}", rng.gauss(-1.28, 0.1), rng.gauss(36.82, 0.1))
+        for i in range(3000)
+    ]
+    edges = [
+        IndexedNode("east-edge", 0.0, 179.99),
+        IndexedNode("west-edge", 0.0, -179.99),
+        IndexedNode("north-pole", 89.99, 10.0),
+    ]
+    return spread + nairobi + edges
+
+
+@pytest.fixture(scope="module")
+def index(nodes):
+    index = NodeIndex(cell_degrees=0.1, refresh_interval=5)
+    index.build(nodes)
+    return index
+
+
+def test_distance_km():
+    assert distance_km(0, 0, 0, 0) == 0
+    # one degree of latitude
+    assert distance_km(0, 0, 1, 0) == pytest.approx(111.19, abs=0.01)
+    # across the antimeridian
+    assert distance_km(0, 179.5, 0, -179.5) == pytest.approx(111.19, abs=0.01)
+
+
+@pytest.mark.parametrize(
+    "lat, lon, radius_km",
+    [
+        (-1.28, 36.82, 5),
+        (0, 180, 10),
+        (0, -180, 3),
+        (89.9, -170, 50),
+        (10, 10, 3000),
+        (-1.28, 36.82, 20000),
+    ],
+)
+def test_near_matches_a_full_scan(nodes, index, lat, lon, radius_km):
+    found = index.near(lat, lon, radius_km, limit=len(nodes))
+    expected = {
+        node.node_id
+        for node in nodes
+        if distance_km(lat, lon, node.latitude, node.longitude) <= radius_km
+    }
+    assert {node.node_id for node, _ in found} == expected
+    distances = [distance for _, distance in found]
+    assert distances == sorted(distances)
+
+
+def test_near_limit_keeps_the_nearest(index):
+    found = index.near(-1.28, 36.82, 50, limit=10)
+    everything = index.near(-1.28, 36.82, 50, limit=10_000)
+    assert found == everything[:10]
+
+
+@pytest.mark.parametrize(
+    "bbox",
+    [
+        (36.6, -1.45, 37.1, -1.1),
+        (-180, -90, 180, 90),
+        (179.9, -1, 180, 1),
+        (-10, -10, 10, 10),
+    ],
+)
+def test_within_matches_a_full_scan(nodes, index, bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    expected = sorted(
+        node.node_id
+        for node in nodes
+        if min_lat <= node.latitude <= max_lat and min_lon <= node.longitude <= max_lon
+    )
+    assert [node.node_id for node in index.within(*bbox)] == expected
+
+
+def test_add_moves_a_registered_node():
+    index = NodeIndex(cell_degrees=0.1, refresh_interval=5)
+    index.build([IndexedNode("node-1", -1.28, 36.82)])
+    index.add(IndexedNode("node-1", 0.0, 0.0))
+    index.add(IndexedNode("node-2", 0.001, 0.001))
+
+    assert len(index) == 2
+    assert index.within(36.7, -1.3, 36.9, -1.2) == []
+    assert [node.node_id for node in index.within(-0.01, -0.01, 0.01, 0.01)] == [
+        "node-1",
+        "node-2",
+    ]